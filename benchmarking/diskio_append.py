@@ -0,0 +1,45 @@
+"""
+Time many small incremental GNUPlotFormat writes, as a Loop with a short
+write_period makes them, with and without DiskIO keeping the files open,
+and into a MemoryIO, which shows the cost of the formatter itself.
+"""
+import shutil
+import tempfile
+import time
+
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import new_data
+from qcodes.data.gnuplot_format import GNUPlotFormat
+from qcodes.data.io import DiskIO, MemoryIO
+
+
+def run(io, n=5000, arrays=4):
+    x = DataArray(name='x', shape=(n,), is_setpoint=True)
+    ys = [DataArray(name='y{}'.format(i), shape=(n,), set_arrays=(x,))
+          for i in range(arrays)]
+    data = new_data(arrays=[x] + ys, location='bench', io=io,
+                    formatter=GNUPlotFormat())
+    data.write_period = None
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        values = {y.array_id: i for y in ys}
+        values['x_set'] = i
+        data.store((i,), values)
+        data.write()
+    data.finalize()
+    return n / (time.perf_counter() - t0)
+
+
+def run_disk(max_open_files):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        return run(DiskIO(tmpdir, max_open_files=max_open_files))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    print('reopening files: {:,.0f} writes/s'.format(run_disk(0)))
+    print('pooled files: {:,.0f} writes/s'.format(run_disk(16)))
+    print('in memory: {:,.0f} writes/s'.format(run(MemoryIO())))
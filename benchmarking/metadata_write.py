@@ -0,0 +1,74 @@
+"""
+Time repeated metadata writes of a station-sized snapshot.
+
+Compares the old full rewrite (read back, merge, indented JSON) with the
+incremental GNUPlotFormat.write_metadata, for a snapshot of 50 instruments
+with 40 parameters each.
+"""
+import json
+import shutil
+import tempfile
+import time
+
+from qcodes.data.data_set import DataSet
+from qcodes.data.gnuplot_format import GNUPlotFormat
+from qcodes.data.io import DiskIO
+from qcodes.utils.helpers import deep_update, NumpyJSONEncoder
+
+
+def make_snapshot(n_instruments=50, n_parameters=40):
+    instruments = {}
+    for i in range(n_instruments):
+        parameters = {}
+        for j in range(n_parameters):
+            name = 'param{}'.format(j)
+            parameters[name] = {
+                '__class__': 'qcodes.instrument.parameter.StandardParameter',
+                'name': name, 'label': 'Parameter {}'.format(j),
+                'unit': 'V', 'value': i * 0.001 * j,
+                'ts': '2017-03-01 12:00:00', 'vals': '<Numbers>'}
+        instruments['instr{}'.format(i)] = {
+            '__class__': 'qcodes.instrument.mock.MockInstrument',
+            'name': 'instr{}'.format(i), 'functions': {},
+            'parameters': parameters}
+    return {'station': {'instruments': instruments, 'parameters': {},
+                        'components': {}}}
+
+
+def old_write_metadata(data_set, io_manager, location, formatter):
+    memory_metadata = data_set.metadata
+    data_set.metadata = {}
+    formatter.read_metadata(data_set)
+    deep_update(data_set.metadata, memory_metadata)
+
+    fn = io_manager.join(location, formatter.metadata_file)
+    with io_manager.open(fn, 'w', encoding='utf8') as snap_file:
+        json.dump(data_set.metadata, snap_file, sort_keys=True,
+                  indent=4, ensure_ascii=False, cls=NumpyJSONEncoder)
+
+
+def run(write, n=20):
+    base = tempfile.mkdtemp()
+    try:
+        io = DiskIO(base)
+        data = DataSet(location='bench', io=io, formatter=GNUPlotFormat())
+        data.metadata = make_snapshot()
+
+        t0 = time.perf_counter()
+        for i in range(n):
+            # one changed value per save, as when a loop progresses
+            data.metadata['loop'] = {'ts_end': str(i)}
+            write(data, io, 'bench')
+        return (time.perf_counter() - t0) / n
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    size = len(json.dumps(make_snapshot()))
+    formatter = GNUPlotFormat()
+    t_old = run(lambda d, io, loc: old_write_metadata(d, io, loc, formatter))
+    t_new = run(formatter.write_metadata)
+    print('snapshot: {:.0f} kB compact JSON'.format(size / 1000))
+    print('full rewrite: {:.1f} ms per save'.format(t_old * 1000))
+    print('incremental: {:.1f} ms per save'.format(t_new * 1000))
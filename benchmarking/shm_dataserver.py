@@ -0,0 +1,42 @@
+"""
+Time storing points into a live DataSet through a DataServer.
+
+Compares the default DataServer, which receives the stores in batched
+``store_data`` queries, with the SharedMemoryDataServer, where the measuring
+DataSet writes into shared memory. The time includes ``finalize``, so the
+DataServer has really received every point.
+"""
+import time
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import DataSet, DataMode
+from qcodes.data.manager import DataManager
+
+
+def run(shared_memory, n=20000):
+    dm = DataManager(shared_memory=shared_memory)
+    try:
+        x = DataArray(name='x', preset_data=np.arange(float(n)),
+                      is_setpoint=True)
+        y = DataArray(name='y', shape=(n,), set_arrays=(x,))
+        data = DataSet(location=False, mode=DataMode.PUSH_TO_SERVER,
+                       arrays=(x, y), data_manager=dm)
+
+        t0 = time.perf_counter()
+        for i in range(n):
+            data.store((i,), {'y': i * 0.5})
+        data.finalize()
+        elapsed = time.perf_counter() - t0
+
+        stored = dm.ask('get_data').arrays['y'].ndarray
+        assert stored[-1] == (n - 1) * 0.5
+        return n / elapsed
+    finally:
+        dm.close()
+
+
+if __name__ == '__main__':
+    print('DataServer: {:,.0f} points/s'.format(run(False)))
+    print('SharedMemoryDataServer: {:,.0f} points/s'.format(run(True)))
@@ -45,13 +45,17 @@ from qcodes.measure import Measure
 from qcodes.actions import Task, Wait, BreakIf
 
 from qcodes.data.manager import get_data_manager
-from qcodes.data.data_set import DataMode, DataSet, new_data, load_data
+from qcodes.data.data_set import (DataMode, DataSet, new_data, load_data,
+                                  load_many, stack_datasets)
 from qcodes.data.location import FormatLocation
 from qcodes.data.data_array import DataArray
 from qcodes.data.format import Formatter
 from qcodes.data.gnuplot_format import GNUPlotFormat
 from qcodes.data.hdf5_format import HDF5Format
-from qcodes.data.io import DiskIO
+from qcodes.data.chunked_format import ChunkedFormat
+from qcodes.data.io import DiskIO, MemoryIO
+from qcodes.data.reduce import reduce_array
+from qcodes.data.retention import RetentionPolicy
 
 from qcodes.instrument.base import Instrument
 from qcodes.instrument.ip import IPInstrument
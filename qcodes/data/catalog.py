@@ -0,0 +1,330 @@
+"""
+SQLite catalog of DataSets, for finding data without opening every file.
+
+Usage::
+
+    from qcodes.data import catalog
+    catalog.Catalog.default = catalog.Catalog(
+        'D:/data/catalog.db',
+        snapshot_keys=['station.instruments.mag.parameters.field.value'])
+
+    # index everything that already exists (new DataSets are indexed by
+    # DataSet.save_metadata and DataSet.finalize)
+    catalog.rebuild(DiskIO('D:/data'), workers=4)
+
+    catalog.find(location='data/2017-03-*', array_id='dmm_volt')
+
+or from a shell::
+
+    python -m qcodes.data.catalog rebuild D:/data/catalog.db D:/data
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import time
+
+from qcodes.utils.helpers import NumpyJSONEncoder
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    base_location TEXT NOT NULL,
+    location TEXT NOT NULL,
+    formatter TEXT,
+    ts_start TEXT,
+    ts_end TEXT,
+    ts_indexed REAL,
+    PRIMARY KEY (base_location, location)
+);
+CREATE TABLE IF NOT EXISTS arrays (
+    base_location TEXT NOT NULL,
+    location TEXT NOT NULL,
+    array_id TEXT NOT NULL,
+    name TEXT,
+    label TEXT,
+    unit TEXT,
+    shape TEXT,
+    is_setpoint INTEGER,
+    PRIMARY KEY (base_location, location, array_id)
+);
+CREATE TABLE IF NOT EXISTS snapshot_keys (
+    base_location TEXT NOT NULL,
+    location TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (base_location, location, key)
+);
+CREATE INDEX IF NOT EXISTS arrays_id ON arrays (array_id);
+CREATE INDEX IF NOT EXISTS snapshot_key_value ON snapshot_keys (key, value);
+"""
+
+
+class Catalog:
+
+    """
+    An index of DataSet locations, array descriptors and selected metadata.
+
+    The index lives in one SQLite file. Each operation opens its own
+    connection, so a Catalog can be used from any thread or process (eg the
+    ``DataServer``) that can see the file.
+
+    Set ``Catalog.default`` to have ``DataSet.save_metadata`` and
+    ``DataSet.finalize`` keep the catalog up to date, and to use the
+    module-level ``find`` and ``rebuild``.
+
+    Args:
+        path (str): path of the SQLite database file. Created if necessary.
+
+        snapshot_keys (Sequence[str], optional): dotted paths into the
+            DataSet metadata to index, such as
+            ``'station.instruments.gates.parameters.chan0.value'``.
+            Values are stored JSON-encoded.
+    """
+
+    default = None
+
+    def __init__(self, path, snapshot_keys=()):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.snapshot_keys = tuple(snapshot_keys)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # commits on success, rolls back on error
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, data_set):
+        """
+        Index (or re-index) one DataSet, using its in-memory metadata.
+
+        Args:
+            data_set (DataSet): the DataSet to index. In-memory only
+                DataSets (``location=False``) are ignored.
+        """
+        if data_set.location is False:
+            return
+        self._insert([_make_entry(data_set.io.base_location,
+                                  data_set.location, data_set.metadata,
+                                  self.snapshot_keys)])
+
+    def _insert(self, entries):
+        with self._connect() as conn:
+            for entry in entries:
+                key = (entry['base_location'], entry['location'])
+                for table in ('datasets', 'arrays', 'snapshot_keys'):
+                    conn.execute('DELETE FROM {} WHERE base_location=? AND '
+                                 'location=?'.format(table), key)
+
+                conn.execute(
+                    'INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?)',
+                    key + (entry['formatter'], entry['ts_start'],
+                           entry['ts_end'], entry['ts_indexed']))
+                conn.executemany(
+                    'INSERT INTO arrays VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [key + row for row in entry['arrays']])
+                conn.executemany(
+                    'INSERT INTO snapshot_keys VALUES (?, ?, ?, ?)',
+                    [key + row for row in entry['snapshot_keys']])
+
+    def remove(self, location, base_location=None):
+        """Drop one location from the catalog."""
+        with self._connect() as conn:
+            for table in ('datasets', 'arrays', 'snapshot_keys'):
+                query = 'DELETE FROM {} WHERE location=?'.format(table)
+                args = [location]
+                if base_location is not None:
+                    query += ' AND base_location=?'
+                    args.append(base_location)
+                conn.execute(query, args)
+
+    def find(self, location=None, array_id=None, since=None, until=None,
+             keys=None, base_location=None):
+        """
+        Find DataSet locations matching all the given criteria.
+
+        Args:
+            location (str, optional): a pattern for the location, with the
+                usual ``*`` and ``?`` wildcards.
+
+            array_id (str, optional): only DataSets containing this array.
+
+            since (str, optional): only DataSets whose loop started at or
+                after this timestamp ('YYYY-mm-dd HH:MM:SS', or a prefix).
+
+            until (str, optional): only DataSets whose loop started before
+                this timestamp.
+
+            keys (dict, optional): ``{dotted_key: value}`` for indexed
+                snapshot keys; the value must match exactly.
+
+            base_location (str, optional): only DataSets under this io
+                manager base location.
+
+        Returns:
+            List[str]: the matching locations, sorted.
+        """
+        query = 'SELECT DISTINCT d.location FROM datasets d'
+        where, args = [], []
+
+        if array_id is not None:
+            query += (' JOIN arrays a ON a.base_location=d.base_location '
+                      'AND a.location=d.location')
+            where.append('a.array_id=?')
+            args.append(array_id)
+
+        for i, (key, value) in enumerate((keys or {}).items()):
+            alias = 'k{}'.format(i)
+            query += (' JOIN snapshot_keys {0} ON {0}.base_location='
+                      'd.base_location AND {0}.location=d.location'
+                      ).format(alias)
+            where.append('{0}.key=? AND {0}.value=?'.format(alias))
+            args += [key, _encode(value)]
+
+        if location is not None:
+            where.append('d.location GLOB ?')
+            args.append(location)
+        if since is not None:
+            where.append('d.ts_start>=?')
+            args.append(since)
+        if until is not None:
+            where.append('d.ts_start<?')
+            args.append(until)
+        if base_location is not None:
+            where.append('d.base_location=?')
+            args.append(base_location)
+
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY d.location'
+
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(query, args)]
+
+    def rebuild(self, io, location='', workers=None,
+                metadata_file='snapshot.json'):
+        """
+        Scan existing data and (re-)index every DataSet found.
+
+        DataSets are recognized by their metadata file, as written by
+        ``GNUPlotFormat``. The metadata files are parsed in a process pool
+        if ``workers`` > 1.
+
+        Args:
+            io (io_manager): where to look, eg ``DiskIO('D:/data')``.
+
+            location (str, optional): only scan below this location.
+
+            workers (int, optional): number of worker processes. Default None
+                parses everything in this process.
+
+            metadata_file (str, optional): the metadata file name that marks
+                a DataSet directory. Default 'snapshot.json'.
+
+        Returns:
+            int: the number of DataSets indexed.
+        """
+        root = io.to_path(location)
+        args = []
+        for dirpath, _, filenames in os.walk(root):
+            if metadata_file in filenames:
+                args.append((io.base_location, io.to_location(dirpath),
+                             os.path.join(dirpath, metadata_file),
+                             self.snapshot_keys))
+
+        if workers and workers > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                entries = list(pool.map(_read_entry, *zip(*args),
+                                        chunksize=64))
+        else:
+            entries = [_read_entry(*a) for a in args]
+
+        self._insert(entries)
+        return len(entries)
+
+
+def _read_entry(base_location, location, path, snapshot_keys):
+    with open(path, 'r', encoding='utf8') as f:
+        metadata = json.load(f)
+    return _make_entry(base_location, location, metadata, snapshot_keys)
+
+
+def _make_entry(base_location, location, metadata, snapshot_keys):
+    loop = metadata.get('loop') or metadata.get('measurement') or {}
+
+    arrays = []
+    for array_id, snap in (metadata.get('arrays') or {}).items():
+        shape = snap.get('shape')
+        arrays.append((array_id, snap.get('name'), snap.get('label'),
+                       snap.get('unit'),
+                       json.dumps(list(shape)) if shape is not None else None,
+                       int(bool(snap.get('is_setpoint')))))
+
+    keys = []
+    for key in snapshot_keys:
+        value = metadata
+        try:
+            for part in key.split('.'):
+                value = value[part]
+        except (KeyError, TypeError, IndexError):
+            continue
+        keys.append((key, _encode(value)))
+
+    return {
+        'base_location': base_location,
+        'location': location,
+        'formatter': metadata.get('formatter'),
+        'ts_start': loop.get('ts_start'),
+        'ts_end': loop.get('ts_end'),
+        'ts_indexed': time.time(),
+        'arrays': arrays,
+        'snapshot_keys': keys
+    }
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, cls=NumpyJSONEncoder)
+
+
+def find(**kwargs):
+    """``Catalog.default.find``: see ``Catalog.find`` for arguments."""
+    return _default().find(**kwargs)
+
+
+def rebuild(io, **kwargs):
+    """``Catalog.default.rebuild``: see ``Catalog.rebuild`` for arguments."""
+    return _default().rebuild(io, **kwargs)
+
+
+def _default():
+    if Catalog.default is None:
+        raise RuntimeError('no default Catalog, set one with '
+                           'Catalog.default = Catalog(path)')
+    return Catalog.default
+
+
+if __name__ == '__main__':
+    import argparse
+    from .io import DiskIO
+
+    parser = argparse.ArgumentParser(
+        description='Maintain a qcodes DataSet catalog')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('db', help='path to the catalog database')
+    parser.add_argument('base', help='base data directory to scan')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--keys', nargs='*', default=(),
+                        help='dotted snapshot keys to index')
+    args = parser.parse_args()
+
+    n = Catalog(args.db, snapshot_keys=args.keys).rebuild(
+        DiskIO(args.base), workers=args.workers)
+    print('indexed {} DataSets'.format(n))
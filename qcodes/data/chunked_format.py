@@ -0,0 +1,487 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import product
+
+import numpy as np
+
+from qcodes.utils.helpers import NumpyJSONEncoder, deep_update
+from .data_array import DataArray
+from .format import Formatter
+
+
+class ChunkedFormat(Formatter):
+    """
+    Stores each ``DataArray`` as a grid of fixed-size chunks, one ``.npy``
+    file per chunk, in a directory per array::
+
+        location/snapshot.json
+        location/<array_id>/array.json
+        location/<array_id>/<i>.<j>.npy
+
+    ``array.json`` is the manifest of the array: its ``shape``, ``chunks``
+    (the chunk shape), declared ``dtype`` (null for plain float arrays),
+    setpoint array ids and labels. Chunk ``<i>.<j>`` holds
+    ``ndarray[i*ci:(i+1)*ci, j*cj:(j+1)*cj]``; chunks at the upper edges are
+    smaller. A chunk that was never written holds only
+    unmeasured points.
+
+    Arrays that only repeat their data over some outer dimensions (nested
+    setpoints, see ``DataArray.compact``) are stored once: ``broadcast`` in
+    the manifest is the number of repeated dimensions, and the chunks only
+    cover the others. They are written once and read back as broadcast
+    views again.
+
+    Appendable arrays (see ``DataArray.extend``) are chunked as if their
+    outer dimension were unbounded, so the chunk grid never changes as
+    they grow: new rows go into new chunks (or the last one), and the
+    ``shape`` in the manifest is updated after the chunks are written.
+
+    Each ``write`` saves only the chunks that overlap a ``modified_range``,
+    atomically (to a temporary file that is then renamed), so readers never
+    see half-written chunks. Different chunks are independent files, so
+    they can be written by parallel threads (see ``workers``) and even by
+    separate processes, as long as no two writers modify the same chunk:
+    for example several processes each measuring a chunk-aligned block of
+    rows of the same map. ``read_region`` reads only the chunks that
+    overlap the requested region.
+
+    Chunk files are accessed with ``io_manager.to_path``, so the io manager
+    must map locations to local files, as ``DiskIO`` does.
+
+    Args:
+        chunk_size (int, optional): the target number of values per chunk.
+            Chunks span whole inner dimensions as far as possible, then
+            split the outer dimensions. Default 65536.
+
+        workers (int, optional): number of threads writing chunks in
+            parallel. Default None, which writes them serially.
+
+        metadata_file (str, optional): name of the metadata file. Default
+            'snapshot.json'.
+    """
+
+    manifest_file = 'array.json'
+    chunk_extension = '.npy'
+
+    def __init__(self, chunk_size=65536, workers=None, metadata_file=None):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive', chunk_size)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.metadata_file = metadata_file or 'snapshot.json'
+
+    def chunk_shape(self, shape):
+        """
+        The chunk shape for an array of this shape.
+
+        Args:
+            shape (Tuple[int]): the array shape.
+
+        Returns:
+            Tuple[int]: the shape of a full chunk.
+        """
+        chunks = []
+        size = 1
+        for n in reversed(shape):
+            n_chunk = max(1, min(n, self.chunk_size // size))
+            chunks.append(n_chunk)
+            size *= n_chunk
+        return tuple(reversed(chunks))
+
+    def write(self, data_set, io_manager, location, write_metadata=True,
+              force_write=False):
+        """
+        Write the chunks of each array that have modifications.
+
+        Args:
+            data_set (DataSet): the data we're storing.
+            io_manager (io_manager): the base location to write to.
+            location (str): the file location within io_manager.
+            write_metadata (bool): also write the metadata. Default True.
+            force_write (bool): write every chunk, modified or not.
+                Default False.
+        """
+        jobs = []
+        grown = []
+        for array_id, array in data_set.arrays.items():
+            if array.ndarray is None:
+                continue
+            data, repeats = array.compact()
+            array_dir = io_manager.to_path(io_manager.join(location,
+                                                           array_id))
+            manifest_path = os.path.join(array_dir, self.manifest_file)
+            manifest = None
+            if not force_write and os.path.isfile(manifest_path):
+                manifest = self._read_manifest(manifest_path)
+                if manifest.get('broadcast', 0) != repeats:
+                    # saved with the other layout: start again
+                    manifest = None
+
+            if manifest is None:
+                manifest = self._make_manifest(array, repeats)
+                os.makedirs(array_dir, exist_ok=True)
+                self._save_atomic(
+                    manifest_path,
+                    partial(_write_text, json.dumps(manifest, indent=4)))
+                if force_write or repeats:
+                    chunk_range = (0, data.size - 1)
+                elif array.last_saved_index is not None:
+                    # saved somewhere else before: write all of that too
+                    last = array.last_saved_index
+                    if array.modified_range:
+                        last = max(last, array.modified_range[1])
+                    chunk_range = (0, last)
+                else:
+                    # chunks nobody has measured yet need no file
+                    chunk_range = array.modified_range
+            elif repeats:
+                # broadcast data can't change, so it's all saved already
+                chunk_range = None
+            else:
+                chunk_range = array.modified_range
+
+            if manifest['shape'] != list(array.shape):
+                # an appendable array grew
+                manifest['shape'] = list(array.shape)
+                grown.append((manifest_path, manifest))
+
+            if chunk_range is None:
+                continue
+
+            chunks = tuple(manifest['chunks'])
+            for index in self._chunks_in_range(data.shape, chunks,
+                                               *chunk_range):
+                jobs.append((data, array_dir, chunks, index))
+
+        if self.workers and self.workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # list() to raise any error from the threads here
+                list(pool.map(lambda job: self._write_chunk(*job), jobs))
+        else:
+            for job in jobs:
+                self._write_chunk(*job)
+
+        # only now, so readers never expect rows that aren't saved yet
+        for manifest_path, manifest in grown:
+            self._save_atomic(
+                manifest_path,
+                partial(_write_text, json.dumps(manifest, indent=4)))
+
+        for array in data_set.arrays.values():
+            if array.modified_range:
+                last = array.modified_range[1]
+                if array.last_saved_index is not None:
+                    last = max(last, array.last_saved_index)
+                array.mark_saved(last)
+
+        if write_metadata:
+            self.write_metadata(data_set, io_manager=io_manager,
+                                location=location)
+
+    def _make_manifest(self, array, repeats=0):
+        stored_shape = tuple(array.shape[repeats:])
+        if array.appendable and not repeats:
+            # as if the outer dimension were unbounded
+            stored_shape = (self.chunk_size,) + stored_shape[1:]
+        manifest = {
+            'array_id': array.array_id,
+            'name': array.name,
+            'label': array.label,
+            'unit': array.unit,
+            'is_setpoint': array.is_setpoint,
+            'set_arrays': [sa.array_id for sa in array.set_arrays],
+            'shape': list(array.shape),
+            'chunks': list(self.chunk_shape(stored_shape)),
+            'dtype': None
+        }
+        if repeats:
+            manifest['broadcast'] = repeats
+        if array.appendable:
+            manifest['appendable'] = True
+        dtype = array.declared_dtype
+        if dtype is not None:
+            manifest['dtype'] = dtype.str
+            if dtype.kind in 'iu':
+                manifest['fill_value'] = int(array.fill_value)
+        return manifest
+
+    @staticmethod
+    def _chunks_in_range(shape, chunks, start, stop):
+        """
+        Indices of all the chunks holding any of the flat indices
+        ``start`` to ``stop`` (inclusive), and possibly a few more.
+        """
+        first = np.unravel_index(start, shape)
+        last = np.unravel_index(stop, shape)
+        ranges = []
+        full = False
+        for lo, hi, c, n in zip(first, last, chunks, shape):
+            if full:
+                lo, hi = 0, n - 1
+            elif lo != hi:
+                # the flat range wraps this dimension, so every inner
+                # index may be included
+                full = True
+            ranges.append(range(lo // c, hi // c + 1))
+        return product(*ranges)
+
+    def _write_chunk(self, data, array_dir, chunks, index):
+        slices = tuple(slice(i * c, (i + 1) * c)
+                       for i, c in zip(index, chunks))
+        block = np.ascontiguousarray(data[slices])
+        path = os.path.join(array_dir, self._chunk_name(index))
+        self._save_atomic(path, partial(np.save, arr=block))
+
+    @staticmethod
+    def _save_atomic(path, save):
+        # unique per thread and process, so parallel writers never share it
+        tmp_path = '{}.{}-{}.tmp'.format(path, os.getpid(),
+                                         threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            save(f)
+        os.replace(tmp_path, path)
+
+    def _chunk_name(self, index):
+        return '.'.join(str(i) for i in index) + self.chunk_extension
+
+    def _parse_chunk_name(self, fn):
+        if not fn.endswith(self.chunk_extension):
+            return None
+        try:
+            return tuple(int(i) for i in
+                         fn[:-len(self.chunk_extension)].split('.'))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _read_manifest(path):
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+
+    def _manifests(self, data_set):
+        path = data_set.io.to_path(data_set.location)
+        if not os.path.isdir(path):
+            raise IOError('no data found at ' + data_set.location)
+
+        manifests = {}
+        for fn in sorted(os.listdir(path)):
+            manifest_path = os.path.join(path, fn, self.manifest_file)
+            if os.path.isfile(manifest_path):
+                manifest = self._read_manifest(manifest_path)
+                manifests[manifest['array_id']] = manifest
+        if not manifests:
+            raise IOError('no data found at ' + data_set.location)
+        return manifests
+
+    def read(self, data_set):
+        """
+        Read the metadata and all the arrays of a DataSet.
+
+        Args:
+            data_set (DataSet): the data to read into. Should already have
+                attributes ``io``, ``location`` and ``arrays``.
+        """
+        self.read_lazy(data_set)
+        for array in data_set.arrays.values():
+            # touching the data triggers the loader
+            array.ndarray
+
+    def read_lazy(self, data_set):
+        """
+        Read the metadata and the array manifests, deferring the data.
+
+        Each array gets its own loader, which reads all of its chunks the
+        first time the array is accessed.
+
+        Args:
+            data_set (DataSet): the data to read into, as in ``read``.
+        """
+        manifests = self._manifests(data_set)
+        self.read_metadata(data_set)
+
+        for array_id, manifest in manifests.items():
+            array = data_set.arrays.get(array_id)
+            if array is None:
+                array = DataArray(
+                    array_id=array_id, name=manifest['name'],
+                    label=manifest['label'], unit=manifest['unit'],
+                    is_setpoint=manifest['is_setpoint'],
+                    shape=tuple(manifest['shape']),
+                    dtype=manifest['dtype'],
+                    fill_value=manifest.get('fill_value'),
+                    snapshot=data_set.get_array_metadata(array_id),
+                    appendable=manifest.get('appendable', False))
+                data_set.add_array(array)
+            elif array.appendable and list(array.shape) != manifest['shape']:
+                # it grew since we last read it
+                array.ndarray = None
+                array.shape = tuple(manifest['shape'])
+            array.set_loader(partial(self._load_array, data_set, array,
+                                     manifest))
+
+        for array_id, manifest in manifests.items():
+            array = data_set.arrays[array_id]
+            if not array.set_arrays:
+                array.set_arrays = tuple(data_set.arrays[sa_id]
+                                         for sa_id in manifest['set_arrays'])
+
+    def _load_array(self, data_set, array, manifest):
+        repeats = manifest.get('broadcast', 0)
+        if repeats:
+            data = np.full(array.shape[repeats:], array.fill_value,
+                           dtype=array._empty_dtype())
+        else:
+            array.init_data()
+            array.clear()
+            data = array.ndarray
+        array_dir = data_set.io.to_path(
+            data_set.io.join(data_set.location, manifest['array_id']))
+        chunks = tuple(manifest['chunks'])
+
+        for fn in os.listdir(array_dir):
+            index = self._parse_chunk_name(fn)
+            if index is None or len(index) != len(chunks):
+                continue
+            slices = tuple(slice(i * c, (i + 1) * c)
+                           for i, c in zip(index, chunks))
+            target = data[slices]
+            if not target.size:
+                # rows saved after the manifest we read
+                continue
+            block = np.load(os.path.join(array_dir, fn))
+            target[...] = block[tuple(slice(0, n) for n in target.shape)]
+
+        if repeats:
+            array.init_data(np.broadcast_to(data, array.shape))
+        measured = np.flatnonzero(array.measured_mask())
+        array.modified_range = None
+        array.last_saved_index = (int(measured[-1]) if measured.size
+                                  else None)
+
+    def read_region(self, data_set, array_id, region):
+        """
+        Read part of one array, loading only the chunks it overlaps.
+
+        The DataSet's own arrays are neither needed nor changed.
+
+        Args:
+            data_set (DataSet): supplies ``io`` and ``location``.
+
+            array_id (str): the array to read.
+
+            region (Tuple[slice]): one slice (or int) per dimension, as in
+                numpy indexing. Missing trailing dimensions are read whole.
+
+        Returns:
+            numpy.ndarray: the data in the region. For broadcast arrays,
+                a read-only view repeating it.
+        """
+        array_dir = data_set.io.to_path(
+            data_set.io.join(data_set.location, array_id))
+        manifest = self._read_manifest(os.path.join(array_dir,
+                                                    self.manifest_file))
+        shape = tuple(manifest['shape'])
+        chunks = tuple(manifest['chunks'])
+        dtype = np.dtype(manifest['dtype'] or float)
+        if not isinstance(region, tuple):
+            region = (region,)
+        region = region + (slice(None),) * (len(shape) - len(region))
+
+        # only the stored dimensions of broadcast arrays are read
+        repeats = manifest.get('broadcast', 0)
+        outer = []
+        for index, n in zip(region[:repeats], shape):
+            if isinstance(index, slice):
+                outer.append(len(range(n)[index]))
+            else:
+                # an int drops the dimension, once we know it's in range
+                range(n)[index]
+        region, shape = region[repeats:], shape[repeats:]
+
+        # the bounding box of the region, then the chunks it overlaps
+        box, pick = [], []
+        for index, n in zip(region, shape):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(n)
+                r = range(start, stop, step)
+                if not len(r):
+                    box.append((0, 0))
+                    pick.append(slice(0, 0))
+                    continue
+                lo, hi = min(r[0], r[-1]), max(r[0], r[-1]) + 1
+                box.append((lo, hi))
+                # the same slice, relative to the box
+                rel_stop = r.stop - lo
+                pick.append(slice(r.start - lo,
+                                  rel_stop if rel_stop >= 0 else None, step))
+            else:
+                index = range(n)[index]
+                box.append((index, index + 1))
+                pick.append(0)
+
+        fill = manifest.get('fill_value')
+        out = np.full([hi - lo for lo, hi in box],
+                      np.nan if fill is None else fill, dtype=dtype)
+
+        chunk_ranges = [range(lo // c, (hi - 1) // c + 1) if hi > lo
+                        else range(0)
+                        for (lo, hi), c in zip(box, chunks)]
+        for index in product(*chunk_ranges):
+            path = os.path.join(array_dir, self._chunk_name(index))
+            if not os.path.isfile(path):
+                continue
+            chunk = np.load(path, mmap_mode='r')
+            src, dst = [], []
+            for i, c, (lo, hi) in zip(index, chunks, box):
+                c_lo = i * c
+                a, b = max(lo, c_lo), min(hi, c_lo + c)
+                src.append(slice(a - c_lo, b - c_lo))
+                dst.append(slice(a - lo, b - lo))
+            out[tuple(dst)] = chunk[tuple(src)]
+
+        out = out[tuple(pick)]
+        if repeats:
+            return np.broadcast_to(out, tuple(outer) + out.shape)
+        return out
+
+    def write_metadata(self, data_set, io_manager, location, read_first=True):
+        """
+        Write all metadata in this DataSet to storage.
+
+        Args:
+            data_set (DataSet): the data we're storing.
+
+            io_manager (io_manager): the base location to write to.
+
+            location (str): the file location within io_manager.
+
+            read_first (bool, optional): read previously saved metadata
+                before writing, and keep anything in it that is not in the
+                current metadata. Default True.
+        """
+        fn = io_manager.join(location, self.metadata_file)
+        if read_first:
+            memory_metadata = data_set.metadata
+            data_set.metadata = {}
+            self.read_metadata(data_set)
+            deep_update(data_set.metadata, memory_metadata)
+
+        text = json.dumps(data_set.metadata, sort_keys=True,
+                          ensure_ascii=False, cls=NumpyJSONEncoder)
+        path = io_manager.to_path(fn)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._save_atomic(path, partial(_write_text, text))
+
+    def read_metadata(self, data_set):
+        path = data_set.io.to_path(
+            data_set.io.join(data_set.location, self.metadata_file))
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf8') as f:
+                data_set.metadata.update(json.load(f))
+
+
+def _write_text(text, f):
+    f.write(text.encode('utf8'))
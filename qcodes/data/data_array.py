@@ -1,7 +1,10 @@
 import numpy as np
 import collections
+import os
 
 from qcodes.utils.helpers import DelegateAttributes, full_class, warn_units
+from .pyramid import SummaryPyramid, DecimatedView, _per_dim
+from .spill import memory_budget
 
 
 class DataArray(DelegateAttributes):
@@ -20,7 +23,9 @@ class DataArray(DelegateAttributes):
     .nest for each dimension.
 
     If preset_data is provided it is used to initialize the data, and the array
-    can still be nested around it (making many copies of the data).
+    can still be nested around it. The data is stored once, and the nested
+    array is a read-only view repeating it (see ``compact``), until something
+    writes into it.
     Otherwise it is an error to nest an array that already has data.
 
     Once the array is initialized, a DataArray acts a lot like a numpy array,
@@ -79,8 +84,38 @@ class DataArray(DelegateAttributes):
             array, if already known (for example if this is a setpoint
             array). ``shape`` will be inferred from this array instead of
             from the ``shape`` argument.
+
+        dtype (Optional[numpy.dtype]): The type of the stored values, such as
+            ``'int16'`` or ``'float32'`` for compact digitizer data, or
+            ``'complex128'`` for raw IQ data. Float and complex arrays mark
+            unmeasured points with NaN, integer arrays with
+            ``fill_value``. If omitted, taken from ``snapshot`` if it has a
+            ``dtype``, otherwise the data is stored as float64.
+
+        fill_value (Optional[int]): Only for integer ``dtype``, the value
+            that marks unmeasured points. Default the smallest value of a
+            signed type, the largest value of an unsigned one.
+
+        appendable (bool): True if the outermost dimension has no fixed
+            length, like the time axis of a monitor log, so ``extend`` can
+            grow it. ``DataSet.store`` does that for any outer index past
+            the end. If omitted, taken from ``snapshot``. Default False.
     """
 
+    # class-level defaults, so the ndarray property works even before
+    # __init__ (or unpickling) has filled in the instance attributes
+    _ndarray = None
+    _loader = None
+    _pyramids = None
+    _shared_path = None
+    _spill_path = None
+    _buffer = None
+    _dtype = None
+    _fill_value = None
+
+    # kinds of numpy dtype we can mark unmeasured points in
+    SUPPORTED_KINDS = 'fciu'
+
     # attributes of self to include in the snapshot
     SNAP_ATTRS = (
         'array_id',
@@ -106,12 +141,16 @@ class DataArray(DelegateAttributes):
         'set_arrays',
         'shape',
         'array_id',
-        'action_indices')
+        'action_indices',
+        'dtype',
+        'fill_value',
+        'appendable')
 
     def __init__(self, parameter=None, name=None, full_name=None, label=None,
                  snapshot=None, array_id=None, set_arrays=(), shape=None,
                  action_indices=(), unit=None, units=None, is_setpoint=False,
-                 preset_data=None):
+                 preset_data=None, dtype=None, fill_value=None,
+                 appendable=False):
         self.name = name
         self.full_name = full_name or name
         self.label = label
@@ -127,6 +166,7 @@ class DataArray(DelegateAttributes):
         self.set_arrays = set_arrays
 
         self._preset = False
+        self.appendable = appendable
 
         # store a reference up to the containing DataSet
         # this also lets us make sure a DataArray is only in one DataSet
@@ -135,7 +175,8 @@ class DataArray(DelegateAttributes):
         self.last_saved_index = None
         self.modified_range = None
 
-        self.ndarray = None
+        self._ndarray = None
+        self._loader = None
         if snapshot is None:
             snapshot = {}
         self._snapshot_input = {}
@@ -165,11 +206,156 @@ class DataArray(DelegateAttributes):
         if not self.label:
             self.label = self.name
 
+        if not appendable:
+            self.appendable = bool(snapshot.get('appendable', False))
+        if dtype is None:
+            dtype = snapshot.get('dtype')
+        if fill_value is None:
+            fill_value = snapshot.get('fill_value')
+        if dtype is not None:
+            self._dtype = np.dtype(dtype)
+            if self._dtype.kind not in self.SUPPORTED_KINDS:
+                raise ValueError('unsupported DataArray dtype', self._dtype)
+            if fill_value is not None:
+                if self._dtype.kind not in 'iu':
+                    raise ValueError('fill_value is only for integer dtypes')
+                self._fill_value = self._dtype.type(fill_value)
+
         if preset_data is not None:
             self.init_data(preset_data)
         elif shape is None:
             self.shape = ()
 
+    @property
+    def ndarray(self):
+        """
+        The numpy array holding the data.
+
+        If a loader was attached with ``set_loader`` (as in a lazily loaded
+        ``DataSet``), the data is read from storage the first time this is
+        accessed.
+        """
+        if self._loader is not None:
+            loader = self._loader
+            self._loader = None
+            loader()
+        return self._ndarray
+
+    @ndarray.setter
+    def ndarray(self, value):
+        self._ndarray = value
+        self._pyramids = None
+
+    def share(self, path):
+        """
+        Move the data into a memory-mapped ``.npy`` file, so other processes
+        can map the same memory.
+
+        If ``path`` exists (another process already shared this array), it
+        is mapped. Otherwise it is created from the current data. When this
+        array is pickled, only ``path`` is sent and the receiver maps it too.
+
+        Args:
+            path (str): the file, normally on a memory-backed file system.
+        """
+        if os.path.exists(path):
+            data = np.load(path, mmap_mode='r+')
+            if data.shape != tuple(self.shape):
+                raise ValueError('shared data has the wrong shape',
+                                 data.shape, self.shape)
+        else:
+            self.init_data()
+            data = np.lib.format.open_memmap(
+                path, mode='w+', dtype=self.ndarray.dtype,
+                shape=self.ndarray.shape)
+            data[...] = self.ndarray
+        # a plain ndarray view indexes faster than the memmap itself
+        self.ndarray = data.view(np.ndarray)
+        self._shared_path = path
+        self._set_index_bounds()
+
+    def unshare(self):
+        """Copy shared data back to private memory."""
+        if self._shared_path is not None:
+            self.ndarray = np.array(self._ndarray)
+            self._shared_path = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # summaries are cheap to rebuild and can be large
+        state.pop('_pyramids', None)
+        # the receiver gets the data itself, not our temporary file, nor
+        # the spare rows of an appendable array
+        state.pop('_spill_path', None)
+        state.pop('_buffer', None)
+        if self._shared_path is not None:
+            state.pop('_ndarray', None)
+        elif self._ndarray is not None:
+            data, repeats = _compact(self._ndarray)
+            if repeats:
+                state['_ndarray'] = data
+                state['_broadcast_shape'] = self._ndarray.shape
+        return state
+
+    def __setstate__(self, state):
+        broadcast_shape = state.pop('_broadcast_shape', None)
+        self.__dict__.update(state)
+        if broadcast_shape is not None:
+            self._ndarray = np.broadcast_to(self._ndarray, broadcast_shape)
+        if self._shared_path is not None:
+            if os.path.exists(self._shared_path):
+                self._ndarray = np.load(self._shared_path,
+                                        mmap_mode='r+').view(np.ndarray)
+            else:
+                # the measurement finished and its memory was released
+                self._shared_path = None
+
+    def set_loader(self, loader):
+        """
+        Defer reading the data of this array until it is first needed.
+
+        Args:
+            loader (Optional[callable]): called with no arguments the first
+                time ``ndarray`` is accessed. It must fill ``ndarray`` (and
+                may fill other arrays too, in which case it should detach
+                their loaders with ``set_loader(None)``). Use None to
+                remove a pending loader.
+        """
+        self._loader = loader
+
+    @property
+    def declared_dtype(self):
+        """The ``dtype`` given to the constructor, or None."""
+        return self._dtype
+
+    @property
+    def fill_value(self):
+        """The value of unmeasured points: NaN unless ``dtype`` is integer."""
+        dtype = self._dtype
+        if dtype is None or dtype.kind not in 'iu':
+            return float('nan')
+        if self._fill_value is not None:
+            return self._fill_value
+        info = np.iinfo(dtype)
+        return dtype.type(info.min if dtype.kind == 'i' else info.max)
+
+    def measured_mask(self):
+        """
+        Which points have been measured.
+
+        Returns:
+            np.ndarray: boolean, False where the data holds ``fill_value``.
+        """
+        data = self.ndarray
+        if self._dtype is not None and self._dtype.kind in 'iu':
+            return data != self.fill_value
+        return ~np.isnan(data)
+
+    @property
+    def is_loaded(self):
+        """False if this array still has a pending loader."""
+        return self._loader is None
+
     @property
     def data_set(self):
         """
@@ -230,11 +416,11 @@ class DataArray(DelegateAttributes):
         self.set_arrays = (set_array, ) + self.set_arrays
 
         if self._preset:
-            inner_data = self.ndarray
-            self.ndarray = np.ndarray(self.shape)
-            # existing preset array copied to every index of the nested array.
-            for i in range(size):
-                self.ndarray[i] = inner_data
+            # the preset data is kept once, and repeated over the new
+            # dimension by a read-only view
+            inner_data, _ = self.compact()
+            inner_data = np.array(inner_data, dtype=self._empty_dtype())
+            self.ndarray = np.broadcast_to(inner_data, self.shape)
 
             # update modified_range so the entire array still looks modified
             self.modified_range = (0, self.ndarray.size - 1)
@@ -275,6 +461,9 @@ class DataArray(DelegateAttributes):
                 else:
                     data = np.array(data)
 
+            if self._dtype is not None and data.dtype != self._dtype:
+                data = data.astype(self._dtype)
+
             if self.shape is None:
                 self.shape = data.shape
             elif data.shape != self.shape:
@@ -293,22 +482,133 @@ class DataArray(DelegateAttributes):
                                  'but its shape doesn\'t match self.shape')
             return
         else:
-            self.ndarray = np.ndarray(self.shape)
+            # arrays over the memory budget get a temporary file
+            self.ndarray, self._spill_path = memory_budget.allocate(
+                self.shape, self._empty_dtype())
             self.clear()
         self._set_index_bounds()
 
+    def extend(self, length):
+        """
+        Grow the outermost dimension of an appendable array to ``length``.
+
+        The rows live in a larger buffer, which doubles in size whenever it
+        fills up, and ``ndarray`` is a view of the first ``length`` of them,
+        so growing one row at a time costs amortized O(1). New rows hold
+        ``fill_value``. Broadcast arrays (see ``compact``) stay broadcast.
+
+        Flat indices don't change as the outer dimension grows, so
+        ``modified_range`` and ``last_saved_index`` stay valid, and
+        formatters can append to what they saved before.
+
+        Args:
+            length (int): the new length. Nothing happens if the array is
+                already at least this long.
+
+        Raises:
+            RuntimeError: if the array is not ``appendable``.
+        """
+        if not self.appendable:
+            raise RuntimeError('only appendable arrays can be extended',
+                               self.array_id)
+        self.init_data()
+        length = int(length)
+        old_length = self.shape[0]
+        if length <= old_length:
+            return
+        shape = (length,) + tuple(self.shape[1:])
+
+        data, repeats = self.compact()
+        if repeats:
+            self.ndarray = np.broadcast_to(data, shape)
+            # the new rows already have their (repeated) values
+            row_size = data.size * int(np.prod(shape[1:repeats]))
+            self._update_modified_range(old_length * row_size,
+                                        length * row_size - 1)
+        else:
+            buffer = self._buffer
+            if (buffer is None or self._ndarray.base is not buffer or
+                    len(buffer) < length):
+                capacity = max(length, 2 * old_length)
+                buffer, self._spill_path = memory_budget.allocate(
+                    (capacity,) + shape[1:], self._ndarray.dtype)
+                buffer[:old_length] = self._ndarray
+                buffer[old_length:] = self.fill_value
+                self._buffer = buffer
+            self.ndarray = buffer[:length]
+
+        self.shape = shape
+        self._set_index_bounds()
+
+    def replace_data(self, data):
+        """
+        Replace all the data of an appendable array, with any length of
+        its outermost dimension.
+
+        Unlike ``extend``, rows can be removed or merged (as by a
+        ``RetentionPolicy``), so flat indices change and nothing saved
+        before is valid anymore: the whole array is marked modified and
+        unsaved, and must be written with ``DataSet.rewrite``.
+
+        Args:
+            data (numpy.ndarray): the new data, with the shape of this array
+                apart from the outermost dimension. It is used as it is,
+                not copied, so it may be a broadcast view (see ``compact``).
+
+        Raises:
+            RuntimeError: if the array is not ``appendable``.
+            ValueError: if the inner dimensions of ``data`` don't match.
+        """
+        if not self.appendable:
+            raise RuntimeError('only appendable arrays can be replaced',
+                               self.array_id)
+        if tuple(data.shape[1:]) != tuple(self.shape[1:]):
+            raise ValueError('replacement data must have the inner shape '
+                             'of the array', data.shape, self.shape)
+        if self._dtype is not None and data.dtype != self._dtype:
+            data = data.astype(self._dtype)
+
+        self.release_spill()
+        self._buffer = None
+        self.ndarray = data
+        self.shape = data.shape
+        self._set_index_bounds()
+        self.last_saved_index = None
+        self.modified_range = (0, data.size - 1) if data.size else None
+
+    def release_spill(self):
+        """
+        Delete the temporary file backing this array, if ``init_data`` put
+        it in one because it was over the memory budget (see
+        ``MemoryBudget``).
+
+        On POSIX the data stays readable until the array is dropped.
+        """
+        if self._spill_path is not None:
+            memory_budget.release(self._spill_path)
+            self._spill_path = None
+
+    def _empty_dtype(self):
+        return float if self._dtype is None else self._dtype
+
     def _set_index_bounds(self):
         self._min_indices = [0 for d in self.shape]
         self._max_indices = [d - 1 for d in self.shape]
 
     def clear(self):
-        """Fill the (already existing) data array with nan."""
+        """
+        Fill the (already existing) data array with ``fill_value``, which is
+        nan unless an integer ``dtype`` was declared.
+        """
         # only floats can hold nan values. I guess we could
         # also raise an error in this case? But generally float is
         # what people want anyway.
-        if self.ndarray.dtype != float:
-            self.ndarray = self.ndarray.astype(float)
-        self.ndarray.fill(float('nan'))
+        dtype = self._empty_dtype()
+        if self.ndarray.dtype != dtype:
+            self.ndarray = self.ndarray.astype(dtype)
+        self._make_writeable()
+        self.ndarray.fill(self.fill_value)
+        self._pyramids = None
 
     def __setitem__(self, loop_indices, value):
         """
@@ -338,7 +638,62 @@ class DataArray(DelegateAttributes):
         max_li = self.flat_index(max_indices, self._max_indices)
         self._update_modified_range(min_li, max_li)
 
-        self.ndarray.__setitem__(loop_indices, value)
+        try:
+            self.ndarray.__setitem__(loop_indices, value)
+        except ValueError:
+            if self.ndarray.flags.writeable:
+                raise
+            self._make_writeable()
+            self.ndarray.__setitem__(loop_indices, value)
+
+    def set_many(self, indices, values):
+        """
+        Set many data values at once.
+
+        Equivalent to ``self[index] = value`` for each pair in order, but if
+        every index is a full set of integers and every value a scalar, all
+        points are written with one numpy assignment.
+
+        Args:
+            indices (Sequence[tuple]): the loop indices of each value.
+            values (Sequence): the values.
+        """
+        if not len(indices):
+            return
+        ndim = len(self.shape)
+        if not all(len(index) == ndim and
+                   all(isinstance(i, (int, np.integer)) for i in index)
+                   for index in indices) or not all(
+                np.isscalar(value) for value in values):
+            for index, value in zip(indices, values):
+                self[index] = value
+            return
+
+        points = tuple(np.array(indices, dtype=int).reshape(-1, ndim).T)
+        flat = np.ravel_multi_index(points, self.shape)
+        self._update_modified_range(int(flat.min()), int(flat.max()))
+        self._make_writeable()
+        self.ndarray[points] = values
+
+    def compact(self):
+        """
+        The stored data, without the outer dimensions that only repeat it.
+
+        Preset data nested in outer loops (like the setpoints of inner loops)
+        is kept once, and ``ndarray`` is a read-only broadcast view repeating
+        it. Formatters can save just this part. Anything written into the
+        array makes a full copy first.
+
+        Returns:
+            Tuple[numpy.ndarray, int]: the data, and how many outer
+                dimensions of ``ndarray`` repeat it (0 if it is an ordinary
+                array).
+        """
+        return _compact(self.ndarray)
+
+    def _make_writeable(self):
+        if not self.ndarray.flags.writeable:
+            self.ndarray = np.array(self.ndarray)
 
     def __getitem__(self, loop_indices):
         return self.ndarray[loop_indices]
@@ -378,6 +733,10 @@ class DataArray(DelegateAttributes):
         return np.ravel_multi_index(tuple(zip(indices)), self.shape)[0]
 
     def _update_modified_range(self, low, high):
+        if self._pyramids:
+            for pyramid in self._pyramids.values():
+                pyramid.mark_dirty(low, high)
+
         if self.modified_range:
             self.modified_range = (min(self.modified_range[0], low),
                                    max(self.modified_range[1], high))
@@ -454,10 +813,7 @@ class DataArray(DelegateAttributes):
         if self.modified_range:
             latest_index = max(latest_index, self.modified_range[1])
 
-        vals = [
-            self.ndarray[np.unravel_index(i, self.ndarray.shape)]
-            for i in range(synced_index + 1, latest_index + 1)
-        ]
+        vals = self.ndarray.flat[synced_index + 1:latest_index + 1].tolist()
 
         if vals:
             return {
@@ -480,11 +836,83 @@ class DataArray(DelegateAttributes):
             stop (int): the flat index of the last new value.
             vals (List[float]): the new values
         """
-        for i, val in enumerate(vals):
-            index = np.unravel_index(i + start, self.ndarray.shape)
-            self.ndarray[index] = val
+        self._make_writeable()
+        self.ndarray.flat[start:start + len(vals)] = vals
+        self.synced_index = stop
+
+        if self._pyramids:
+            for pyramid in self._pyramids.values():
+                pyramid.mark_dirty(start, stop)
+
+    def apply_shared_changes(self, stop):
+        """
+        Mark shared data up to flat index ``stop`` as synced.
+
+        The shared-memory counterpart of ``apply_changes``: the values are
+        already in ``ndarray``, so only the bookkeeping changes.
+
+        Args:
+            stop (int): the flat index of the last new value.
+        """
+        start = self.get_synced_index() + 1
+        if stop < start:
+            return
         self.synced_index = stop
 
+        if self._pyramids:
+            for pyramid in self._pyramids.values():
+                pyramid.mark_dirty(start, stop)
+
+    def view(self, resolution=1000):
+        """
+        A min/max/mean summary of this array, small enough to plot.
+
+        Dimensions longer than ``resolution`` are divided into buckets, so
+        that between ``resolution`` and 4 * ``resolution`` buckets remain.
+        If several dimensions are reduced, they share one bucket size where
+        possible, so the longer ones may keep more. Shorter dimensions are not
+        reduced. The summaries are built the first time they are needed, and
+        complex data is summarized by its magnitude. After that, only the
+        parts that were modified through item assignment (or
+        ``apply_changes``) are updated. If you write to ``ndarray`` directly,
+        assign a new ``ndarray`` afterward, or call ``clear``, to discard
+        stale summaries.
+
+        Args:
+            resolution (Union[int, Sequence[int]]): how many points are
+                useful along each dimension, eg the plot width in pixels.
+                One value for all dimensions or one per dimension.
+                Default 1000.
+
+        Returns:
+            DecimatedView: a namedtuple of ``min``, ``max``, ``mean`` and
+            ``count`` (of non-NaN points) arrays, one element per bucket,
+            and ``factor``, the bucket size along each dimension.
+        """
+        data = self.ndarray
+        resolution = _per_dim(resolution, data.shape)
+        axes = tuple(i for i, (n, r) in enumerate(zip(data.shape, resolution))
+                     if n > r)
+        fill_value = self.fill_value
+        if fill_value != fill_value:
+            # nan, which the summaries skip anyway
+            fill_value = None
+        if not axes:
+            measured = self.measured_mask()
+            if np.iscomplexobj(data):
+                data = np.abs(data)
+            elif fill_value is not None:
+                data = np.where(measured, data, np.nan)
+            return DecimatedView(data, data, data, measured.astype(int),
+                                 (1,) * data.ndim)
+
+        if self._pyramids is None:
+            self._pyramids = {}
+        if axes not in self._pyramids:
+            self._pyramids[axes] = SummaryPyramid(data, axes=axes,
+                                                  fill_value=fill_value)
+        return self._pyramids[axes].view(resolution)
+
     def __repr__(self):
         array_id_or_none = ' {}'.format(self.array_id) if self.array_id else ''
         return '{}[{}]:{}\n{}'.format(self.__class__.__name__,
@@ -500,6 +928,14 @@ class DataArray(DelegateAttributes):
         for attr in self.SNAP_ATTRS:
             snap[attr] = getattr(self, attr)
 
+        if self.appendable:
+            snap['appendable'] = True
+
+        if self._dtype is not None:
+            snap['dtype'] = self._dtype.name
+            if self._dtype.kind in 'iu':
+                snap['fill_value'] = int(self.fill_value)
+
         return snap
 
     def fraction_complete(self):
@@ -512,7 +948,7 @@ class DataArray(DelegateAttributes):
         Returns:
             float: fraction of array which is complete, from 0.0 to 1.0
         """
-        if self.ndarray is None:
+        if self.ndarray is None or not self.ndarray.size:
             return 0.0
 
         last_index = -1
@@ -529,3 +965,16 @@ class DataArray(DelegateAttributes):
     def units(self):
         warn_units('DataArray', self)
         return self.unit
+
+
+def _compact(data):
+    # leading dimensions of a read-only view that repeat the same data
+    if data.flags.writeable:
+        return data, 0
+    repeats = 0
+    while repeats < data.ndim and data.strides[repeats] == 0:
+        repeats += 1
+    # not data[0, ...], so it works even if an outer dimension is empty
+    return np.lib.stride_tricks.as_strided(
+        data, data.shape[repeats:], data.strides[repeats:],
+        writeable=False), repeats
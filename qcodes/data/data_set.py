@@ -1,16 +1,29 @@
 """DataSet class and factory functions."""
 
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import tempfile
+import threading
 import time
 import logging
+import weakref
 from traceback import format_exc
 from copy import deepcopy
 from collections import OrderedDict
 
+import numpy as np
+
 from .manager import get_data_manager, NoData
+from .data_array import DataArray
 from .gnuplot_format import GNUPlotFormat
 from .io import DiskIO
 from .location import FormatLocation
+from .writer import BackgroundWriter
+from .journal import StoreJournal
+from .retention import Compactor
+from .catalog import Catalog
 from qcodes.utils.helpers import DelegateAttributes, full_class, deep_update
 
 
@@ -121,7 +134,8 @@ def new_data(location=None, loc_record=None, name=None, overwrite=False,
                    mode=mode, **kwargs)
 
 
-def load_data(location=None, data_manager=None, formatter=None, io=None):
+def load_data(location=None, data_manager=None, formatter=None, io=None,
+              lazy=False, arrays=None, region=None):
     """
     Load an existing DataSet.
 
@@ -151,6 +165,25 @@ def load_data(location=None, data_manager=None, formatter=None, io=None):
             says the root data directory is the current working directory, ie
             where you started the python session.
 
+        lazy (bool, optional): only read the metadata and the array
+            descriptors (ids, shapes, labels) now. The data of each array is
+            read the first time it is accessed, if the formatter supports
+            this, otherwise everything is read right away. Default False.
+
+        arrays (Optional[Sequence[str]]): only read these arrays, and their
+            setpoint arrays. Default None, all arrays.
+
+        region (Optional[Dict[slice]]): only read part of the data, as
+            ``{axis: slice}`` with each axis named by the ``array_id`` or
+            ``name`` of its setpoint array, like ``{'x': slice(100, 200)}``.
+            Default None, all of it.
+
+            With ``arrays`` or ``region``, the data is read right away with
+            ``Formatter.read_part``, and only what was asked for is read
+            from storage if the formatter supports that (``HDF5Format`` and
+            ``ChunkedFormat`` do). The resulting DataSet is for analysis,
+            writing it back would overwrite the rest of the data.
+
     Returns:
         A new ``DataSet`` object loaded with pre-existing data.
     """
@@ -176,16 +209,267 @@ def load_data(location=None, data_manager=None, formatter=None, io=None):
         data = DataSet(location=location, formatter=formatter, io=io,
                        mode=DataMode.LOCAL)
         data.read_metadata()
-        data.read()
+        if arrays is not None or region is not None:
+            data.read(arrays=arrays, region=region)
+            return data
+        data.read(lazy=lazy)
+        # recover anything stored but not written before a crash
+        data.replay_journal()
         return data
 
 
+def load_many(locations, workers=None, formatter=None, io=None):
+    """
+    Load many existing DataSets, optionally in parallel processes.
+
+    Each DataSet is loaded with ``load_data`` (never from a live
+    ``DataServer``). With more than one worker, the loading happens in a
+    process pool; each worker saves the arrays it read to temporary ``.npy``
+    files, which this process opens memory-mapped (copy-on-write) instead of
+    receiving pickled copies of the data. The files are deleted before
+    returning; except on POSIX systems, where the memory maps outlive the
+    files, this means reading them into memory.
+
+    Args:
+        locations (Sequence[str]): the locations to load.
+
+        workers (int, optional): number of worker processes. Default None,
+            which loads serially in this process.
+
+        formatter (Formatter, optional): as in ``load_data``.
+
+        io (io_manager, optional): as in ``load_data``.
+
+    Returns:
+        List[DataSet]: one per location, in the same order. Each has an extra
+            attribute ``load_time``: the seconds its worker spent loading it.
+    """
+    if not workers or workers <= 1:
+        out = []
+        for location in locations:
+            t0 = time.perf_counter()
+            data = load_data(location, data_manager=False,
+                             formatter=formatter, io=io)
+            data.load_time = time.perf_counter() - t0
+            out.append(data)
+        return out
+
+    # on posix the memmaps stay valid after the files are unlinked,
+    # elsewhere open files can't be deleted so we read them into memory
+    mmap_mode = 'c' if os.name == 'posix' else None
+
+    tmpdir = tempfile.mkdtemp(prefix='qcodes_load_many_')
+    try:
+        args = [(location, formatter, io, os.path.join(tmpdir, str(i)))
+                for i, location in enumerate(locations)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_to_npy, *zip(*args)))
+
+        return [_data_set_from_npy(location, formatter, io, result,
+                                   mmap_mode)
+                for location, result in zip(locations, results)]
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _load_to_npy(location, formatter, io, npy_dir):
+    """Worker half of ``load_many``: load one DataSet, dump its arrays."""
+    t0 = time.perf_counter()
+    data = load_data(location, data_manager=False, formatter=formatter, io=io)
+    load_time = time.perf_counter() - t0
+
+    os.makedirs(npy_dir)
+    arrays = []
+    for i, (array_id, array) in enumerate(data.arrays.items()):
+        path = os.path.join(npy_dir, '{}.npy'.format(i))
+        np.save(path, array.ndarray)
+        arrays.append({
+            'array_id': array_id,
+            'name': array.name,
+            'label': array.label,
+            'unit': array.unit,
+            'is_setpoint': array.is_setpoint,
+            'set_arrays': [sa.array_id for sa in array.set_arrays],
+            'last_saved_index': array.last_saved_index,
+            'modified_range': array.modified_range,
+            'path': path
+        })
+
+    return {'metadata': data.metadata, 'arrays': arrays,
+            'load_time': load_time}
+
+
+def _data_set_from_npy(location, formatter, io, result, mmap_mode):
+    data = DataSet(location=location, formatter=formatter, io=io)
+    data.metadata = result['metadata']
+
+    for info in result['arrays']:
+        array = DataArray(array_id=info['array_id'], name=info['name'],
+                          label=info['label'], unit=info['unit'],
+                          is_setpoint=info['is_setpoint'],
+                          snapshot=data.get_array_metadata(info['array_id']),
+                          preset_data=np.load(info['path'],
+                                              mmap_mode=mmap_mode))
+        array.last_saved_index = info['last_saved_index']
+        array.modified_range = info['modified_range']
+        data.add_array(array)
+
+    for info in result['arrays']:
+        data.arrays[info['array_id']].set_arrays = tuple(
+            data.arrays[sa_id] for sa_id in info['set_arrays'])
+
+    data.load_time = result['load_time']
+    return data
+
+
+def stack_datasets(locations, axis_name='repetition', path=None,
+                   formatter=None, io=None):
+    """
+    Stack repeated runs of the same measurement into one DataSet.
+
+    The DataSets are loaded one at a time and their measured arrays copied
+    into memory-mapped ``.npy`` files with a new outer dimension, so the
+    stack never needs to fit in memory. The setpoints must be the same in
+    every run (points that one run didn't measure are not compared); each
+    setpoint array is stored once, and appears in the stack as a read-only
+    broadcast view.
+
+    Args:
+        locations (Sequence[str]): the runs to stack, in order.
+
+        axis_name (str, optional): ``array_id`` of the new outer setpoint
+            array, which holds the index of each run. Default 'repetition'.
+
+        path (str, optional): a directory for the ``.npy`` files, which are
+            kept there. Default None, which uses a temporary directory that
+            is deleted right away on POSIX systems (the memory maps stay
+            valid) and when the stack is garbage collected elsewhere.
+
+        formatter (Formatter, optional): as in ``load_data``.
+
+        io (io_manager, optional): as in ``load_data``.
+
+    Returns:
+        DataSet: a new DataSet with ``location=False``. Its metadata is that
+            of the first run, plus ``stack``: the locations and the axis name.
+
+    Raises:
+        ValueError: if the runs don't all have the same arrays, shapes and
+            setpoints.
+    """
+    locations = list(locations)
+    if not locations:
+        raise ValueError('no locations to stack')
+    n = len(locations)
+
+    temporary = path is None
+    if temporary:
+        path = tempfile.mkdtemp(prefix='qcodes_stack_')
+    else:
+        os.makedirs(path, exist_ok=True)
+
+    try:
+        first = None
+        stores = OrderedDict()
+        for i, location in enumerate(locations):
+            data = load_data(location, data_manager=False,
+                             formatter=formatter, io=io, lazy=True)
+            if first is None:
+                first = data
+                if axis_name in data.arrays:
+                    raise ValueError('{} already has an array {}'.format(
+                        location, axis_name))
+                for array_id, array in data.arrays.items():
+                    shape = array.shape if array.is_setpoint else (
+                        (n,) + array.shape)
+                    stores[array_id] = np.lib.format.open_memmap(
+                        os.path.join(path, array_id + '.npy'), mode='w+',
+                        dtype=array.ndarray.dtype, shape=shape)
+            elif (set(data.arrays) != set(stores) or
+                  any(_set_ids(data.arrays[array_id]) !=
+                      _set_ids(first.arrays[array_id]) or
+                      data.arrays[array_id].shape !=
+                      first.arrays[array_id].shape
+                      for array_id in stores)):
+                raise ValueError('{} does not have the same arrays as '
+                                 '{}'.format(location, locations[0]))
+
+            for array_id, array in data.arrays.items():
+                store = stores[array_id]
+                if not array.is_setpoint:
+                    store[i] = array.ndarray
+                elif i == 0:
+                    store[...] = array.ndarray
+                else:
+                    _merge_setpoints(store, array, location, locations[0])
+
+        stacked = DataSet(location=False, formatter=formatter, io=io)
+        repetition = DataArray(name=axis_name, array_id=axis_name,
+                               preset_data=np.arange(n), is_setpoint=True)
+        repetition.set_arrays = (repetition,)
+        stacked.add_array(repetition)
+
+        for array_id, store in stores.items():
+            array = first.arrays[array_id]
+            if array.is_setpoint:
+                store = np.broadcast_to(store, (n,) + store.shape)
+            stacked.add_array(DataArray(
+                name=array.name, array_id=array_id, label=array.label,
+                unit=array.unit, is_setpoint=array.is_setpoint,
+                snapshot=first.get_array_metadata(array_id),
+                preset_data=store))
+        for array_id in stores:
+            stacked.arrays[array_id].set_arrays = (repetition,) + tuple(
+                stacked.arrays[set_id]
+                for set_id in _set_ids(first.arrays[array_id]))
+    except BaseException:
+        if temporary:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    stacked.add_metadata(first.metadata)
+    stacked.add_metadata({'stack': {'locations': locations,
+                                    'axis_name': axis_name}})
+
+    if temporary:
+        if os.name == 'posix':
+            # the memmaps stay valid after the files are unlinked
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            weakref.finalize(stacked, shutil.rmtree, path, True)
+    return stacked
+
+
+def _set_ids(array):
+    # setpoint arrays are not always their own last set_array
+    ids = [set_array.array_id for set_array in array.set_arrays]
+    if array.is_setpoint and array.array_id not in ids:
+        ids.append(array.array_id)
+    return ids
+
+
+def _merge_setpoints(store, array, location, first_location):
+    # compare with the setpoints so far where both were measured, and fill
+    # in what they are missing
+    values = array.ndarray
+    if array.declared_dtype is not None and array.declared_dtype.kind in 'iu':
+        missing, new = store == array.fill_value, values == array.fill_value
+    else:
+        missing, new = np.isnan(store), np.isnan(values)
+    both = ~(missing | new)
+    if not np.array_equal(store[both], values[both]):
+        raise ValueError('setpoints {} of {} differ from those of {}'.format(
+            array.array_id, location, first_location))
+    store[missing] = values[missing]
+
+
 def _get_live_data(data_manager):
     live_data = data_manager.ask('get_data')
     if live_data is None or isinstance(live_data, NoData):
         raise RuntimeError('DataManager has no live data')
 
     live_data.mode = DataMode.PULL_FROM_SERVER
+    live_data.data_manager = data_manager
     return live_data
 
 
@@ -242,6 +526,32 @@ class DataSet(DelegateAttributes):
             this and generally writes more often. Use None to disable writing
             from calls to ``self.store``. Default 5.
 
+        background_write (bool, optional): Only if ``mode=LOCAL``, hand the
+            formatter writes to a ``BackgroundWriter`` thread, so ``write``
+            only copies the modified data and returns. ``finalize`` waits for
+            all pending writes. Default False.
+
+        journal (bool, optional): Only if ``mode=LOCAL``, append every
+            ``store`` call to a ``StoreJournal`` inside the location, so data
+            that was stored but not yet written survives a crash and is
+            recovered by ``load_data``. The journal is deleted by
+            ``finalize``. Default False.
+
+        store_batch_size (int, optional): Only if ``mode=PUSH_TO_SERVER``,
+            send stores to the ``DataServer`` in batches of this many calls,
+            applied there with vectorized writes. Use 1 to send every store
+            on its own. Default 100.
+
+        store_batch_age (float, optional): Only if ``mode=PUSH_TO_SERVER``,
+            also send the batch this many seconds after its first store,
+            even if no more stores come. Loops send it when they complete a
+            row, and ``finalize`` sends what's left. Default 0.5.
+
+        retention (RetentionPolicy, optional): Only if ``mode=LOCAL``, thin
+            out the old rows of the appendable arrays with this policy, in a
+            background thread started from ``append`` every
+            ``retention.period`` seconds. Default None, keep everything.
+
     Attributes:
         background_functions (OrderedDict[callable]): Class attribute,
             ``{key: fn}``: ``fn`` is a callable accepting no arguments, and
@@ -254,6 +564,10 @@ class DataSet(DelegateAttributes):
             Note that because this is a class attribute, the functions will
             apply to every DataSet. If you want specific functions for one
             DataSet you can override this with an instance attribute.
+
+        sync_timeout (float): Class attribute, seconds without new data
+            after which a DataSet that ``sync`` follows on disk is no longer
+            live, even though its loop never ended. Default 60.
     """
 
     # ie data_set.arrays['vsd'] === data_set.vsd
@@ -265,8 +579,12 @@ class DataSet(DelegateAttributes):
 
     background_functions = OrderedDict()
 
+    sync_timeout = 60
+
     def __init__(self, location=None, mode=DataMode.LOCAL, arrays=None,
-                 data_manager=False, formatter=None, io=None, write_period=5):
+                 data_manager=False, formatter=None, io=None, write_period=5,
+                 background_write=False, journal=False, store_batch_size=100,
+                 store_batch_age=0.5, retention=None):
         if location is False or isinstance(location, str):
             self.location = location
         else:
@@ -281,6 +599,29 @@ class DataSet(DelegateAttributes):
         self.last_write = 0
         self.last_store = -1
 
+        self.background_write = background_write
+        self._writer = None
+
+        self.journal = journal
+        self._journal = None
+
+        self.retention = retention
+        self._compactor = None
+
+        self.store_batch_size = store_batch_size
+        self.store_batch_age = store_batch_age
+        self._store_batch = []
+        self._store_batch_start = 0
+        # created on the first batched store, as neither can be pickled
+        self._store_lock = None
+        self._store_flusher = None
+
+        # SharedArrays when the live data is in shared memory
+        self._shared = None
+
+        # (last_saved_index of each array, time) when sync last read new data
+        self._last_read = None
+
         self.metadata = {}
 
         self.arrays = _PrettyPrintDict()
@@ -322,10 +663,16 @@ class DataSet(DelegateAttributes):
         # using:
         #     data_manager.restart()
         try:
-            data_manager.ask('new_data', self)
+            shared = data_manager.ask('new_data', self)
         except AttributeError:
             data_manager.restart()
-            data_manager.ask('new_data', self)
+            shared = data_manager.ask('new_data', self)
+
+        # a SharedMemoryDataServer replies with its shared blocks, which we
+        # write into directly
+        if shared is not None:
+            shared.attach(self.arrays)
+            self._shared = shared
 
         # need to set data_manager *after* sending to data_manager because
         # we can't (and shouldn't) send data_manager itself through a queue
@@ -382,8 +729,16 @@ class DataSet(DelegateAttributes):
         If this DataSet is on the server, asks the server for changes.
         If not, reads the entire DataSet from disk.
 
+        A LOCAL DataSet that was read from storage reads whatever was
+        appended since, if its formatter supports that (see
+        ``Formatter.read_new``), so another process can follow a
+        measurement that is writing to disk.
+
         Returns:
-            bool: True if this DataSet is live on the server
+            bool: True if this DataSet is live on the server, or if it was
+                read from storage, its metadata shows a loop that has
+                started but not ended, and new data was read within the last
+                ``sync_timeout`` seconds.
         """
         # TODO: sync implies bidirectional... and it could be!
         # we should keep track of last sync timestamp and last modification
@@ -392,14 +747,36 @@ class DataSet(DelegateAttributes):
         # could find a robust and intuitive way to make modifications to the
         # version on the DataServer from the main copy)
         if not self.is_live_mode:
-            # LOCAL DataSet - no need to sync just use local data
-            return False
-            # TODO - for remote live plotting, maybe set some timestamp
-            # threshold and call it static after it's been dormant a long time?
-            # I'm thinking like a minute, or ten? Maybe it's configurable?
+            # LOCAL DataSet - no need to sync just use local data, unless
+            # it's following a measurement on disk
+            if self.location is False or not self.formatter.read_new(self):
+                return False
+            loop = (self.metadata.get('loop') or
+                    self.metadata.get('measurement') or {})
+            if 'ts_start' not in loop or 'ts_end' in loop:
+                return False
+            # a loop that was killed never writes ts_end, so it's only live
+            # while data keeps coming
+            now = time.time()
+            saved = [array.last_saved_index for array in self.arrays.values()]
+            if self._last_read is None or saved != self._last_read[0]:
+                self._last_read = (saved, now)
+            return now - self._last_read[1] < self.sync_timeout
 
         with self.data_manager.query_lock:
-            if self.is_on_server:
+            if self.is_on_server and self._shared is not None:
+                # the data is already here, we only need the cursors. Ask
+                # first: once the server is done, everything is published.
+                measuring = self.data_manager.ask('get_measuring')
+                for array_id, (_, high) in self._shared.ranges().items():
+                    self.arrays[array_id].apply_shared_changes(high)
+                if not measuring:
+                    self._shared.detach(self.arrays)
+                    self._shared = None
+                    self.mode = DataMode.LOCAL
+                    return False
+                return True
+            elif self.is_on_server:
                 synced_indices = {
                     array_id: array.get_synced_index()
                     for array_id, array in self.arrays.items()
@@ -594,24 +971,193 @@ class DataSet(DelegateAttributes):
                 array_ids, and values are single numbers or entire slices
                 to insert into that array.
          """
-        if self.mode == DataMode.PUSH_TO_SERVER:
-            # Defers to the copy on the dataserver to call this identical
-            # function
-            self.data_manager.write('store_data', loop_indices, ids_values)
+        if self.mode == DataMode.PUSH_TO_SERVER and self._shared is not None:
+            # write straight into shared memory, then tell the server
+            # (and readers) which points are ready
+            for array_id, value in ids_values.items():
+                array = self.arrays[array_id]
+                array[loop_indices] = value
+                self._shared.publish(array_id, *array.modified_range)
+                array.modified_range = None
+        elif self.mode == DataMode.PUSH_TO_SERVER:
+            # Defers to the copy on the dataserver to call store_batch,
+            # a few stores at a time. Arrays are copied, as the caller may
+            # reuse them before the batch is sent.
+            ids_values = {
+                array_id: (np.array(value)
+                           if isinstance(value, (np.ndarray, list))
+                           else value)
+                for array_id, value in ids_values.items()}
+            if self._store_flusher is None:
+                self._start_store_flusher()
+            with self._store_lock:
+                now = time.time()
+                if not self._store_batch:
+                    self._store_batch_start = now
+                    # the flusher sends it if it gets old
+                    self._store_lock.notify()
+                self._store_batch.append((loop_indices, ids_values))
+                if (len(self._store_batch) >= self.store_batch_size or
+                        now - self._store_batch_start >=
+                        self.store_batch_age):
+                    self._send_store_batch()
         elif self.mode == DataMode.LOCAL:
             # You will always end up in this block, either in the copy
             # on the server (if you hit the if statement above) or else here
+            self._journal_stores(((loop_indices, ids_values),))
+            self._extend_appendable((loop_indices,))
             for array_id, value in ids_values.items():
                 self.arrays[array_id][loop_indices] = value
-            self.last_store = time.time()
-            if (self.write_period is not None and
-                    time.time() > self.last_write + self.write_period):
-                self.write()
-                self.last_write = time.time()
+            self._after_store()
         else:  # in PULL_FROM_SERVER mode; store() isn't legal
             raise RuntimeError('This object is pulling from a DataServer, '
                                'so data insertion is not allowed.')
 
+    def store_batch(self, batch):
+        """
+        Insert the data of many ``store`` calls at once.
+
+        The values for each array are written together, with a single numpy
+        assignment where possible (see ``DataArray.set_many``). This is how
+        the ``DataServer`` applies the batches sent by ``flush_stores``.
+
+        Args:
+            batch (Sequence[Tuple[tuple, dict]]): ``(loop_indices,
+                ids_values)`` pairs as passed to ``store``, in order.
+        """
+        if self.mode != DataMode.LOCAL:
+            raise RuntimeError('store_batch is only allowed in LOCAL mode',
+                               self.mode)
+
+        self._journal_stores(batch)
+        self._extend_appendable(loop_indices for loop_indices, _ in batch)
+        by_array = {}
+        for loop_indices, ids_values in batch:
+            for array_id, value in ids_values.items():
+                indices, values = by_array.setdefault(array_id, ([], []))
+                indices.append(loop_indices)
+                values.append(value)
+        for array_id, (indices, values) in by_array.items():
+            self.arrays[array_id].set_many(indices, values)
+        self._after_store()
+
+    def append(self, ids_values):
+        """
+        Store the next point along the appendable outer axis.
+
+        For open-ended measurements, like a monitor logging temperatures
+        for weeks: the arrays are created ``appendable``, usually with
+        length 0, and each ``append`` stores one more row, growing them
+        (see ``DataArray.extend``). Formatters append the new rows to what
+        they wrote before.
+
+        With a ``retention`` policy, this also runs its ``Compactor``.
+
+        Only in ``LOCAL`` mode.
+
+        Args:
+            ids_values (Dict[Union[float, sequence]]): as in ``store``,
+                the values of the new row, usually including the outer
+                setpoint (like the time).
+
+        Returns:
+            int: the outer index of the new row.
+
+        Raises:
+            RuntimeError: if not in ``LOCAL`` mode, or no array in this
+                DataSet is appendable.
+        """
+        if self.mode != DataMode.LOCAL:
+            raise RuntimeError('append is only allowed in LOCAL mode',
+                               self.mode)
+        lengths = [array.shape[0] for array in self.arrays.values()
+                   if array.appendable]
+        if not lengths:
+            raise RuntimeError('this DataSet has no appendable arrays')
+        index = max(lengths)
+        if self.retention is not None:
+            ids_values = self.retention.full_row(self, ids_values)
+        self.store((index,), ids_values)
+
+        if self.retention is not None:
+            if self._compactor is None:
+                self._compactor = Compactor(self, self.retention)
+            self._compactor.poll()
+        return index
+
+    def _extend_appendable(self, all_loop_indices):
+        # grow the appendable arrays to hold every outer index stored
+        arrays = [array for array in self.arrays.values() if array.appendable]
+        if not arrays:
+            return
+        length = 0
+        for loop_indices in all_loop_indices:
+            if not isinstance(loop_indices, tuple):
+                loop_indices = (loop_indices,)
+            outer = loop_indices[0] if loop_indices else None
+            if isinstance(outer, (int, np.integer)):
+                length = max(length, int(outer) + 1)
+        for array in arrays:
+            array.extend(length)
+
+    def flush_stores(self):
+        """
+        Send the stores batched in ``PUSH_TO_SERVER`` mode to the DataServer.
+        """
+        if self._store_batch:
+            with self._store_lock:
+                self._send_store_batch()
+
+    def _start_store_flusher(self):
+        # one thread for the whole life of the DataSet, until finalize
+        if self._store_lock is None:
+            self._store_lock = threading.Condition()
+        self._store_flusher = threading.Thread(target=self._flush_old_stores)
+        self._store_flusher.daemon = True
+        self._store_flusher.start()
+
+    def _stop_store_flusher(self):
+        if self._store_flusher is not None:
+            with self._store_lock:
+                self._store_flusher = None
+                self._store_lock.notify()
+
+    def _flush_old_stores(self):
+        # sends each batch store_batch_age after its first store, unless
+        # it was sent before that
+        with self._store_lock:
+            while self._store_flusher is threading.current_thread():
+                if not self._store_batch:
+                    self._store_lock.wait()
+                    continue
+                wait = (self._store_batch_start + self.store_batch_age -
+                        time.time())
+                if wait > 0:
+                    self._store_lock.wait(wait)
+                else:
+                    self._send_store_batch()
+
+    def _send_store_batch(self):
+        # the caller holds _store_lock
+        if self._store_batch:
+            batch, self._store_batch = self._store_batch, []
+            self.data_manager.write('store_data', batch)
+
+    def _journal_stores(self, batch):
+        if self.journal and self.location is not False:
+            if self._journal is None:
+                self._journal = StoreJournal.for_data_set(self)
+                self._journal.open(self.arrays)
+            for loop_indices, ids_values in batch:
+                self._journal.append(loop_indices, ids_values)
+
+    def _after_store(self):
+        self.last_store = time.time()
+        if (self.write_period is not None and
+                time.time() > self.last_write + self.write_period):
+            self.write()
+            self.last_write = time.time()
+
     def default_parameter_name(self, paramname='amplitude'):
         """ Return name of default parameter for plotting
 
@@ -671,11 +1217,48 @@ class DataSet(DelegateAttributes):
         paramname = self.default_parameter_name(paramname=paramname)
         return getattr(self, paramname, None)
 
-    def read(self):
-        """Read the whole DataSet from storage, overwriting the local data."""
+    def read(self, lazy=False, arrays=None, region=None):
+        """
+        Read the whole DataSet from storage, overwriting the local data.
+
+        Args:
+            lazy (bool): only read the array descriptors now, and defer
+                reading each array until it is first accessed. Default False.
+
+            arrays (Optional[Sequence[str]]): only read these arrays and
+                their setpoint arrays, right away, with
+                ``Formatter.read_part``. Default None, all arrays.
+
+            region (Optional[Dict[slice]]): only read this part of each
+                setpoint axis, with ``Formatter.read_part``. Default None,
+                all of it.
+        """
         if self.location is False:
             return
-        self.formatter.read(self)
+        if arrays is not None or region is not None:
+            self.formatter.read_part(self, arrays, region)
+        elif lazy:
+            self.formatter.read_lazy(self)
+        else:
+            self.formatter.read(self)
+
+    def replay_journal(self):
+        """
+        Apply a ``StoreJournal`` left behind by a crashed measurement.
+
+        The recovered values are marked as modified, so calling ``write``
+        afterward completes the data files.
+
+        Returns:
+            int: the number of ``store`` calls recovered, 0 if there is no
+                journal at this location.
+        """
+        if self.location is False:
+            return 0
+        fn = self.io.join(self.location, StoreJournal.filename)
+        if fn not in self.io.list(fn):
+            return 0
+        return StoreJournal(self.io.to_path(fn)).replay(self)
 
     def read_metadata(self):
         """Read the metadata from storage, overwriting the local data."""
@@ -699,11 +1282,49 @@ class DataSet(DelegateAttributes):
         if self.location is False:
             return
 
+        if self.background_write:
+            # the writer is started on first use, so it's created in
+            # whichever process actually holds the data
+            if self._writer is None:
+                self._writer = BackgroundWriter(self)
+            self._writer.put_changes(write_metadata=write_metadata)
+            return
+
         self.formatter.write(self,
                              self.io,
                              self.location,
                              write_metadata=write_metadata)
 
+    def rewrite(self):
+        """
+        Replace everything in storage with the current data.
+
+        For changes formatters can't add to what they wrote before, like
+        appendable arrays that lost rows (see ``DataArray.replace_data``).
+        Pending background writes are finished first, and the journal is
+        started again, as everything in it is saved now.
+        """
+        if self.mode != DataMode.LOCAL:
+            raise RuntimeError('rewrite is only allowed in LOCAL mode',
+                               self.mode)
+        if self.location is False:
+            return
+
+        if self._writer is not None:
+            # the next write starts a new one, with a fresh mirror
+            writer, self._writer = self._writer, None
+            writer.close()
+
+        for array in self.arrays.values():
+            array.clear_save()
+        self.snapshot()
+        self.formatter.write(self, self.io, self.location, force_write=True)
+        self.last_write = time.time()
+
+        if self._journal is not None:
+            self._journal.close(remove=True)
+            self._journal = None
+
     def write_copy(self, path=None, io_manager=None, location=None):
         """
         Write a new complete copy of this DataSet to storage.
@@ -771,34 +1392,73 @@ class DataSet(DelegateAttributes):
         deep_update(self.metadata, new_metadata)
 
     def save_metadata(self):
-        """Evaluate and save the DataSet's metadata."""
+        """
+        Evaluate and save the DataSet's metadata.
+
+        Also indexes the DataSet in ``Catalog.default``, if there is one.
+        Failing to index it is logged, not raised: the data is saved, and
+        the catalog can be rebuilt later.
+        """
         if self.location is not False:
             self.snapshot()
             self.formatter.write_metadata(self, self.io, self.location)
+            if Catalog.default is not None:
+                try:
+                    Catalog.default.add(self)
+                except Exception:
+                    logging.warning('error indexing DataSet ' +
+                                    str(self.location) + ' in the catalog')
+                    logging.warning(format_exc())
 
     def finalize(self):
         """
         Mark the DataSet complete and write any remaining modifications.
 
         Also closes the data file(s), if the ``Formatter`` we're using
-        supports that.
+        supports that, and any files the io manager keeps open.
         """
         if self.mode == DataMode.PUSH_TO_SERVER:
             # Just like .store, if this DataSet is on the DataServer,
             # we defer to the copy there and execute this same method.
+            self.flush_stores()
+            self._stop_store_flusher()
             self.data_manager.ask('finalize_data')
         elif self.mode == DataMode.LOCAL:
             # You will always end up in this block, either in the copy
             # on the server (if you hit the if statement above) or else here
+            if self._compactor is not None:
+                # a compaction still running is dropped, not applied
+                self._compactor.close()
+                self._compactor = None
+
             self.write()
 
-            if hasattr(self.formatter, 'close_file'):
+            if self._writer is not None:
+                # waits for pending writes and closes the writer's files
+                writer, self._writer = self._writer, None
+                writer.close()
+            elif hasattr(self.formatter, 'close_file'):
                 self.formatter.close_file(self)
+
+            if self._journal is not None:
+                # everything in the journal is on disk now
+                self._journal.close(remove=True)
+                self._journal = None
         else:
             raise RuntimeError('This mode does not allow finalizing',
                                self.mode)
         self.save_metadata()
 
+        # release the files the io manager kept open for appending
+        close_files = getattr(self.io, 'close_files', None)
+        if (self.mode == DataMode.LOCAL and self.location is not False and
+                close_files is not None):
+            close_files(self.location)
+
+        # and the temporary files of arrays over the memory budget
+        for array in self.arrays.values():
+            array.release_spill()
+
     def snapshot(self, update=False):
         """JSON state of the DataSet."""
         array_snaps = {}
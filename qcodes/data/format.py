@@ -1,4 +1,4 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from traceback import format_exc
 from operator import attrgetter
 import logging
@@ -31,6 +31,10 @@ class Formatter:
       ``read``, this method should call ``read_metadata``, but keep it also
       as a separate method because it occasionally gets called independently.
 
+    - ``read_lazy``: optionally, to create the ``DataArray``\s with their
+      shapes but defer reading the data itself until each array is first
+      accessed. The base class just calls ``read``.
+
     All of these methods accept a ``data_set`` argument, which should be a
     ``DataSet`` object. Even if you are loading a new data set from disk, this
     object should already have attributes:
@@ -106,6 +110,155 @@ class Formatter:
                     logging.warning('error reading file ' + fn)
                     logging.warning(format_exc())
 
+    def read_lazy(self, data_set):
+        """
+        Read the metadata and array descriptors of a ``DataSet``.
+
+        Subclasses that can find the array ids and shapes without parsing all
+        the data should override this to create the ``DataArray``\s without
+        data, and attach a loader to each one (``DataArray.set_loader``) so
+        the data is read the first time it's accessed. The default
+        implementation reads everything right away.
+
+        Args:
+            data_set (DataSet): the data to read into, as in ``read``.
+        """
+        self.read(data_set)
+
+    def read_region(self, data_set, array_id, region):
+        """
+        Read part of one array.
+
+        Formatters that can read part of an array without loading all of
+        it (like ``ChunkedFormat``) override this, so reductions like
+        ``reduce_array`` can work on data larger than memory. The default
+        loads the whole array into ``data_set`` (reading it with
+        ``read_lazy`` if it isn't there) and slices it.
+
+        Args:
+            data_set (DataSet): the data to read from.
+
+            array_id (str): the array to read.
+
+            region (Tuple[Union[slice, int]]): the part to read, as in numpy
+                indexing.
+
+        Returns:
+            numpy.ndarray: the data in the region.
+        """
+        if array_id not in data_set.arrays:
+            self.read_lazy(data_set)
+        return data_set.arrays[array_id].ndarray[region]
+
+    def read_part(self, data_set, arrays=None, region=None):
+        """
+        Read only some arrays of a ``DataSet``, and only part of each.
+
+        The array descriptors are read with ``read_lazy``, then the data of
+        each requested array and its setpoint arrays with ``read_region``.
+        Formatters that override both (like ``ChunkedFormat`` and
+        ``HDF5Format``) only read what is needed from storage. Others read
+        everything and keep the part that was asked for.
+
+        The arrays hold just that part, so their shapes can be smaller than
+        what was saved. Such a ``DataSet`` is for analysis: writing it back
+        to the same location would overwrite the rest.
+
+        Args:
+            data_set (DataSet): the data to read into, as in ``read``.
+                Arrays that weren't requested are removed from it.
+
+            arrays (Optional[Sequence[str]]): the ``array_id`` of each array
+                to read. Their setpoint arrays are always read too. Default
+                None, all arrays.
+
+            region (Optional[Dict[slice]]): ``{axis: slice}``, the part of
+                each axis to read, with axes named by the ``array_id`` or
+                ``name`` of their setpoint arrays. Default None, all of
+                every axis.
+
+        Raises:
+            ValueError: if an array or an axis isn't in the DataSet, or a
+                region isn't a slice.
+        """
+        self.read_lazy(data_set)
+        region = region or {}
+        if arrays is None:
+            arrays = list(data_set.arrays)
+
+        selected = OrderedDict()
+
+        def set_arrays(array):
+            # setpoints read from some files don't list themselves
+            axes = tuple(array.set_arrays)
+            if array.is_setpoint and len(axes) == len(array.shape) - 1:
+                axes += (array,)
+            return axes
+
+        def select(array):
+            if array.array_id not in selected:
+                selected[array.array_id] = array
+                for set_array in set_arrays(array):
+                    select(set_array)
+
+        for array_id in arrays:
+            if array_id not in data_set.arrays:
+                raise ValueError('no array {} in DataSet <{}>'.format(
+                    array_id, data_set.location))
+            select(data_set.arrays[array_id])
+
+        axes = {}
+        for array in selected.values():
+            for set_array in set_arrays(array):
+                for key in (set_array.name, set_array.array_id):
+                    if key is not None:
+                        axes.setdefault(key, set_array)
+        slices = {}
+        for axis, index in region.items():
+            if axis not in axes:
+                raise ValueError('no setpoint axis {} in the arrays '
+                                 'read'.format(axis))
+            if not isinstance(index, slice):
+                raise ValueError('regions must be slices, not ' +
+                                 repr(index))
+            slices[axes[axis].array_id] = index
+
+        parts = {}
+        for array_id, array in selected.items():
+            index = tuple(slices.get(set_array.array_id, slice(None))
+                          for set_array in set_arrays(array))
+            parts[array_id] = self.read_region(data_set, array_id, index)
+
+        for array_id in list(data_set.arrays):
+            if array_id not in selected:
+                del data_set.arrays[array_id]
+        for array_id, data in parts.items():
+            array = data_set.arrays[array_id]
+            array.set_loader(None)
+            array.ndarray = None
+            array.shape = data.shape
+            array.init_data(data)
+            array.modified_range = None
+            array.last_saved_index = None
+
+    def read_new(self, data_set):
+        """
+        Read only what was added to storage since ``data_set`` was read.
+
+        Lets ``DataSet.sync`` follow a measurement that another process is
+        writing, without a ``DataServer``. Formatters that can't read
+        only the new data don't override this.
+
+        Args:
+            data_set (DataSet): the data to update, previously read with
+                ``read`` or ``read_lazy``.
+
+        Returns:
+            bool: False if the new data can't be read this way, so nothing
+                was read. Always False by default.
+        """
+        return False
+
     def write_metadata(self, data_set, io_manager, location, read_first=True):
         """
         Write the metadata for this DataSet to storage.
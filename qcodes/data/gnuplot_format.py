@@ -1,11 +1,15 @@
 import numpy as np
 import re
-import math
 import json
+import logging
+import os
+from functools import partial
+from traceback import format_exc
 
 from qcodes.utils.helpers import deep_update, NumpyJSONEncoder
 from .data_array import DataArray
 from .format import Formatter
+from .io import MemoryIO
 
 
 class GNUPlotFormat(Formatter):
@@ -28,11 +32,19 @@ class GNUPlotFormat(Formatter):
             by just the string after stripping whitespace.
 
         number_format (default 'g'): from the format mini-language, how to
-            format numeric data into a string
+            format numeric data into a string. Arrays with an integer dtype
+            are always written as integers, and complex arrays as real and
+            imaginary parts in this format, like ``1.5-2j``.
 
         always_nest (default True): whether to always make a folder for files
             or just make a single data file if all data has the same setpoints
 
+        metadata_file (default 'snapshot.json'): name of the metadata file
+
+        metadata_indent (default None): indentation of the metadata JSON.
+            None writes compact JSON, which is several times faster to
+            encode than indented JSON. Use eg 4 for human-readable files.
+
     These files are basically tab-separated values, but any quantity of
     any whitespace characters is accepted.
 
@@ -64,11 +76,17 @@ class GNUPlotFormat(Formatter):
     one blank line for each loop level that resets. (gnuplot *does* seem to
     use 2 blank lines sometimes, to denote a whole new dataset, which sort
     of corresponds to our situation.)
+
+    If the outer dimension is appendable (see ``DataArray.extend``), its
+    size is followed by '+', like ``# 100+\t250``: the file keeps growing
+    by appending lines, and readers extend the arrays to hold them all.
     """
 
     def __init__(self, extension='dat', terminator='\n', separator='\t',
-                 comment='# ', number_format='g', metadata_file=None):
+                 comment='# ', number_format='g', metadata_file=None,
+                 metadata_indent=None):
         self.metadata_file = metadata_file or 'snapshot.json'
+        self.metadata_indent = metadata_indent
         # file extension: accept either with or without leading dot
         self.extension = '.' + extension.lstrip('.')
 
@@ -93,6 +111,9 @@ class GNUPlotFormat(Formatter):
 
         # number format (only used for writing; will read any number)
         self.number_format = '{:' + number_format + '}'
+        # complex values are written like 1.5-2j, which python can parse
+        self.complex_format = ('{0.real:' + number_format + '}{0.imag:+' +
+                               number_format.lstrip('+- ') + '}j')
 
     def read_one_file(self, data_set, f, ids_read):
         """
@@ -111,10 +132,204 @@ class GNUPlotFormat(Formatter):
         if not f.name.endswith(self.extension):
             return
 
+        set_arrays, data_arrays = self._read_header(data_set, f, ids_read)
+        state = _FileState(set_arrays, data_arrays, self)
+        self._read_lines(state, f)
+        state.offset = f.tell()
+        self._mark_read(state)
+        self._file_states(data_set)[os.path.basename(f.name)] = state
+
+    def _read_lines(self, state, lines, final=True):
+        set_arrays = state.set_arrays
+        data_arrays = state.data_arrays
+        set_fills = state.set_fills
+        converters = state.converters
+        ndim = len(set_arrays)
+
+        indices = state.indices
+        first_point = state.first_point
+        resetting = state.resetting
+        for line in lines:
+            if line[-1:] not in ('\n', '\r'):
+                # the last line may still be being written: remember where
+                # we were before it, to parse it again when it's complete
+                state.partial = line
+                state.rollback = (list(indices), first_point, resetting)
+                if not final:
+                    break
+
+            if self._is_comment(line):
+                continue
+
+            # ignore leading or trailing whitespace (including in blank lines)
+            line = line.strip()
+
+            if not line:
+                # each consecutive blank line implies one more loop to reset
+                # when we read the next data point. Don't depend on the number
+                # of setpoints that change, as there could be weird cases, like
+                # bidirectional sweeps, or highly diagonal sweeps, where this
+                # is incorrect. Anyway this really only matters for >2D sweeps.
+                if not first_point:
+                    resetting += 1
+                continue
+
+            if converters is None:
+                values = tuple(map(float, line.split()))
+            else:
+                values = tuple(c(v) for c, v in
+                               zip(converters, line.split()))
+
+            if resetting:
+                indices[-resetting - 1] += 1
+                indices[-resetting:] = [0] * resetting
+                resetting = 0
+
+            if state.appendable and indices[0] >= set_arrays[0].shape[0]:
+                for array in set_arrays + tuple(data_arrays):
+                    array.extend(indices[0] + 1)
+
+            for value, set_array, fill in zip(values[:ndim], set_arrays,
+                                              set_fills):
+                nparray = set_array.ndarray
+                myindices = tuple(indices[:nparray.ndim])
+                stored_value = nparray[myindices]
+                if stored_value == fill or stored_value != stored_value:
+                    nparray[myindices] = value
+                elif stored_value != value:
+                    raise ValueError('inconsistent setpoint values',
+                                     stored_value, value, set_array.name,
+                                     myindices, indices)
+
+            for value, data_array in zip(values[ndim:], data_arrays):
+                # set .ndarray directly to avoid the overhead of __setitem__
+                # which updates modified_range on every call
+                data_array.ndarray[tuple(indices)] = value
+
+            indices[-1] += 1
+            first_point = False
+
+        state.first_point = first_point
+        state.resetting = resetting
+
+    def _mark_read(self, state):
+        # Since we skipped __setitem__, back up to the last read point and
+        # mark it as saved that far.
+        # Using mark_saved is better than directly setting last_saved_index
+        # because it also ensures modified_range is set correctly.
+        indices = list(state.indices)
+        indices[-1] -= 1
+        for array in state.set_arrays + tuple(state.data_arrays):
+            array.mark_saved(array.flat_index(indices[:array.ndim]))
+
+    @staticmethod
+    def _file_states(data_set):
+        # {file name: _FileState} of every data file read into this DataSet
+        # (None while a lazy read hasn't loaded it yet), so read_new can
+        # continue where the last read stopped
+        states = getattr(data_set, '_gnuplot_files', None)
+        if states is None:
+            states = data_set._gnuplot_files = {}
+        return states
+
+    def read_new(self, data_set):
+        """
+        Read only the lines appended to the data files since the last read.
+
+        The position and parsing state of each file are kept from the last
+        ``read`` (or ``read_new``), so a process watching a running
+        measurement doesn't have to parse everything again each time. New
+        files, and files that have become shorter (rewritten), are read
+        completely. The metadata is read again if it has changed.
+
+        Args:
+            data_set (DataSet): a DataSet that was read with this formatter.
+
+        Returns:
+            bool: False if ``data_set`` was never read with this formatter
+                (nothing is read then), otherwise True.
+        """
+        states = getattr(data_set, '_gnuplot_files', None)
+        if states is None:
+            return False
+
+        io_manager = data_set.io
+        location = data_set.location
+
+        fn = io_manager.join(location, self.metadata_file)
+        stamp = self._file_stamp(io_manager, fn)
+        if stamp is None or stamp != getattr(data_set,
+                                             '_gnuplot_metadata_read', None):
+            self.read_metadata(data_set)
+            data_set._gnuplot_metadata_read = stamp
+
+        for fn in io_manager.list(location):
+            if not fn.endswith(self.extension):
+                continue
+            name = os.path.basename(fn)
+            if name in states and states[name] is None:
+                # lazy, and not loaded yet: the loader reads all of it
+                continue
+
+            with io_manager.open(fn, 'r') as f:
+                try:
+                    state = states.get(name)
+                    if state is not None and self._read_tail(state, f):
+                        continue
+                    # don't clear setpoints that other files filled
+                    ids_read = {array.array_id
+                                for other in states.values()
+                                if other is not None and other is not state
+                                for array in other.set_arrays}
+                    f.seek(0)
+                    self.read_one_file(data_set, f, ids_read)
+                except ValueError:
+                    logging.warning('error reading file ' + fn)
+                    logging.warning(format_exc())
+
+        return True
+
+    def _read_tail(self, state, f):
+        # read the lines after state.offset. False if the file is shorter
+        # than that, ie it was rewritten and must be read from the start
+        end = f.seek(0, os.SEEK_END)
+        if end < state.offset:
+            return False
+        f.seek(state.offset)
+        text = f.read()
+        state.offset = f.tell()
+        if not text:
+            return True
+
+        if state.partial:
+            text = state.partial + text
+            indices, state.first_point, state.resetting = state.rollback
+            state.indices[:] = indices
+            state.partial = ''
+        self._read_lines(state, text.splitlines(True), final=False)
+        self._mark_read(state)
+        return True
+
+    def _read_header(self, data_set, f, ids_read, lazy=False):
+        """
+        Read the three header lines of a data file and find or create the
+        DataArrays they describe.
+
+        Unless ``lazy``, new arrays are initialized and existing ones cleared
+        so the data lines can be read into them.
+
+        Returns:
+            Tuple[Tuple[DataArray], List[DataArray]]: the setpoint arrays and
+                the measured arrays in this file, in column order.
+        """
         arrays = data_set.arrays
         ids = self._read_comment_line(f).split()
         labels = self._get_labels(self._read_comment_line(f))
-        shape = tuple(map(int, self._read_comment_line(f).split()))
+        sizes = self._read_comment_line(f).split()
+        appendable = bool(sizes) and sizes[0].endswith('+')
+        if appendable:
+            sizes[0] = sizes[0][:-1]
+        shape = tuple(map(int, sizes))
         ndim = len(shape)
 
         set_arrays = ()
@@ -128,20 +343,25 @@ class GNUPlotFormat(Formatter):
             set_shape = shape[: i + 1]
             if array_id in arrays:
                 set_array = arrays[array_id]
-                if set_array.shape != set_shape:
+                # appendable arrays may be longer than the file says
+                checked = 1 if appendable else 0
+                if tuple(set_array.shape[checked:]) != set_shape[checked:]:
                     raise ValueError(
                         'shapes do not match for set array: ' + array_id)
-                if array_id not in ids_read:
+                if array_id not in ids_read and not lazy:
                     # it's OK for setpoints to be duplicated across
                     # multiple files, but we should only empty the
                     # array out the first time we see it, so subsequent
                     # reads can check for consistency
                     set_array.clear()
+                set_array.appendable = set_array.appendable or appendable
             else:
                 set_array = DataArray(label=labels[i], array_id=array_id,
                                       set_arrays=set_arrays, shape=set_shape,
-                                      is_setpoint=True, snapshot=snap)
-                set_array.init_data()
+                                      is_setpoint=True, snapshot=snap,
+                                      appendable=appendable)
+                if not lazy:
+                    set_array.init_data()
                 data_set.add_array(set_array)
 
             set_arrays = set_arrays + (set_array, )
@@ -156,69 +376,72 @@ class GNUPlotFormat(Formatter):
 
             if array_id in arrays:
                 data_array = arrays[array_id]
-                data_array.clear()
+                data_array.appendable = data_array.appendable or appendable
+                if not lazy:
+                    data_array.clear()
             else:
                 data_array = DataArray(label=labels[i], array_id=array_id,
                                        set_arrays=set_arrays, shape=shape,
-                                       snapshot=snap)
-                data_array.init_data()
+                                       snapshot=snap, appendable=appendable)
+                if not lazy:
+                    data_array.init_data()
                 data_set.add_array(data_array)
             data_arrays.append(data_array)
             ids_read.add(array_id)
 
-        indices = [0] * ndim
-        first_point = True
-        resetting = 0
-        for line in f:
-            if self._is_comment(line):
-                continue
+        return set_arrays, data_arrays
 
-            # ignore leading or trailing whitespace (including in blank lines)
-            line = line.strip()
-
-            if not line:
-                # each consecutive blank line implies one more loop to reset
-                # when we read the next data point. Don't depend on the number
-                # of setpoints that change, as there could be weird cases, like
-                # bidirectional sweeps, or highly diagonal sweeps, where this
-                # is incorrect. Anyway this really only matters for >2D sweeps.
-                if not first_point:
-                    resetting += 1
-                continue
-
-            values = tuple(map(float, line.split()))
+    def read_lazy(self, data_set):
+        """
+        Read the metadata and the header of each data file, deferring
+        the data itself.
 
-            if resetting:
-                indices[-resetting - 1] += 1
-                indices[-resetting:] = [0] * resetting
-                resetting = 0
+        Every array gets a loader that reads its whole file the first time
+        any array in that file is accessed.
 
-            for value, set_array in zip(values[:ndim], set_arrays):
-                nparray = set_array.ndarray
-                myindices = tuple(indices[:nparray.ndim])
-                stored_value = nparray[myindices]
-                if math.isnan(stored_value):
-                    nparray[myindices] = value
-                elif stored_value != value:
-                    raise ValueError('inconsistent setpoint values',
-                                     stored_value, value, set_array.name,
-                                     myindices, indices)
+        Args:
+            data_set (DataSet): the data to read into, as in ``read``.
+        """
+        io_manager = data_set.io
+        location = data_set.location
 
-            for value, data_array in zip(values[ndim:], data_arrays):
-                # set .ndarray directly to avoid the overhead of __setitem__
-                # which updates modified_range on every call
-                data_array.ndarray[tuple(indices)] = value
+        data_files = io_manager.list(location)
+        if not data_files:
+            raise IOError('no data found at ' + location)
 
-            indices[-1] += 1
-            first_point = False
+        self.read_metadata(data_set)
 
-        # Since we skipped __setitem__, back up to the last read point and
-        # mark it as saved that far.
-        # Using mark_saved is better than directly setting last_saved_index
-        # because it also ensures modified_range is set correctly.
-        indices[-1] -= 1
-        for array in set_arrays + tuple(data_arrays):
-            array.mark_saved(array.flat_index(indices[:array.ndim]))
+        ids_read = set()
+        for fn in data_files:
+            if not fn.endswith(self.extension):
+                continue
+            with io_manager.open(fn, 'r') as f:
+                try:
+                    set_arrays, data_arrays = self._read_header(
+                        data_set, f, ids_read, lazy=True)
+                except ValueError:
+                    logging.warning('error reading file ' + fn)
+                    logging.warning(format_exc())
+                    continue
+
+            self._file_states(data_set)[os.path.basename(fn)] = None
+            file_arrays = set_arrays + tuple(data_arrays)
+            loader = partial(self._load_file, data_set, fn, file_arrays)
+            for array in file_arrays:
+                # don't touch .ndarray of an array that is already waiting
+                # for another file, or we would load it right now
+                if array.is_loaded and array.ndarray is None:
+                    array.set_loader(loader)
+
+    def _load_file(self, data_set, fn, file_arrays):
+        # setpoint arrays may be shared with other files; whichever file is
+        # read first fills them completely, so detach all pending loaders
+        for array in file_arrays:
+            array.set_loader(None)
+            array.init_data()
+
+        with data_set.io.open(fn, 'r') as f:
+            self.read_one_file(data_set, f, set())
 
     def _is_comment(self, line):
         return line[:self.comment_len] == self.comment_chars
@@ -277,6 +500,9 @@ class GNUPlotFormat(Formatter):
                 if overwrite:
                     f.write(self._make_header(group))
 
+                formats = [self._number_format(array) for array in
+                           group.set_arrays + group.data]
+
                 for i in range(save_range[0], save_range[1] + 1):
                     indices = np.unravel_index(i, shape)
 
@@ -289,7 +515,7 @@ class GNUPlotFormat(Formatter):
                                 f.write(self.terminator * j)
                             break
 
-                    one_point = self._data_point(group, indices)
+                    one_point = self._data_point(group, indices, formats)
                     f.write(self.separator.join(one_point) + self.terminator)
 
             # now that we've saved the data, mark it as such in the data.
@@ -311,6 +537,11 @@ class GNUPlotFormat(Formatter):
         """
         Write all metadata in this DataSet to storage.
 
+        The metadata file is only rewritten if the metadata has changed since
+        this DataSet last wrote it. If the file is unchanged since that
+        write, it holds nothing that isn't already in memory, so it is not
+        read back even if ``read_first`` is True.
+
         Args:
             data_set (DataSet): the data we're storing
 
@@ -324,7 +555,14 @@ class GNUPlotFormat(Formatter):
                 not present in the current metadata, it will be retained.
                 Default True.
         """
-        if read_first:
+        fn = io_manager.join(location, self.metadata_file)
+        key = (io_manager.base_location, fn)
+        last = getattr(data_set, '_gnuplot_metadata_written', None)
+        ours = (last is not None and last[0] == key and
+                last[1] is not None and
+                last[1] == self._file_stamp(io_manager, fn))
+
+        if read_first and not ours:
             # In case the saved file has more metadata than we have here,
             # read it in first. But any changes to the in-memory copy should
             # override the saved file data.
@@ -333,10 +571,31 @@ class GNUPlotFormat(Formatter):
             self.read_metadata(data_set)
             deep_update(data_set.metadata, memory_metadata)
 
-        fn = io_manager.join(location, self.metadata_file)
+        # with indent=None, dumps uses the C encoder, json.dump never does
+        text = json.dumps(data_set.metadata, sort_keys=True,
+                          indent=self.metadata_indent, ensure_ascii=False,
+                          cls=NumpyJSONEncoder)
+        if ours and text == last[2]:
+            return
+
         with io_manager.open(fn, 'w', encoding='utf8') as snap_file:
-            json.dump(data_set.metadata, snap_file, sort_keys=True,
-                      indent=4, ensure_ascii=False, cls=NumpyJSONEncoder)
+            snap_file.write(text)
+
+        data_set._gnuplot_metadata_written = (
+            key, self._file_stamp(io_manager, fn), text)
+
+    @staticmethod
+    def _file_stamp(io_manager, fn):
+        # modification time and size of a file, to tell whether anyone else
+        # has written it. None if the io_manager has no local files (the
+        # to_path of a MemoryIO only makes a copy).
+        if isinstance(io_manager, MemoryIO):
+            return None
+        try:
+            stat = os.stat(io_manager.to_path(fn))
+        except (AttributeError, OSError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
     def read_metadata(self, data_set):
         io_manager = data_set.io
@@ -358,6 +617,8 @@ class GNUPlotFormat(Formatter):
         shape = [str(size) for size in group.set_arrays[-1].shape]
         if len(shape) != len(group.set_arrays):
             raise ValueError('array dimensionality does not match setpoints')
+        if group.set_arrays[0].appendable:
+            shape[0] += '+'
 
         out = (self._comment_line(ids) + self._comment_line(labels) +
                self._comment_line(shape))
@@ -367,9 +628,58 @@ class GNUPlotFormat(Formatter):
     def _comment_line(self, items):
         return self.comment + self.separator.join(items) + self.terminator
 
-    def _data_point(self, group, indices):
+    def _number_parser(self, array):
+        dtype = array.declared_dtype
+        if dtype is None or dtype.kind == 'f':
+            return float
+        return complex if dtype.kind == 'c' else int
+
+    def _number_format(self, array):
+        dtype = array.declared_dtype
+        if dtype is not None and dtype.kind in 'iu':
+            # exact, however large
+            return '{:d}'
+        if dtype is not None and dtype.kind == 'c':
+            return self.complex_format
+        return self.number_format
+
+    def _data_point(self, group, indices, formats):
+        formats = iter(formats)
         for array in group.set_arrays:
-            yield self.number_format.format(array[indices[:array.ndim]])
+            yield next(formats).format(array[indices[:array.ndim]])
 
         for array in group.data:
-            yield self.number_format.format(array[indices])
+            yield next(formats).format(array[indices])
+
+
+class _FileState:
+
+    """Where and how far ``GNUPlotFormat`` has read one data file."""
+
+    def __init__(self, set_arrays, data_arrays, formatter):
+        self.set_arrays = set_arrays
+        self.data_arrays = data_arrays
+        self.appendable = bool(set_arrays) and set_arrays[0].appendable
+
+        # unmeasured setpoints are nan (which never equals itself) unless
+        # the array has an integer dtype
+        self.set_fills = [set_array.fill_value for set_array in set_arrays]
+
+        # integers and complex numbers are parsed as such, so large
+        # integers stay exact
+        converters = tuple(formatter._number_parser(array)
+                           for array in set_arrays + tuple(data_arrays))
+        self.converters = (None if all(c is float for c in converters)
+                           else converters)
+
+        # the parser position: index of the next point, and blank lines
+        # seen since the last one
+        self.indices = [0] * len(set_arrays)
+        self.first_point = True
+        self.resetting = 0
+
+        # position in the file after the last read, and the unterminated
+        # last line with the parser position before it
+        self.offset = 0
+        self.partial = ''
+        self.rollback = None
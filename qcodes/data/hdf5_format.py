@@ -1,8 +1,12 @@
 import numpy as np
+import json
 import logging
 import h5py
 import os
+from copy import deepcopy
+from functools import partial
 
+from qcodes.utils.helpers import NumpyJSONEncoder
 from .data_array import DataArray
 from .format import Formatter
 
@@ -12,8 +16,28 @@ class HDF5Format(Formatter):
     HDF5 formatter for saving qcodes datasets.
 
     Capable of storing (write) and recovering (read) qcodes datasets.
+
+    Args:
+        compact_metadata (bool): store the metadata as one gzip-compressed
+            JSON dataset ('metadata_json') instead of a tree of HDF5 groups
+            and attributes ('metadata'). This is much faster to write and
+            read for large snapshots. Either layout can be read regardless of
+            this setting. Default False.
+
+        metadata_index (Sequence[str], optional): dotted paths into the
+            metadata, such as ``'station.instruments.gates.parameters.chan0
+            .value'``, to copy into JSON-encoded attributes of the compact
+            metadata dataset, so they can be read without decoding the whole
+            snapshot. See ``read_metadata_index``. Only used with
+            ``compact_metadata``.
     """
 
+    metadata_json = 'metadata_json'
+
+    def __init__(self, compact_metadata=False, metadata_index=()):
+        self.compact_metadata = compact_metadata
+        self.metadata_index = tuple(metadata_index)
+
     def close_file(self, data_set):
         """
         Closes the hdf5 file open in the dataset.
@@ -59,31 +83,17 @@ class HDF5Format(Formatter):
             name = array_id  # will be overwritten if not in file
             dat_arr = data_set._h5_base_group['Data Arrays'][array_id]
 
-            # write ensures these attributes always exist
-            name = dat_arr.attrs['name'].decode()
-            label = dat_arr.attrs['label'].decode()
-
-            # get unit from units if no unit field, for backward compatibility
-            if 'unit' in dat_arr.attrs:
-                unit = dat_arr.attrs['unit'].decode()
-            else:
-                unit = dat_arr.attrs['units'].decode()
-
-            is_setpoint = str_to_bool(dat_arr.attrs['is_setpoint'].decode())
-            # if not is_setpoint:
-            set_arrays = dat_arr.attrs['set_arrays']
-            set_arrays = [s.decode() for s in set_arrays]
-            # else:
-            #     set_arrays = ()
-            vals = dat_arr.value[:, 0]
-            if 'shape' in dat_arr.attrs.keys():
-                vals = vals.reshape(dat_arr.attrs['shape'])
+            name, label, unit, is_setpoint, set_arrays = \
+                self._read_array_attrs(dat_arr)
+            vals = self._read_array_vals(dat_arr)
             if array_id not in data_set.arrays.keys():  # create new array
                 d_array = DataArray(
                     name=name, array_id=array_id, label=label, parameter=None,
                     unit=unit,
                     is_setpoint=is_setpoint, set_arrays=(),
-                    preset_data=vals)
+                    preset_data=vals,
+                    appendable=bool(dat_arr.attrs.get('appendable', False)),
+                    **self._read_array_dtype(dat_arr))
                 data_set.add_array(d_array)
             else:  # update existing array with extracted values
                 d_array = data_set.arrays[array_id]
@@ -104,6 +114,143 @@ class HDF5Format(Formatter):
         data_set = self.read_metadata(data_set)
         return data_set
 
+    def read_lazy(self, data_set, location=None):
+        """
+        Reads the array attributes and metadata of an hdf5 file, leaving
+        the hdf5 datasets themselves to be read when each array is first
+        accessed.
+        """
+        self._open_file(data_set, location)
+
+        arr_group = data_set._h5_base_group['Data Arrays']
+        for array_id in arr_group.keys():
+            dat_arr = arr_group[array_id]
+            name, label, unit, is_setpoint, set_arrays = \
+                self._read_array_attrs(dat_arr)
+            if 'shape' in dat_arr.attrs.keys():
+                shape = tuple(dat_arr.attrs['shape'])
+            else:
+                shape = (dat_arr.shape[0], )
+
+            if array_id not in data_set.arrays.keys():
+                d_array = DataArray(
+                    name=name, array_id=array_id, label=label, unit=unit,
+                    is_setpoint=is_setpoint, shape=shape,
+                    appendable=bool(dat_arr.attrs.get('appendable', False)),
+                    **self._read_array_dtype(dat_arr))
+                data_set.add_array(d_array)
+            else:
+                d_array = data_set.arrays[array_id]
+                d_array.name = name
+                d_array.label = label
+                d_array.unit = unit
+                d_array.is_setpoint = is_setpoint
+                d_array.shape = shape
+                d_array.ndarray = None
+            d_array.set_loader(partial(self._load_array, data_set, array_id))
+            d_array._sa_array_ids = set_arrays
+
+        for array_id, d_array in data_set.arrays.items():
+            d_array.set_arrays = tuple(data_set.arrays[sa_id]
+                                       for sa_id in d_array._sa_array_ids)
+        data_set = self.read_metadata(data_set)
+        return data_set
+
+    def _load_array(self, data_set, array_id):
+        if not hasattr(data_set, '_h5_base_group'):
+            self._open_file(data_set)
+        dat_arr = data_set._h5_base_group['Data Arrays'][array_id]
+        data_set.arrays[array_id].init_data(self._read_array_vals(dat_arr))
+
+    def read_region(self, data_set, array_id, region):
+        """
+        Read part of one array, selecting from the file (as an hdf5
+        hyperslab) only the rows of the outermost dimension it overlaps.
+
+        The DataSet's own arrays are neither needed nor changed.
+
+        Args:
+            data_set (DataSet): supplies ``io`` and ``location``.
+
+            array_id (str): the array to read.
+
+            region (Tuple[Union[slice, int]]): the part to read, as in numpy
+                indexing. Missing trailing dimensions are read whole.
+
+        Returns:
+            numpy.ndarray: the data in the region. Points that were never
+                written hold the fill value of the array.
+        """
+        if not hasattr(data_set, '_h5_base_group'):
+            self._open_file(data_set)
+        dat_arr = data_set._h5_base_group['Data Arrays'][array_id]
+        if 'shape' not in dat_arr.attrs.keys() or dat_arr.attrs.get(
+                'broadcast', 0):
+            # flat, or broadcast data that is stored only once anyway
+            return self._read_array_vals(dat_arr)[region]
+
+        shape = tuple(int(n) for n in dat_arr.attrs['shape'])
+        if not isinstance(region, tuple):
+            region = (region,)
+        outer = range(shape[0])[region[0]]
+        if isinstance(outer, int):
+            lo, hi, rows = outer, outer + 1, 0
+        elif len(outer):
+            lo = min(outer[0], outer[-1])
+            hi = max(outer[0], outer[-1]) + 1
+            rows = slice(outer.start - lo,
+                         outer.stop - lo if outer.stop >= lo else None,
+                         outer.step)
+        else:
+            lo, hi, rows = 0, 0, slice(0, 0)
+
+        # the rows are contiguous in the flattened dataset
+        row_size = int(np.prod(shape[1:]))
+        start, stop = lo * row_size, hi * row_size
+        dtype = self._read_array_dtype(dat_arr)
+        block = np.full(stop - start, dtype.get('fill_value', np.nan),
+                        dtype=dtype.get('dtype', float))
+        saved_stop = min(stop, dat_arr.shape[0])
+        if saved_stop > start:
+            block[:saved_stop - start] = dat_arr[start:saved_stop, 0]
+        block = block.reshape((hi - lo,) + shape[1:])
+        return block[(rows,) + region[1:]]
+
+    def _read_array_attrs(self, dat_arr):
+        # write ensures these attributes always exist
+        name = dat_arr.attrs['name'].decode()
+        label = dat_arr.attrs['label'].decode()
+
+        # get unit from units if no unit field, for backward compatibility
+        if 'unit' in dat_arr.attrs:
+            unit = dat_arr.attrs['unit'].decode()
+        else:
+            unit = dat_arr.attrs['units'].decode()
+
+        is_setpoint = str_to_bool(dat_arr.attrs['is_setpoint'].decode())
+        set_arrays = [s.decode() for s in dat_arr.attrs['set_arrays']]
+        return name, label, unit, is_setpoint, set_arrays
+
+    def _read_array_dtype(self, dat_arr):
+        # only arrays with a declared dtype record it
+        if 'dtype' not in dat_arr.attrs:
+            return {}
+        dtype_attrs = {'dtype': dat_arr.dtype}
+        if 'fill_value' in dat_arr.attrs:
+            dtype_attrs['fill_value'] = dat_arr.attrs['fill_value']
+        return dtype_attrs
+
+    def _read_array_vals(self, dat_arr):
+        vals = dat_arr[:, 0]
+        if 'shape' in dat_arr.attrs.keys():
+            shape = tuple(dat_arr.attrs['shape'])
+            # broadcast arrays only store the data they repeat
+            repeats = int(dat_arr.attrs.get('broadcast', 0))
+            vals = vals.reshape(shape[repeats:])
+            if repeats:
+                vals = np.broadcast_to(vals, shape)
+        return vals
+
     def _filepath_from_location(self, location, io_manager):
         filename = os.path.split(location)[-1]
         filepath = io_manager.to_path(location +
@@ -124,6 +271,17 @@ class HDF5Format(Formatter):
         data_set._h5_base_group = self._create_file(filepath)
         return data_set._h5_base_group
 
+    def _is_open_at(self, data_set, io_manager=None, location=None):
+        # whether the open file of data_set is the one write would create
+        if io_manager is None:
+            io_manager = data_set.io
+        if location is None:
+            location = data_set.location
+        filepath = self._filepath_from_location(location, io_manager)
+        base_group = data_set._h5_base_group
+        return bool(base_group) and os.path.abspath(
+            base_group.file.filename) == os.path.abspath(filepath)
+
     def write(self, data_set, io_manager=None, location=None,
               force_write=False, flush=True, write_metadata=True):
         """
@@ -151,10 +309,12 @@ class HDF5Format(Formatter):
 
             - write_metadata is called at the end of write and dumps a
               dictionary to an hdf5 file. If there already is metadata it will
-              delete this and overwrite it with current metadata.
+              overwrite the parts of it that changed with current metadata.
 
         """
-        if not hasattr(data_set, '_h5_base_group') or force_write:
+        if not hasattr(data_set, '_h5_base_group') or (
+                force_write and not self._is_open_at(
+                    data_set, io_manager, location)):
             data_set._h5_base_group = self._create_data_object(
                 data_set, io_manager, location)
 
@@ -166,26 +326,45 @@ class HDF5Format(Formatter):
             arr_group = data_set._h5_base_group[data_name]
 
         for array_id in data_set.arrays.keys():
-            if array_id not in arr_group.keys() or force_write:
-                self._create_dataarray_dset(array=data_set.arrays[array_id],
-                                            group=arr_group)
+            x = data_set.arrays[array_id]
+            rewrite = False
+            if array_id in arr_group.keys() and force_write:
+                # rewriting a file that is already there: overwrite the
+                # datasets in place, as HDF5 never gives back the space of
+                # deleted ones and the file would grow with every rewrite
+                if arr_group[array_id].dtype == self._dset_dtype(x):
+                    self._write_dataarray_attrs(x, arr_group[array_id])
+                    rewrite = True
+                else:
+                    del arr_group[array_id]
+            if array_id not in arr_group.keys():
+                self._create_dataarray_dset(array=x, group=arr_group)
             dset = arr_group[array_id]
             # Resize the dataset and add the new values
 
             # dataset refers to the hdf5 dataset here
             datasetshape = dset.shape
-            old_dlen = datasetshape[0]
-            x = data_set.arrays[array_id]
-            new_dlen = len(x[~np.isnan(x)])
+            old_dlen = 0 if rewrite else datasetshape[0]
+            data, repeats = x.compact()
+            if dset.attrs.get('broadcast', 0) != repeats:
+                # written with the other layout before: start again
+                old_dlen = 0
+                dset.attrs['broadcast'] = repeats
+            if repeats:
+                # broadcast data is stored once, and can't change
+                new_dlen = data.size
+                new_vals = data.reshape(-1)[old_dlen:new_dlen]
+            else:
+                new_dlen = int(np.count_nonzero(x.measured_mask()))
+                new_vals = x[old_dlen:new_dlen]
             new_datasetshape = (new_dlen,
                                 datasetshape[1])
             dset.resize(new_datasetshape)
             new_data_shape = (new_dlen - old_dlen, datasetshape[1])
-            dset[old_dlen:new_dlen] = x[old_dlen:new_dlen].reshape(
-                new_data_shape)
+            dset[old_dlen:new_dlen] = new_vals.reshape(new_data_shape)
             # allow resizing extracted data, here so it gets written for
             # incremental writes aswell
-            dset.attrs['shape'] = x.shape
+            _set_attr(dset.attrs, 'shape', x.shape)
         if write_metadata:
             self.write_metadata(
                 data_set, io_manager=io_manager, location=location)
@@ -203,6 +382,21 @@ class HDF5Format(Formatter):
 
         creates a hdf5 datasaset that represents the data array.
         '''
+        # Create the hdf5 dataset, in the declared dtype if there is one.
+        # h5py stores complex values natively, as (r, i) compounds
+        dset = group.create_dataset(
+            array.array_id, (0, 1),
+            maxshape=(None, 1), dtype=array.declared_dtype)
+        self._write_dataarray_attrs(array, dset)
+
+        return dset
+
+    def _dset_dtype(self, array):
+        # the dtype _create_dataarray_dset gives the dataset of this array
+        dtype = array.declared_dtype
+        return np.dtype('f4') if dtype is None else dtype
+
+    def _write_dataarray_attrs(self, array, dset):
         # Check for empty meta attributes, use array_id if name and/or label
         # is not specified
         if array.label is not None:
@@ -215,23 +409,34 @@ class HDF5Format(Formatter):
         else:
             name = array.array_id
 
-        # Create the hdf5 dataset
-        dset = group.create_dataset(
-            array.array_id, (0, 1),
-            maxshape=(None, 1))
-        dset.attrs['label'] = _encode_to_utf8(str(label))
-        dset.attrs['name'] = _encode_to_utf8(str(name))
-        dset.attrs['unit'] = _encode_to_utf8(str(array.unit or ''))
-        dset.attrs['is_setpoint'] = _encode_to_utf8(str(array.is_setpoint))
+        attrs = {
+            'label': _encode_to_utf8(str(label)),
+            'name': _encode_to_utf8(str(name)),
+            'unit': _encode_to_utf8(str(array.unit or '')),
+            'is_setpoint': _encode_to_utf8(str(array.is_setpoint))
+        }
+        dtype = array.declared_dtype
+        if dtype is not None:
+            attrs['dtype'] = _encode_to_utf8(dtype.name)
+            if dtype.kind in 'iu':
+                attrs['fill_value'] = array.fill_value
+        if array.appendable:
+            # the dataset grows with the array, and 'shape' is kept up to date
+            attrs['appendable'] = True
 
         set_arrays = []
         # list will remain empty if array does not have set_array
         for i in range(len(array.set_arrays)):
             set_arrays += [_encode_to_utf8(
                 str(array.set_arrays[i].array_id))]
-        dset.attrs['set_arrays'] = set_arrays
+        attrs['set_arrays'] = set_arrays
 
-        return dset
+        for key in ('dtype', 'fill_value', 'appendable'):
+            # left over from an array this dataset was written for before
+            if key in dset.attrs and key not in attrs:
+                del dset.attrs[key]
+        for key, value in attrs.items():
+            _set_attr(dset.attrs, key, value)
 
     def write_metadata(self, data_set, io_manager=None, location=None, read_first=True):
         """
@@ -242,18 +447,116 @@ class HDF5Format(Formatter):
         This formatter uses io and location as specified for the main
         dataset.
         The read_first argument is ignored.
+
+        If this DataSet already wrote its metadata to the open file, only the
+        entries that changed since then are rewritten. With
+        ``compact_metadata`` the whole JSON dataset is rewritten, but only if
+        anything changed.
         """
         if not hasattr(data_set, '_h5_base_group'):
             # added here because loop writes metadata before data itself
             data_set._h5_base_group = self._create_data_object(data_set)
-        if 'metadata' in data_set._h5_base_group.keys():
-            del data_set._h5_base_group['metadata']
-        metadata_group = data_set._h5_base_group.create_group('metadata')
-        self.write_dict_to_hdf5(data_set.metadata, metadata_group)
+        base_group = data_set._h5_base_group
+
+        if self.compact_metadata:
+            self._write_metadata_json(data_set, base_group)
+            return
+        if self.metadata_json in base_group:
+            del base_group[self.metadata_json]
+
+        last = getattr(data_set, '_h5_metadata_written', None)
+        if (last is not None and last[0] is base_group and
+                'metadata' in base_group.keys()):
+            self._update_dict_in_hdf5(data_set.metadata, last[1],
+                                      base_group['metadata'])
+        else:
+            if 'metadata' in base_group.keys():
+                del base_group['metadata']
+            metadata_group = base_group.create_group('metadata')
+            self.write_dict_to_hdf5(data_set.metadata, metadata_group)
+
+        data_set._h5_metadata_written = (base_group,
+                                         deepcopy(data_set.metadata))
+
+    def _write_metadata_json(self, data_set, base_group):
+        text = json.dumps(data_set.metadata, sort_keys=True,
+                          ensure_ascii=False, cls=NumpyJSONEncoder)
+        last = getattr(data_set, '_h5_metadata_written', None)
+        if (last is not None and last[0] is base_group and
+                last[1] == text and self.metadata_json in base_group):
+            return
+
+        if 'metadata' in base_group:
+            del base_group['metadata']
+        if self.metadata_json in base_group:
+            del base_group[self.metadata_json]
+
+        blob = np.frombuffer(text.encode('utf8'), dtype=np.uint8)
+        dset = base_group.create_dataset(self.metadata_json, data=blob,
+                                         compression='gzip')
+        for key in self.metadata_index:
+            value = data_set.metadata
+            try:
+                for part in key.split('.'):
+                    value = value[part]
+            except (KeyError, TypeError, IndexError):
+                continue
+            dset.attrs[key] = json.dumps(value, cls=NumpyJSONEncoder)
+
+        data_set._h5_metadata_written = (base_group, text)
+
+    def read_metadata_index(self, data_set):
+        """
+        Read just the indexed metadata keys of a compact metadata file.
+
+        Args:
+            data_set (DataSet): a DataSet with an open file, or a location
+                to open, as for ``read_metadata``.
+
+        Returns:
+            dict: ``{dotted_key: value}`` for each key in the index when the
+            metadata was written. Empty if the metadata is not compact.
+        """
+        if not hasattr(data_set, '_h5_base_group'):
+            self._open_file(data_set)
+        base_group = data_set._h5_base_group
+        if self.metadata_json not in base_group:
+            return {}
+        return {key: json.loads(value) for key, value in
+                base_group[self.metadata_json].attrs.items()}
+
+    def _update_dict_in_hdf5(self, data_dict, old_dict, entry_point):
+        """
+        Rewrite only the entries of ``data_dict`` that differ from
+        ``old_dict``, which is what ``entry_point`` currently holds.
+        """
+        for key in old_dict:
+            if key not in data_dict:
+                self._delete_hdf5_entry(entry_point, key)
+
+        for key, item in data_dict.items():
+            if key in old_dict:
+                old_item = old_dict[key]
+                if (isinstance(item, dict) and isinstance(old_item, dict) and
+                        isinstance(entry_point.get(key), h5py.Group)):
+                    self._update_dict_in_hdf5(item, old_item,
+                                              entry_point[key])
+                    continue
+                if _metadata_equal(item, old_item):
+                    continue
+                self._delete_hdf5_entry(entry_point, key)
+            self.write_dict_to_hdf5({key: item}, entry_point)
+
+    @staticmethod
+    def _delete_hdf5_entry(entry_point, key):
+        if key in entry_point.attrs:
+            del entry_point.attrs[key]
+        if key in entry_point:
+            del entry_point[key]
 
     def write_dict_to_hdf5(self, data_dict, entry_point):
         for key, item in data_dict.items():
-            if isinstance(item, (str, bool, tuple, float, int)):
+            if isinstance(item, (str, bool, tuple, float, int, complex)):
                 entry_point.attrs[key] = item
             elif isinstance(item, np.ndarray):
                 entry_point.create_dataset(key, data=item)
@@ -270,7 +573,7 @@ class HDF5Format(Formatter):
                 if len(item) > 0:
                     elt_type = type(item[0])
                     if all(isinstance(x, elt_type) for x in item):
-                        if isinstance(item[0], (int, float,
+                        if isinstance(item[0], (int, float, complex,
                                                 np.int32, np.int64)):
 
                             entry_point.create_dataset(key,
@@ -324,11 +627,15 @@ class HDF5Format(Formatter):
         """
         # checks if there is an open file in the dataset as load_data does
         # reading of metadata before reading the complete dataset
-        if not hasattr(self, '_h5_base_group'):
+        if not hasattr(data_set, '_h5_base_group'):
             self._open_file(data_set)
         if 'metadata' in data_set._h5_base_group.keys():
             metadata_group = data_set._h5_base_group['metadata']
             self.read_dict_from_hdf5(data_set.metadata, metadata_group)
+        elif self.metadata_json in data_set._h5_base_group.keys():
+            blob = data_set._h5_base_group[self.metadata_json][()]
+            data_set.metadata.update(
+                json.loads(blob.tobytes().decode('utf8')))
         return data_set
 
     def read_dict_from_hdf5(self, data_dict, h5_group):
@@ -372,6 +679,28 @@ class HDF5Format(Formatter):
         return data_dict
 
 
+def _attr_value(value):
+    # attribute values as h5py reads them back, to compare them
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_attr_value(v) for v in value]
+    return value
+
+
+def _set_attr(attrs, key, value):
+    """
+    Set an hdf5 attribute, unless it already has this value.
+
+    Every time an attribute is set it takes new space in the file, which
+    HDF5 does not give back, so files that are rewritten often would keep
+    growing.
+    """
+    if key in attrs and _attr_value(attrs[key]) == _attr_value(value):
+        return
+    attrs[key] = value
+
+
 def _encode_to_utf8(s):
     """
     Required because h5py does not support python3 strings
@@ -387,3 +716,22 @@ def str_to_bool(s):
         return False
     else:
         raise ValueError("Cannot covert {} to a bool".format(s))
+
+
+def _metadata_equal(a, b):
+    """Exact equality of metadata values, which may contain numpy arrays."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return (a.keys() == b.keys() and
+                all(_metadata_equal(a[k], b[k]) for k in a))
+    if isinstance(a, (list, tuple)):
+        return (len(a) == len(b) and
+                all(_metadata_equal(x, y) for x, y in zip(a, b)))
+    if isinstance(a, np.ndarray):
+        return (a.shape == b.shape and a.dtype == b.dtype and
+                bool(np.array_equal(a, b)))
+    try:
+        return bool(a == b)
+    except ValueError:
+        return False
@@ -41,10 +41,15 @@ IO managers should also implement:
   or files.
 """
 
+from collections import OrderedDict
 from contextlib import contextmanager
+import io
 import os
 import re
 import shutil
+import tempfile
+import threading
+import weakref
 from fnmatch import fnmatch
 
 ALLOWED_OPEN_MODES = ('r', 'w', 'a')
@@ -58,20 +63,57 @@ class DiskIO:
     Also accepts both forward and backward slashes at any point, and
     normalizes both to the OS we are currently on.
 
+    Files opened for writing or appending are kept open after the ``with``
+    block, in a bounded pool of the most recently used files, so repeated
+    appends (like the incremental writes of ``GNUPlotFormat``) don't reopen
+    the file every time. Opening the file for reading or writing again, or
+    removing it, closes the pooled handle first. ``DataSet.finalize`` calls
+    ``close_files`` for its location.
+
     Args:
         base_location (str): a path to the root data folder.
             Converted to an absolute path immediately, so even if you supply a
             relative path, later changes to the OS working directory will not
             affect data paths.
+
+        max_open_files (int, optional): how many written files to keep open.
+            0 closes each file at the end of its ``with`` block. Default 16.
+
+        flush (bool, optional): whether to flush a pooled file at the end of
+            each ``with`` block, so other processes see the data. If False,
+            data may stay in the buffer until the file is closed or read
+            through this io manager. Default True.
+
+        fsync (bool, optional): whether to also ``os.fsync`` written files at
+            the end of each ``with`` block, so the data survives an OS crash.
+            This is much slower. Default False.
     """
 
-    def __init__(self, base_location):
+    def __init__(self, base_location, max_open_files=16, flush=True,
+                 fsync=False):
         if base_location is None:
             self.base_location = None
         else:
             base_location = self._normalize_slashes(base_location)
             self.base_location = os.path.abspath(base_location)
 
+        self.max_open_files = max_open_files
+        self.flush = flush
+        self.fsync = fsync
+        # {(path, encoding): file open for appending}, least recent first
+        self._open_files = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_open_files'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
     @contextmanager
     def open(self, filename, mode, encoding=None):
         """
@@ -91,16 +133,78 @@ class DiskIO:
             raise ValueError('mode {} not allowed in IO managers'.format(mode))
 
         filepath = self.to_path(filename)
+        key = (filepath, encoding)
+
+        with self._lock:
+            if mode == 'a' and key in self._open_files:
+                f = self._open_files.pop(key)
+            else:
+                if mode == 'r':
+                    # a pooled handle may still have buffered data
+                    for k, pooled in self._open_files.items():
+                        if k[0] == filepath:
+                            pooled.flush()
+                else:
+                    # don't leave a pooled handle writing behind this one's
+                    # back
+                    self._close_path(filepath)
+
+                # make directories if needed
+                dirpath = os.path.dirname(filepath)
+                if not os.path.exists(dirpath):
+                    os.makedirs(dirpath)
+
+                if mode == 'w' and self.max_open_files:
+                    # in append mode, so writes always go to the end even if
+                    # someone else appends while the file is pooled
+                    f = open(filepath, 'a', encoding=encoding)
+                    f.truncate(0)
+                else:
+                    f = open(filepath, mode, encoding=encoding)
+
+        if mode == 'r' or not self.max_open_files:
+            with f:
+                yield f
+            return
 
-        # make directories if needed
-        dirpath = os.path.dirname(filepath)
-        if not os.path.exists(dirpath):
-            os.makedirs(dirpath)
-
-        # normally we'd construct this context manager with try/finally, but
-        # here we already have a context manager for open so we just wrap it
-        with open(filepath, mode, encoding=encoding) as f:
+        try:
             yield f
+            if self.flush or self.fsync:
+                f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            raise
+
+        with self._lock:
+            self._open_files[key] = f
+            while len(self._open_files) > self.max_open_files:
+                self._open_files.popitem(last=False)[1].close()
+
+    def close_files(self, location=None):
+        """
+        Close pooled files.
+
+        Args:
+            location (str, optional): only close files at or within this
+                location. Default None, which closes all of them.
+        """
+        with self._lock:
+            if location is None:
+                keys = list(self._open_files)
+            else:
+                path = self.to_path(location)
+                keys = [key for key in self._open_files
+                        if key[0] == path or
+                        key[0].startswith(path.rstrip(os.sep) + os.sep) or
+                        os.path.splitext(key[0])[0] == path]
+            for key in keys:
+                self._open_files.pop(key).close()
+
+    def _close_path(self, path):
+        for key in [key for key in self._open_files if key[0] == path]:
+            self._open_files.pop(key).close()
 
     def _normalize_slashes(self, location):
         # note that this is NOT os.path.join - the difference is os.path.join
@@ -216,9 +320,36 @@ class DiskIO:
 
         return out
 
+    def reserve(self, location):
+        """
+        Atomically create an empty directory, if it does not exist yet.
+
+        Only one of several processes trying to reserve the same location
+        succeeds, so this can be used as a lock-free claim on a name.
+
+        Args:
+            location (str): the directory to create.
+
+        Returns:
+            bool: True if we created the directory, False if it already
+                existed.
+        """
+        path = self.to_path(location)
+
+        dirpath = os.path.dirname(path)
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath, exist_ok=True)
+
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            return False
+        return True
+
     def remove(self, filename):
         """Delete a file or folder and prune the directory tree."""
         path = self.to_path(filename)
+        self.close_files(filename)
         if os.path.isdir(path):
             shutil.rmtree(path)
         else:
@@ -239,3 +370,304 @@ class DiskIO:
         """
         for fn in self.list(location):
             self.remove(fn)
+
+
+class MemoryIO:
+
+    """
+    IO manager keeping a tree of text files in memory.
+
+    Supports the same operations as ``DiskIO``, so ``DataSet`` and the
+    formatters that go through ``open`` (like ``GNUPlotFormat``) work on it
+    unchanged without touching the disk. Useful for tests, for timing the
+    formatters, and as a staging area: with a ``target`` io manager,
+    ``close_files`` (which ``DataSet.finalize`` calls) writes the files of a
+    location to the target in one go. The files stay in memory afterward.
+
+    Formatters that need real files on disk (``HDF5Format``,
+    ``ChunkedFormat``, the store journal) need a ``DiskIO`` instead:
+    ``to_path`` only gives a copy of the files.
+
+    Args:
+        target (io_manager, optional): where ``close_files`` writes the
+            files, eg ``DiskIO('D:/data')``. Default None, the files only
+            ever live in memory.
+    """
+
+    def __init__(self, target=None):
+        self.target = target
+        # {location: [parts of the contents]} of every file, and the empty
+        # directories
+        self._files = {}
+        self._dirs = set()
+        self._lock = threading.RLock()
+        self._tmpdir = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_tmpdir'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def base_location(self):
+        """The base location of the target, if it has one."""
+        return getattr(self.target, 'base_location', None)
+
+    def _normalize_slashes(self, location):
+        return os.sep.join(re.split('[\\\\/]', location))
+
+    def _normalize(self, location):
+        location = os.path.normpath(self._normalize_slashes(location))
+        location = location.lstrip(os.sep)
+        return '' if location == os.curdir else location
+
+    @contextmanager
+    def open(self, filename, mode, encoding=None):
+        """
+        Mimic the interface of the built in open context manager.
+
+        Args:
+            filename (str): location of the file.
+
+            mode (str): 'r' (read), 'w' (write), or 'a' (append).
+
+            encoding (str, optional): ignored, the files hold text.
+
+        Returns:
+            context manager yielding a file-like ``io.StringIO``. What is
+            written is stored at the end of the ``with`` block.
+        """
+        if mode not in ALLOWED_OPEN_MODES:
+            raise ValueError('mode {} not allowed in IO managers'.format(mode))
+
+        key = self._normalize(filename)
+        with self._lock:
+            if key in self._dirs or self._is_dir(key):
+                raise IsADirectoryError(filename)
+            if mode == 'r':
+                if key not in self._files:
+                    raise FileNotFoundError(filename)
+                parts = self._files[key]
+                if len(parts) > 1:
+                    parts[:] = [''.join(parts)]
+                f = io.StringIO(parts[0] if parts else '')
+            else:
+                # appends only hold the new text, so they don't copy the
+                # whole file every time
+                f = io.StringIO()
+        # formatters look at the file name, like that of a real file
+        f.name = filename
+
+        try:
+            yield f
+        finally:
+            if mode != 'r':
+                with self._lock:
+                    if mode == 'w' or key not in self._files:
+                        self._files[key] = []
+                    self._files[key].append(f.getvalue())
+                    self._dirs.discard(key)
+            f.close()
+
+    def _is_dir(self, key):
+        prefix = key + os.sep if key else ''
+        return any(path.startswith(prefix)
+                   for path in self._files.keys() | self._dirs)
+
+    def _children(self, key):
+        # {name: is_dir} of what directory key holds
+        prefix = key + os.sep if key else ''
+        children = {}
+        for path in self._files.keys() | self._dirs:
+            if path.startswith(prefix) and path != key:
+                name, _, rest = path[len(prefix):].partition(os.sep)
+                children[name] = (children.get(name, False) or bool(rest) or
+                                  path in self._dirs)
+        return children
+
+    def _in_location(self, path, key):
+        return (not key or path == key or path.startswith(key + os.sep) or
+                os.path.splitext(path)[0] == key)
+
+    def close_files(self, location=None):
+        """
+        Write the files at or within a location to the target in one go.
+
+        Does nothing without a ``target``.
+
+        Args:
+            location (str, optional): only write files at or within this
+                location. Default None, which writes all of them.
+        """
+        if self.target is None:
+            return
+        key = self._normalize(location or '')
+        with self._lock:
+            files = [(path, list(parts)) for path, parts in
+                     sorted(self._files.items())
+                     if self._in_location(path, key)]
+        for path, parts in files:
+            with self.target.open(path, 'w') as f:
+                f.writelines(parts)
+        target_close = getattr(self.target, 'close_files', None)
+        if target_close is not None:
+            target_close(location)
+
+    def to_path(self, location):
+        """
+        Copy the files at or within a location to a temporary directory.
+
+        The copy is not read back, so changes made through the path are
+        not seen by this io manager.
+
+        Args:
+            location (str): A location string for a complete dataset or
+                a file within it.
+
+        Returns:
+            path (str): the path of the copy.
+        """
+        key = self._normalize(location)
+        with self._lock:
+            if self._tmpdir is None:
+                self._tmpdir = tempfile.mkdtemp(prefix='qcodes_memory_')
+                weakref.finalize(self, shutil.rmtree, self._tmpdir, True)
+            files = [(path, list(parts)) for path, parts in
+                     self._files.items() if self._in_location(path, key)]
+            dirs = [path for path in self._dirs
+                    if self._in_location(path, key)]
+        for path in dirs:
+            os.makedirs(os.path.join(self._tmpdir, path), exist_ok=True)
+        for path, parts in files:
+            filepath = os.path.join(self._tmpdir, path)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'w') as f:
+                f.writelines(parts)
+        return os.path.join(self._tmpdir, key)
+
+    def to_location(self, path):
+        """
+        Convert a path made by ``to_path`` back into a location string.
+
+        Args:
+            path (str): a path returned by ``to_path``.
+
+        Returns:
+            location (str): the location string corresponding to this path.
+        """
+        if self._tmpdir is None:
+            return path
+        return os.path.relpath(path, self._tmpdir)
+
+    def __repr__(self):
+        """Show the target in the repr."""
+        return '<MemoryIO, target={}>'.format(repr(self.target))
+
+    def join(self, *args):
+        """Context-dependent os.path.join for this io manager."""
+        return os.path.join(*list(map(self._normalize_slashes, args)))
+
+    def isfile(self, location):
+        """Check whether this location matches a file."""
+        return self._normalize(location) in self._files
+
+    def list(self, location, maxdepth=1, include_dirs=False):
+        """
+        Return all files that match location.
+
+        Matches just like ``DiskIO.list``: files whose names match up to an
+        arbitrary extension, or any files within an exactly matching
+        directory name.
+
+        Args:
+            location (str): the location to match.
+                May contain the usual path wildcards * and ?
+
+            maxdepth (int, optional): maximum levels of directory nesting to
+                recurse into looking for files. Default 1.
+
+            include_dirs (bool, optional): whether to allow directories in
+                the results or just files. Default False.
+
+        Returns:
+            A list of matching files and/or directories, as locations.
+        """
+        search_dir, pattern = os.path.split(self._normalize(location))
+        out = []
+
+        with self._lock:
+            children = self._children(search_dir)
+            for match, is_dir in sorted(children.items()):
+                if not fnmatch(match, pattern + '*'):
+                    continue
+                matchpath = self.join(search_dir, match)
+                if is_dir and fnmatch(match, pattern):
+                    if maxdepth > 0:
+                        out.extend(self._walk(matchpath, 1, maxdepth,
+                                              include_dirs))
+                    elif include_dirs:
+                        out.append(matchpath)
+                elif not is_dir and (
+                        fnmatch(match, pattern) or
+                        fnmatch(os.path.splitext(match)[0], pattern)):
+                    out.append(matchpath)
+
+        return out
+
+    def _walk(self, key, depth, maxdepth, include_dirs):
+        out = []
+        for name, is_dir in sorted(self._children(key).items()):
+            path = self.join(key, name)
+            if not is_dir:
+                out.append(path)
+                continue
+            if include_dirs:
+                out.append(path)
+            if depth < maxdepth:
+                out.extend(self._walk(path, depth + 1, maxdepth,
+                                      include_dirs))
+        return out
+
+    def reserve(self, location):
+        """
+        Create an empty directory, if nothing exists at this location yet.
+
+        Args:
+            location (str): the directory to create.
+
+        Returns:
+            bool: True if we created the directory, False if it already
+                existed.
+        """
+        key = self._normalize(location)
+        with self._lock:
+            if key in self._files or key in self._dirs or self._is_dir(key):
+                return False
+            self._dirs.add(key)
+            return True
+
+    def remove(self, filename):
+        """Delete a file or folder."""
+        key = self._normalize(filename)
+        with self._lock:
+            if key in self._files:
+                del self._files[key]
+            elif key in self._dirs or self._is_dir(key):
+                prefix = key + os.sep
+                for path in [path for path in self._files
+                             if path.startswith(prefix)]:
+                    del self._files[path]
+                self._dirs = {path for path in self._dirs
+                              if path != key and not path.startswith(prefix)}
+            else:
+                raise FileNotFoundError(filename)
+
+    def remove_all(self, location):
+        """Delete all files/directories in the dataset at this location."""
+        for fn in self.list(location):
+            self.remove(fn)
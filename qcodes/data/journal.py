@@ -0,0 +1,277 @@
+"""Append-only journal of DataSet.store calls, for crash recovery."""
+
+import os
+import struct
+import logging
+
+import numpy as np
+
+from .data_array import DataArray
+
+MAGIC = b'QCJ2'
+
+# record types
+_ARRAY = b'A'
+_STORE = b'S'
+
+_u8 = struct.Struct('<B')
+_u16 = struct.Struct('<H')
+_u32 = struct.Struct('<I')
+_i64 = struct.Struct('<q')
+
+
+class StoreJournal:
+
+    """
+    A compact binary journal with one record per ``DataSet.store`` call.
+
+    Between periodic writes, data stored in a ``DataSet`` lives only in
+    memory. Appending each ``store`` call to a journal (and flushing it) is
+    cheap enough to do for every point, so a crashed measurement can be
+    recovered with ``replay`` even if ``write_period`` is long.
+
+    The file starts with a magic string and one ``A`` record per array::
+
+        b'A' code:u16 len:u16 array_id:utf8 is_setpoint:u8
+             ndim:u8 shape:i64*ndim nsets:u8 set_codes:u16*nsets
+             dlen:u8 dtype:ascii
+
+    followed by one ``S`` record per ``store`` call::
+
+        b'S' nidx:u8 loop_indices:i64*nidx nitems:u16
+             (code:u16 count:u32 values:i64|u64|f64*count)*nitems
+
+    ``dtype`` is the declared dtype of the array, empty if it has none.
+    Values of integer arrays are stored exactly, as i64 or u64, and values
+    of complex arrays as (real, imag) pairs of f64. Everything else is f64.
+
+    A truncated last record (from a crash during the append) is ignored.
+
+    Args:
+        path (str): path of the journal file on the local file system.
+
+        fsync (bool, optional): whether to ``os.fsync`` after every record,
+            which also survives an OS crash but costs a lot more than the
+            default flush (which only survives a crash of the python process).
+            Default False.
+    """
+
+    filename = 'journal.bin'
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+        self._codes = {}
+        self._wire_dtypes = {}
+
+    @classmethod
+    def for_data_set(cls, data_set, **kwargs):
+        """Journal at the default path within ``data_set.location``."""
+        path = data_set.io.to_path(
+            data_set.io.join(data_set.location, cls.filename))
+        return cls(path, **kwargs)
+
+    def open(self, arrays):
+        """
+        Start a new journal, describing all the arrays in it.
+
+        Args:
+            arrays (Dict[DataArray]): ``{array_id: array}`` as in
+                ``DataSet.arrays``.
+        """
+        dirpath = os.path.dirname(self.path)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+
+        self._codes = {array_id: i for i, array_id in enumerate(arrays)}
+        self._wire_dtypes = {array_id: _wire_dtype(array.declared_dtype)
+                             for array_id, array in arrays.items()}
+        parts = [MAGIC]
+        for array_id, array in arrays.items():
+            id_bytes = array_id.encode('utf8')
+            parts += [_ARRAY, _u16.pack(self._codes[array_id]),
+                      _u16.pack(len(id_bytes)), id_bytes,
+                      _u8.pack(bool(array.is_setpoint)),
+                      _u8.pack(len(array.shape))]
+            parts += [_i64.pack(d) for d in array.shape]
+            parts.append(_u8.pack(len(array.set_arrays)))
+            parts += [_u16.pack(self._codes[sa.array_id])
+                      for sa in array.set_arrays]
+            dtype = array.declared_dtype
+            dtype_bytes = dtype.str.encode('ascii') if dtype else b''
+            parts += [_u8.pack(len(dtype_bytes)), dtype_bytes]
+
+        self._file = open(self.path, 'wb')
+        self._append(b''.join(parts))
+
+    def append(self, loop_indices, ids_values):
+        """
+        Record one ``store`` call.
+
+        Args:
+            loop_indices (tuple): integer indices, as passed to ``store``.
+            ids_values (dict): ``{array_id: value}`` as passed to ``store``.
+        """
+        parts = [_STORE, _u8.pack(len(loop_indices))]
+        parts += [_i64.pack(i) for i in loop_indices]
+        parts.append(_u16.pack(len(ids_values)))
+        for array_id, value in ids_values.items():
+            vals = np.asarray(value, dtype=self._wire_dtypes[array_id])
+            data = vals.tobytes()
+            parts += [_u16.pack(self._codes[array_id]),
+                      _u32.pack(len(data) // 8), data]
+        self._append(b''.join(parts))
+
+    def _append(self, record):
+        self._file.write(record)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self, remove=False):
+        """
+        Close the journal file.
+
+        Args:
+            remove (bool): also delete it, because everything it contains
+                has been written to storage. Default False.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def replay(self, data_set):
+        """
+        Apply all complete records in the journal to ``data_set``.
+
+        Arrays that are in the journal but not in ``data_set`` (because they
+        never made it to storage) are created. Replayed values are marked as
+        modified, so a subsequent ``data_set.write()`` saves them.
+
+        Args:
+            data_set (DataSet): the DataSet to recover into.
+
+        Returns:
+            int: the number of ``store`` records replayed.
+        """
+        with open(self.path, 'rb') as f:
+            buf = f.read()
+
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a DataSet journal: ' + self.path)
+
+        ids = {}
+        wire_dtypes = {}
+        descriptors = []
+        count = 0
+        pos = len(MAGIC)
+        try:
+            while pos < len(buf):
+                kind = buf[pos:pos + 1]
+                pos += 1
+                if kind == _ARRAY:
+                    pos = self._read_array(buf, pos, ids, wire_dtypes,
+                                           descriptors)
+                elif kind == _STORE:
+                    if descriptors:
+                        self._make_arrays(data_set, ids, descriptors)
+                        descriptors = []
+                    pos = self._read_store(buf, pos, ids, wire_dtypes,
+                                           data_set)
+                    count += 1
+                else:
+                    raise ValueError('corrupt journal record', kind, pos)
+        except struct.error:
+            logging.warning('ignoring truncated last record in journal ' +
+                            self.path)
+
+        return count
+
+    @staticmethod
+    def _read_array(buf, pos, ids, wire_dtypes, descriptors):
+        code, = _u16.unpack_from(buf, pos)
+        id_len, = _u16.unpack_from(buf, pos + 2)
+        pos += 4
+        id_bytes = buf[pos:pos + id_len]
+        if len(id_bytes) < id_len:
+            raise struct.error('truncated array id')
+        pos += id_len
+        is_setpoint, ndim = struct.unpack_from('<BB', buf, pos)
+        pos += 2
+        shape = struct.unpack_from('<{}q'.format(ndim), buf, pos)
+        pos += 8 * ndim
+        nsets, = _u8.unpack_from(buf, pos)
+        set_codes = struct.unpack_from('<{}H'.format(nsets), buf, pos + 1)
+        pos += 1 + 2 * nsets
+        dlen, = _u8.unpack_from(buf, pos)
+        dtype_bytes = buf[pos + 1:pos + 1 + dlen]
+        if len(dtype_bytes) < dlen:
+            raise struct.error('truncated dtype')
+        pos += 1 + dlen
+
+        ids[code] = id_bytes.decode('utf8')
+        dtype = np.dtype(dtype_bytes.decode('ascii')) if dlen else None
+        wire_dtypes[code] = _wire_dtype(dtype)
+        descriptors.append((code, bool(is_setpoint), shape, set_codes, dtype))
+        return pos
+
+    @staticmethod
+    def _make_arrays(data_set, ids, descriptors):
+        for code, is_setpoint, shape, set_codes, dtype in descriptors:
+            array_id = ids[code]
+            if array_id not in data_set.arrays:
+                # the metadata, if it was saved, has labels, fill_value etc
+                array = DataArray(
+                    array_id=array_id, name=array_id,
+                    is_setpoint=is_setpoint, shape=shape, dtype=dtype,
+                    snapshot=data_set.get_array_metadata(array_id))
+                array.init_data()
+                data_set.add_array(array)
+
+        for code, is_setpoint, shape, set_codes, dtype in descriptors:
+            array = data_set.arrays[ids[code]]
+            if not array.set_arrays:
+                array.set_arrays = tuple(data_set.arrays[ids[c]]
+                                         for c in set_codes)
+
+    @staticmethod
+    def _read_store(buf, pos, ids, wire_dtypes, data_set):
+        nidx, = _u8.unpack_from(buf, pos)
+        loop_indices = struct.unpack_from('<{}q'.format(nidx), buf, pos + 1)
+        pos += 1 + 8 * nidx
+        nitems, = _u16.unpack_from(buf, pos)
+        pos += 2
+
+        # parse the whole record before applying any of it, so a truncated
+        # record is dropped entirely
+        items = []
+        for _ in range(nitems):
+            code, = _u16.unpack_from(buf, pos)
+            size, = _u32.unpack_from(buf, pos + 2)
+            pos += 6
+            if pos + 8 * size > len(buf):
+                raise struct.error('truncated values')
+            vals = np.frombuffer(buf, dtype='<f8', count=size, offset=pos)
+            pos += 8 * size
+            items.append((ids[code], vals.view(wire_dtypes[code])))
+
+        data_set._extend_appendable((loop_indices,))
+        for array_id, vals in items:
+            array = data_set.arrays[array_id]
+            if vals.size == 1:
+                array[loop_indices] = vals[0]
+            else:
+                target_shape = np.shape(array.ndarray[loop_indices])
+                array[loop_indices] = vals.reshape(target_shape)
+
+        return pos
+
+
+def _wire_dtype(dtype):
+    # how the values of an array with this declared dtype are journalled,
+    # always in multiples of 8 bytes
+    kind = dtype.kind if dtype is not None else 'f'
+    return np.dtype({'i': '<i8', 'u': '<u8', 'c': '<c16'}.get(kind, '<f8'))
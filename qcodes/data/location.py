@@ -48,6 +48,20 @@ class FormatLocation:
     If the format string does not contain ``{counter}`` but the location we
     would return is occupied, we add ``'_{counter}'`` to the end.
 
+    If the io manager supports ``reserve`` (like ``DiskIO``), the new location
+    is claimed by atomically creating its (empty) directory. If that fails,
+    or another location with the same counter shows up (another process
+    claiming the counter under a different name), we back off and retry with
+    the next counter. Because of this check, the last counter for each head
+    can be cached, so the existing files are only searched the first time.
+    A location without ``{counter}`` is claimed the same way, and gets
+    ``'_{counter}'`` added if someone else has it already.
+
+    Reserving a directory assumes that the formatter puts its files inside
+    the location, as ``GNUPlotFormat`` and ``HDF5Format`` do. A formatter
+    writing a single file named after the location would leave the empty
+    directory beside it.
+
     Usage::
 
         loc_provider = FormatLocation(
@@ -96,6 +110,9 @@ class FormatLocation:
         self.base_record = record
         self.formatter = SafeFormatter()
 
+        # {path of the head: last counter we reserved}
+        self._counters = {}
+
         for testval in (1, 23, 456, 7890):
             if self._findint(self.fmt_counter.format(testval)) != testval:
                 raise ValueError('fmt_counter must produce a correct integer '
@@ -108,6 +125,12 @@ class FormatLocation:
         except:
             return 0
 
+    def _counter_is_ours(self, io, head, count):
+        counter = self.fmt_counter.format(count)
+        matches = io.list(head + counter + '*', maxdepth=0, include_dirs=True)
+        return len([f for f in matches
+                    if self._findint(f[len(head):]) == count]) == 1
+
     def __call__(self, io, record=None):
         """
         Call the location provider to get a new location.
@@ -137,9 +160,12 @@ class FormatLocation:
         if ('name' in format_record) and ('{name}' not in loc_fmt):
             loc_fmt += '_{name}'
 
+        reserve = getattr(io, 'reserve', None)
+
         if '{counter}' not in loc_fmt:
             location = self.formatter.format(loc_fmt, **format_record)
-            if io.list(location):
+            if io.list(location) or (reserve is not None and
+                                     not reserve(location)):
                 loc_fmt += '_{counter}'
                 # redirect to the counter block below, but starting from 2
                 # because the already existing file counts like 1
@@ -157,13 +183,35 @@ class FormatLocation:
         # returned by io.list
         head = io.join(self.formatter.format(head_fmt, **format_record))
 
-        file_list = io.list(head + '*', maxdepth=0, include_dirs=True)
+        if reserve is not None:
+            # only safe to trust the cache if counters are reserved, so
+            # we notice when someone else has taken the next one
+            cache_key = io.to_path(head)
+            cached_count = self._counters.get(cache_key)
+        else:
+            cached_count = None
+
+        if cached_count is None:
+            file_list = io.list(head + '*', maxdepth=0, include_dirs=True)
 
-        for f in file_list:
-            cnt = self._findint(f[len(head):])
-            existing_count = max(existing_count, cnt)
+            for f in file_list:
+                cnt = self._findint(f[len(head):])
+                existing_count = max(existing_count, cnt)
+        else:
+            existing_count = max(existing_count, cached_count)
 
-        format_record['counter'] = self.fmt_counter.format(existing_count + 1)
-        location = self.formatter.format(loc_fmt, **format_record)
+        while True:
+            existing_count += 1
+            format_record['counter'] = self.fmt_counter.format(existing_count)
+            location = self.formatter.format(loc_fmt, **format_record)
+            if reserve is None:
+                break
+            if reserve(location):
+                if self._counter_is_ours(io, head, existing_count):
+                    self._counters[cache_key] = existing_count
+                    break
+                # whoever else took this counter may or may not have seen
+                # us, so always leave it to them
+                io.remove(location)
 
         return location
@@ -4,6 +4,7 @@ from traceback import format_exc
 import logging
 
 from qcodes.process.server import ServerManager, BaseServer
+from .shared import SharedArrays, SHM_DIR
 
 
 def get_data_manager(only_existing=False):
@@ -42,10 +43,25 @@ class DataManager(ServerManager):
     DataServer communicates with other processes through messages
     Written using multiprocessing Queue's, but should be easily
     extensible to other messaging systems
+
+    Args:
+        shared_memory (bool): keep live data in shared memory, using a
+            ``SharedMemoryDataServer``, so the measurement process stores
+            data in place instead of sending every point through a queue.
+            Needs a memory-backed ``/dev/shm``. Default False.
+
+    Raises:
+        RuntimeError: if ``shared_memory`` is requested on a system
+            without ``/dev/shm``.
     """
-    def __init__(self):
+    def __init__(self, shared_memory=False):
+        if shared_memory and SHM_DIR is None:
+            raise RuntimeError('shared_memory=True needs a memory-backed '
+                               'file system at /dev/shm, which this system '
+                               'does not have')
         type(self).default = self
-        super().__init__(name='DataServer', server_class=DataServer)
+        server_class = SharedMemoryDataServer if shared_memory else DataServer
+        super().__init__(name='DataServer', server_class=server_class)
 
     def restart(self, force=False):
         """
@@ -105,7 +121,7 @@ class DataServer(BaseServer):
                 if self._measuring and now > next_store_ts:
                     td = timedelta(seconds=self._storage_period)
                     next_store_ts = now + td
-                    self._data.write()
+                    self.write_data()
 
                 if now > next_monitor_ts:
                     td = timedelta(seconds=self._monitor_period)
@@ -115,6 +131,12 @@ class DataServer(BaseServer):
             except:
                 logging.error(format_exc())
 
+    def write_data(self):
+        """
+        Write the outstanding changes of the active DataSet to storage.
+        """
+        self._data.write()
+
     ######################################################################
     # query handlers                                                     #
     ######################################################################
@@ -141,8 +163,14 @@ class DataServer(BaseServer):
     def handle_store_data(self, *args):
         """
         Put some data into the DataSet
+
+        Takes either the ``loop_indices, ids_values`` of one store, or one
+        batch of them as sent by ``DataSet.flush_stores``.
         """
-        self._data.store(*args)
+        if len(args) == 1:
+            self._data.store_batch(*args)
+        else:
+            self._data.store(*args)
 
     def handle_get_measuring(self):
         """
@@ -161,3 +189,74 @@ class DataServer(BaseServer):
         Return all new data after the last sync
         """
         return self._data.get_changes(synced_indices)
+
+
+class SharedMemoryDataServer(DataServer):
+    """
+    A `DataServer` that keeps the arrays of the active DataSet in shared
+    memory (see `SharedArrays`).
+
+    ``new_data`` returns the shared blocks, and the measuring DataSet writes
+    its data straight into them instead of sending ``store_data`` queries.
+    It publishes what it wrote in the cursor block, which the server reads
+    before writing to storage and readers read to sync, so the only queries
+    during a measurement are the small ones like ``get_measuring``.
+
+    When the measurement is finalized the server copies the arrays back to
+    private memory and deletes the shared blocks.
+    """
+    def __init__(self, query_queue, response_queue, extras=None):
+        self._shared = None
+        # {array_id: last flat index already marked modified}
+        self._seen = {}
+        super().__init__(query_queue, response_queue, extras)
+
+    def collect_changes(self):
+        """
+        Mark newly published points as modified in the server's arrays.
+        """
+        if self._shared is None:
+            return
+        for array_id, (low, high) in self._shared.ranges().items():
+            seen = self._seen.get(array_id, -1)
+            if high > seen:
+                self._data.arrays[array_id]._update_modified_range(
+                    max(low, seen + 1), high)
+                self._seen[array_id] = high
+
+    def release(self):
+        if self._shared is not None:
+            self._shared.release(self._data.arrays)
+            self._data._shared = None
+            self._shared = None
+            self._seen = {}
+
+    def write_data(self):
+        self.collect_changes()
+        super().write_data()
+
+    def handle_new_data(self, data_set):
+        """
+        Load a new DataSet, move its arrays into shared memory, and return
+        the `SharedArrays` for the measuring DataSet to attach to.
+        """
+        super().handle_new_data(data_set)
+        self._shared = SharedArrays.create(data_set.arrays)
+        # readers that get the DataSet from us map the same memory
+        data_set._shared = self._shared
+        return self._shared
+
+    def handle_finalize_data(self):
+        self.collect_changes()
+        try:
+            super().handle_finalize_data()
+        finally:
+            self.release()
+
+    def handle_get_changes(self, synced_indices):
+        self.collect_changes()
+        return super().handle_get_changes(synced_indices)
+
+    def handle_halt(self):
+        self.release()
+        super().handle_halt()
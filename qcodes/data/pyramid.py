@@ -0,0 +1,211 @@
+"""Multi-resolution min/max/mean summaries of large arrays."""
+
+from collections import namedtuple
+
+import numpy as np
+
+DecimatedView = namedtuple('DecimatedView', 'min max mean count factor')
+DecimatedView.__doc__ = """
+A reduced-resolution view of an array.
+
+Each element summarizes one bucket of ``factor`` points (a tuple, one
+bucket size per dimension) of the original array, ignoring NaN (not yet
+measured) points. Buckets without any data have NaN ``min``, ``max`` and
+``mean``, and zero ``count``.
+"""
+
+
+class SummaryPyramid:
+
+    """
+    Min, max, sum and count of an array over buckets of increasing size.
+
+    Level 0 has buckets of ``base`` points along each reduced dimension, and
+    each next level combines ``branch`` buckets of the previous level along
+    each reduced dimension, until those dimensions fit in one bucket. With
+    the defaults the whole pyramid takes about 2/3 the memory of the array
+    it summarizes if one dimension is reduced, and much less for more.
+
+    The levels are built on first use. After that, only the buckets covering
+    the points marked with ``mark_dirty`` are recomputed. Views that need
+    smaller buckets than level 0 has are reduced from the data itself, and
+    kept until the next change.
+
+    Args:
+        data (np.ndarray): the array to summarize. It is referenced, not
+            copied, so later changes are seen as long as they are marked.
+
+        base (int): bucket size of the finest level. Default 8.
+
+        branch (int): reduction from each level to the next. Default 4.
+
+        axes (Sequence[int], optional): the dimensions to reduce. Default all.
+
+        fill_value (optional): the value of unmeasured points in integer
+            data, to skip like NaN.
+
+    Complex data is summarized by its magnitude.
+    """
+
+    def __init__(self, data, base=8, branch=4, axes=None, fill_value=None):
+        self.data = data
+        self.fill_value = fill_value
+        self.base = base
+        self.branch = branch
+        if axes is None:
+            axes = range(data.ndim)
+        self.axes = tuple(sorted(axes))
+        self.levels = []
+        self.factors = []
+        # {factor: level} of the views finer than level 0
+        self._fine = {}
+        self._dirty = None
+
+    def mark_dirty(self, low, high):
+        """
+        Note that flat indices ``low`` to ``high`` (inclusive) changed.
+        """
+        if not self.levels:
+            return
+        if self._dirty is None:
+            self._dirty = (low, high)
+        else:
+            self._dirty = (min(self._dirty[0], low), max(self._dirty[1], high))
+
+    def view(self, resolution):
+        """
+        The coarsest level that still has at least ``resolution`` buckets
+        along each reduced dimension.
+
+        If even level 0 has fewer, each of those dimensions is divided into
+        buckets of ``n // resolution`` points instead, giving between
+        ``resolution`` and 2 * ``resolution`` buckets.
+
+        Args:
+            resolution (Union[int, Sequence[int]]): the number of points that
+                are useful along each dimension, eg the width of a plot in
+                pixels. One value for all dimensions or one per dimension.
+
+        Returns:
+            DecimatedView: the summary.
+        """
+        resolution = _per_dim(resolution, self.data.shape)
+        self._update()
+
+        chosen = None
+        for i, level in enumerate(self.levels):
+            if all(level[0].shape[a] >= resolution[a] for a in self.axes):
+                chosen = i
+            else:
+                break
+
+        if chosen is None:
+            factor = tuple(max(1, n // r) if i in self.axes else 1
+                           for i, (n, r) in enumerate(zip(self.data.shape,
+                                                          resolution)))
+            if factor not in self._fine:
+                self._fine[factor] = _reduce_data(self.data, factor,
+                                                  self.fill_value)
+            level = self._fine[factor]
+        else:
+            level = self.levels[chosen]
+            factor = self.factors[chosen]
+
+        mins, maxs, sums, counts = level
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        return DecimatedView(mins, maxs, means, counts, factor)
+
+    def _factor(self, size):
+        return tuple(size if i in self.axes else 1
+                     for i in range(self.data.ndim))
+
+    def _update(self):
+        if not self.levels:
+            self._build()
+        elif self._dirty is not None:
+            self._refresh(*self._dirty)
+            self._fine = {}
+        self._dirty = None
+
+    def _build(self):
+        factor = self._factor(self.base)
+        branch = self._factor(self.branch)
+        level = _reduce_data(self.data, factor, self.fill_value)
+        self.levels = [level]
+        self.factors = [factor]
+        while any(level[0].shape[a] > 1 for a in self.axes):
+            level = _reduce_level(level, branch)
+            factor = tuple(f * b for f, b in zip(factor, branch))
+            self.levels.append(level)
+            self.factors.append(factor)
+
+    def _refresh(self, low, high):
+        # refresh whole outer-dimension slabs containing the changed points
+        shape = self.data.shape
+        first = np.unravel_index(low, shape)[0]
+        last = np.unravel_index(high, shape)[0]
+
+        size = self.factors[0][0]
+        start = first // size
+        stop = last // size + 1
+        block = self.data[start * size:stop * size]
+        for arr, new in zip(self.levels[0],
+                            _reduce_data(block, self.factors[0],
+                                         self.fill_value)):
+            arr[start:stop] = new
+
+        branch = self._factor(self.branch)
+        for i in range(1, len(self.levels)):
+            size = branch[0]
+            start //= size
+            stop = (stop - 1) // size + 1
+            block = tuple(arr[start * size:stop * size]
+                          for arr in self.levels[i - 1])
+            for arr, new in zip(self.levels[i],
+                                _reduce_level(block, branch)):
+                arr[start:stop] = new
+
+
+def _per_dim(resolution, shape):
+    if np.isscalar(resolution):
+        return (resolution,) * len(shape)
+    if len(resolution) != len(shape):
+        raise ValueError('resolution must be a number or have one '
+                         'entry per dimension', resolution, shape)
+    return tuple(resolution)
+
+
+def _blocks(arr, factor, fill):
+    """Pad ``arr`` to a multiple of ``factor`` and expose the buckets."""
+    pad = [(0, -n % f) for n, f in zip(arr.shape, factor)]
+    if any(p[1] for p in pad):
+        arr = np.pad(arr, pad, mode='constant', constant_values=fill)
+    split = []
+    for n, f in zip(arr.shape, factor):
+        split += [n // f, f]
+    return arr.reshape(split), tuple(range(1, 2 * arr.ndim, 2))
+
+
+def _reduce_data(data, factor, fill_value=None):
+    if np.iscomplexobj(data):
+        data = np.abs(data)
+    elif fill_value is None:
+        data = np.asarray(data, dtype=float)
+    else:
+        data = np.where(data == fill_value, np.nan, data)
+    blocks, axes = _blocks(data, factor, np.nan)
+    valid = ~np.isnan(blocks)
+    return (np.fmin.reduce(blocks, axis=axes),
+            np.fmax.reduce(blocks, axis=axes),
+            np.where(valid, blocks, 0).sum(axis=axes),
+            valid.sum(axis=axes))
+
+
+def _reduce_level(level, factor):
+    mins, maxs, sums, counts = level
+    mins, axes = _blocks(mins, factor, np.nan)
+    return (np.fmin.reduce(mins, axis=axes),
+            np.fmax.reduce(_blocks(maxs, factor, np.nan)[0], axis=axes),
+            _blocks(sums, factor, 0)[0].sum(axis=axes),
+            _blocks(counts, factor, 0)[0].sum(axis=axes))
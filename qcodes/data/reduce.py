@@ -0,0 +1,169 @@
+"""Reductions of DataSet arrays that are too large to load at once."""
+
+import numpy as np
+
+REDUCTIONS = ('mean', 'sum', 'min', 'max', 'std')
+
+
+def reduce_array(data_set, array_id, axes, how='mean', ddof=0,
+                 max_points=2 ** 22):
+    """
+    Reduce one array of a DataSet along some of its setpoint axes.
+
+    The array is read in blocks of whole rows of its outermost dimension,
+    with ``Formatter.read_region``, and the partial results of the blocks
+    are combined. With a formatter that reads regions without loading the
+    whole array (like ``ChunkedFormat``), only one block is in memory at a
+    time, so arrays larger than memory can be reduced. Arrays that are
+    already in memory are reduced in place.
+
+    Unmeasured points (NaN, or ``fill_value`` in integer arrays) are
+    skipped. Integer arrays are reduced as floats.
+
+    Args:
+        data_set (DataSet): the data. If it doesn't have the array yet, it
+            is read with ``read(lazy=True)`` first.
+
+        array_id (str): the array to reduce.
+
+        axes (Union[str, int, Sequence[Union[str, int]]]): the dimensions to
+            reduce, as the ``array_id`` or ``name`` of their setpoint arrays,
+            or as dimension numbers.
+
+        how (Union[str, numpy.ufunc]): one of 'mean', 'sum', 'min', 'max' and
+            'std', or a binary ufunc like ``np.add`` or ``np.logaddexp``,
+            applied with ``ufunc.reduce``. Ufuncs with an identity skip
+            unmeasured points, others get them as they are. Default 'mean'.
+
+        ddof (int): delta degrees of freedom of 'std', as in ``np.std``.
+            Default 0.
+
+        max_points (int): about how many points to read at once. At least
+            one row of the outermost dimension is read. Default 2**22.
+
+    Returns:
+        numpy.ndarray: the result, shaped like the array without the reduced
+            dimensions. Points where nothing was measured are NaN, except
+            for 'sum' where they are 0.
+    """
+    if isinstance(how, np.ufunc):
+        if how.nin != 2 or how.nout != 1:
+            raise ValueError('reductions need a binary ufunc, not ' +
+                             how.__name__)
+    elif how not in REDUCTIONS:
+        raise ValueError('unknown reduction {!r}, use one of {} or a '
+                         'ufunc'.format(how, REDUCTIONS))
+
+    if array_id not in data_set.arrays:
+        data_set.read(lazy=True)
+    array = data_set.arrays[array_id]
+    shape = array.shape
+
+    if isinstance(axes, (str, int)):
+        axes = (axes,)
+    axes = tuple(sorted({_axis_index(array, axis) for axis in axes}))
+
+    row_size = int(np.prod(shape[1:]))
+    rows = max(1, max_points // max(row_size, 1))
+
+    state = None
+    for start in range(0, max(shape[0], 1), rows):
+        block = _read_block(data_set, array, slice(start, start + rows))
+        part = _partial(block, axes, how, array)
+        if state is None:
+            state = part
+        elif 0 in axes:
+            state = _combine(state, part, how)
+        else:
+            # blocks hold different rows of the result
+            state = tuple(np.concatenate((a, b)) for a, b in zip(state, part))
+
+    result = _finish(state, how, ddof)
+    return result.reshape([n for i, n in enumerate(shape) if i not in axes])
+
+
+def _axis_index(array, axis):
+    if isinstance(axis, int):
+        # not array.ndim, which would load the data
+        ndim = len(array.shape)
+        if not -ndim <= axis < ndim:
+            raise ValueError('axis {} out of range for {}'.format(
+                axis, array.array_id))
+        return axis % ndim
+
+    for i, set_array in enumerate(array.set_arrays):
+        if axis in (set_array.array_id, set_array.name):
+            return i
+    raise ValueError('no setpoint axis {} in {}'.format(axis, array.array_id))
+
+
+def _read_block(data_set, array, rows):
+    if array.is_loaded and array.ndarray is not None:
+        return array.ndarray[rows]
+    return data_set.formatter.read_region(data_set, array.array_id, (rows,))
+
+
+def _partial(block, axes, how, array):
+    # the partial result of one block, reduced over axes with keepdims, as
+    # a tuple of arrays that _combine and _finish know how to use
+    dtype = array.declared_dtype
+    if dtype is not None and dtype.kind in 'iu':
+        block = np.where(block != array.fill_value, block, np.nan)
+
+    if isinstance(how, np.ufunc):
+        if how.identity is None:
+            return (how.reduce(block, axis=axes, keepdims=True),)
+        return (how.reduce(block, axis=axes, keepdims=True,
+                           where=~np.isnan(block), initial=how.identity),)
+
+    if how == 'min':
+        return (np.fmin.reduce(block, axis=axes, keepdims=True),)
+    if how == 'max':
+        return (np.fmax.reduce(block, axis=axes, keepdims=True),)
+
+    measured = ~np.isnan(block)
+    count = measured.sum(axis=axes, keepdims=True)
+    total = np.where(measured, block, 0).sum(axis=axes, keepdims=True)
+    if how != 'std':
+        return count, total
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    deviations = np.where(measured, block - mean, 0)
+    m2 = (np.abs(deviations) ** 2).sum(axis=axes, keepdims=True)
+    return count, mean, m2
+
+
+def _combine(a, b, how):
+    if isinstance(how, np.ufunc):
+        return (how(a[0], b[0]),)
+    if how == 'min':
+        return (np.fmin(a[0], b[0]),)
+    if how == 'max':
+        return (np.fmax(a[0], b[0]),)
+    if how != 'std':
+        return a[0] + b[0], a[1] + b[1]
+
+    # pairwise update of the mean and the sum of squared deviations
+    (count_a, mean_a, m2_a), (count_b, mean_b, m2_b) = a, b
+    count = count_a + count_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(count, count_b / count, 0)
+    delta = np.where(count_b, mean_b, 0) - np.where(count_a, mean_a, 0)
+    mean = np.where(count_a, mean_a, 0) + delta * weight
+    m2 = m2_a + m2_b + np.abs(delta) ** 2 * count_a * weight
+    return count, mean, m2
+
+
+def _finish(state, how, ddof):
+    if isinstance(how, np.ufunc) or how in ('min', 'max'):
+        return state[0]
+    if how == 'sum':
+        return state[1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'mean':
+            count, total = state
+            return np.where(count > 0, total / count, np.nan)
+        count, _, m2 = state
+        return np.where(count > ddof, np.sqrt(m2 / (count - ddof)), np.nan)
@@ -0,0 +1,394 @@
+"""Tiered retention of long-running, appendable time series."""
+
+from threading import Thread
+from traceback import format_exc
+import logging
+import time
+
+import numpy as np
+
+from .data_array import DataArray
+
+
+class RetentionPolicy:
+
+    """
+    How long to keep the rows of a time series at full rate, and how to
+    thin them out after that.
+
+    Applies to the appendable arrays of a ``DataSet`` (see
+    ``DataSet.append``), with a time array of seconds (like ``time.time()``)
+    as their outer setpoints. Rows less than ``full_rate`` seconds old are
+    kept as they are. Older rows are merged per ``interval`` of their tier:
+    each measured array holds the mean of the merged rows, and gets two
+    more arrays, ``<array_id>_min`` and ``<array_id>_max``, with their
+    extremes. The time of a merged row is the mean time of its points, and
+    a ``points`` array counts them, so rows can be merged again as they
+    move on to coarser tiers. Inner setpoints are taken from the first row.
+
+    Intervals are aligned to multiples of themselves, so the interval of
+    each tier should be a multiple of the one before.
+
+    Integer arrays hold their means rounded, complex arrays compare their
+    extremes as numpy does (real part first).
+
+    Args:
+        full_rate (float): seconds to keep every row.
+
+        tiers (Sequence[Tuple[Optional[float], float]]): ``(max_age,
+            interval)`` pairs, in order of ``max_age``: rows older than the
+            tier before, but younger than ``max_age`` seconds, are merged
+            per ``interval`` seconds. Rows older than the last ``max_age``
+            are dropped, unless it is None. Default (), drop all rows
+            older than ``full_rate``.
+
+        period (float): seconds between compactions started by
+            ``DataSet.append``. Default 600.
+
+        time_array (Optional[str]): the ``array_id`` of the time array.
+            Default None, the one-dimensional appendable setpoint array.
+
+        points_id (str): the ``array_id`` of the array counting the points
+            in each row. Default 'points'.
+    """
+
+    def __init__(self, full_rate, tiers=(), period=600, time_array=None,
+                 points_id='points'):
+        tiers = [(max_age, float(interval)) for max_age, interval in tiers]
+        limits = [full_rate] + [max_age for max_age, _ in tiers]
+        if None in limits[:-1]:
+            raise ValueError('only the last tier can keep rows forever')
+        if any(b <= a for a, b in zip(limits, limits[1:]) if b is not None):
+            raise ValueError('retention tiers must get older', limits)
+        if any(interval <= 0 for _, interval in tiers):
+            raise ValueError('retention intervals must be positive')
+
+        self.full_rate = full_rate
+        self.tiers = tiers
+        self.period = period
+        self.time_array = time_array
+        self.points_id = points_id
+
+        self._limits = np.array([limit for limit in limits
+                                 if limit is not None], dtype=float)
+        # by level: 0 is full rate, then the tiers
+        self._intervals = np.array([1.] + [iv for _, iv in tiers])
+
+    def compact(self, data_set, now=None):
+        """
+        Merge and drop the old rows of ``data_set`` right now, and rewrite
+        it in storage.
+
+        Args:
+            data_set (DataSet): the time series, in ``LOCAL`` mode.
+
+            now (Optional[float]): the time to measure ages from. Default
+                ``time.time()``.
+
+        Returns:
+            int: how many rows fewer the DataSet has.
+        """
+        if now is None:
+            now = time.time()
+        plan = self.plan(data_set, self._snapshot(data_set), now)
+        return self.apply(data_set, plan)
+
+    def _snapshot(self, data_set):
+        # the rows so far, which stay valid as more rows are appended
+        time_array = self._find_time_array(data_set)
+        length = time_array.shape[0]
+        rows = {}
+        for array_id, array in data_set.arrays.items():
+            if array.appendable and not array.compact()[1]:
+                rows[array_id] = array.ndarray[:length]
+        return rows
+
+    def plan(self, data_set, rows, now):
+        """
+        Work out the merged old rows, without changing ``data_set``.
+
+        This is the slow part of ``compact``, which a ``Compactor`` does in
+        its own thread.
+
+        Args:
+            data_set (DataSet): the time series, for the array descriptions.
+
+            rows (Dict[numpy.ndarray]): ``{array_id: data}``, the rows so
+                far of the appendable arrays that aren't broadcast.
+
+            now (float): the time to measure ages from.
+
+        Returns:
+            Optional[Tuple[int, Dict[numpy.ndarray]]]: the number of old
+                rows, and what they turn into, by ``array_id``. None if
+                there is nothing to merge or drop.
+        """
+        time_id = self._find_time_array(data_set).array_id
+        t = np.asarray(rows[time_id], dtype=float)
+
+        level = np.searchsorted(self._limits, now - t, side='right')
+        # rows without a time yet are never old
+        level[np.isnan(t)] = 0
+        recent = np.flatnonzero(level == 0)
+        stop = int(recent[0]) if recent.size else len(t)
+
+        keep = np.flatnonzero(level[:stop] <= len(self.tiers))
+        level = level[keep]
+        bins = np.floor(t[keep] / self._intervals[level])
+        is_start = np.ones(len(keep), dtype=bool)
+        is_start[1:] = (level[1:] != level[:-1]) | (bins[1:] != bins[:-1])
+        starts = np.flatnonzero(is_start)
+        if len(starts) == stop:
+            # every old row is on its own already
+            return None
+
+        if self.points_id in rows:
+            points = rows[self.points_id][:stop][keep]
+            points = np.where(np.isnan(points), 1, points)
+        else:
+            points = np.ones(len(keep))
+
+        merged = {self.points_id: np.add.reduceat(points, starts)}
+        for array_id, data in rows.items():
+            array = data_set.arrays[array_id]
+            if array_id == self.points_id or self._source(
+                    data_set, array_id) is not None:
+                continue
+            data = data[:stop][keep]
+            if array.is_setpoint and array_id != time_id:
+                merged[array_id] = data[starts]
+                continue
+
+            data = _as_float(data, array)
+            merged[array_id] = _restore(_mean(data, points, starts), array)
+            if array.is_setpoint:
+                continue
+            for suffix, ufunc in (('_min', np.fmin), ('_max', np.fmax)):
+                extremes = rows.get(array_id + suffix)
+                if extremes is None:
+                    extremes = data
+                else:
+                    # rows stored without their extremes are single points
+                    extremes = _as_float(extremes[:stop][keep], array)
+                    extremes = np.where(np.isnan(extremes), data, extremes)
+                merged[array_id + suffix] = _restore(
+                    ufunc.reduceat(extremes, starts, axis=0), array)
+        return stop, merged
+
+    def apply(self, data_set, plan):
+        """
+        Replace the old rows of ``data_set`` with the result of ``plan``,
+        and rewrite it in storage.
+
+        Rows appended since the plan was made are kept. Must be called from
+        the thread that appends.
+
+        Args:
+            data_set (DataSet): the time series.
+
+            plan (Optional[Tuple[int, Dict[numpy.ndarray]]]): what ``plan``
+                returned for it.
+
+        Returns:
+            int: how many rows fewer the DataSet has.
+        """
+        if plan is None:
+            return 0
+        stop, merged = plan
+        time_array = self._find_time_array(data_set)
+        length = time_array.shape[0]
+        new_length = len(merged[time_array.array_id]) + length - stop
+
+        # the rows appended since the plan, before any are replaced
+        tails = {array_id: array.ndarray[stop:]
+                 for array_id, array in data_set.arrays.items()
+                 if array_id in merged or array_id + '_min' in merged}
+
+        for array_id, head in merged.items():
+            if array_id in data_set.arrays:
+                tail = tails[array_id]
+            elif array_id == self.points_id:
+                tail = np.ones(length - stop)
+                data_set.add_array(DataArray(
+                    name=array_id, array_id=array_id, label='Points',
+                    shape=(0,), set_arrays=(time_array,), appendable=True))
+            else:
+                source = data_set.arrays[self._source(data_set, array_id)]
+                tail = tails[source.array_id]
+                suffix = array_id[len(source.array_id):]
+                data_set.add_array(DataArray(
+                    name=(source.name or source.array_id) + suffix,
+                    array_id=array_id,
+                    label='{} ({})'.format(source.label or source.name,
+                                           suffix[1:]),
+                    unit=source.unit, shape=(0,) + tuple(source.shape[1:]),
+                    set_arrays=source.set_arrays, dtype=source.declared_dtype,
+                    fill_value=source._fill_value, appendable=True))
+            data_set.arrays[array_id].replace_data(
+                np.concatenate((head, tail)))
+
+        for array in data_set.arrays.values():
+            if array.appendable and array.array_id not in merged:
+                # broadcast setpoints just change length
+                data, _ = array.compact()
+                array.replace_data(np.broadcast_to(
+                    data, (new_length,) + tuple(array.shape[1:])))
+
+        data_set.rewrite()
+        return length - new_length
+
+    def full_row(self, data_set, ids_values):
+        """
+        Add the extremes and points of a new row, for arrays that have them
+        since an earlier compaction.
+
+        ``DataSet.append`` calls this for its ``retention`` policy.
+
+        Args:
+            data_set (DataSet): the time series.
+
+            ids_values (Dict[Union[float, sequence]]): the row, as given to
+                ``DataSet.append``.
+
+        Returns:
+            Dict[Union[float, sequence]]: the same row, with the min and max
+                of each measured array being its value, and 1 point.
+        """
+        if self.points_id not in data_set.arrays:
+            return ids_values
+        row = dict(ids_values)
+        row[self.points_id] = 1
+        for array_id, value in ids_values.items():
+            for suffix in ('_min', '_max'):
+                if array_id + suffix in data_set.arrays:
+                    row[array_id + suffix] = value
+        return row
+
+    def _find_time_array(self, data_set):
+        if self.time_array is not None:
+            return data_set.arrays[self.time_array]
+        found = [array for array in data_set.arrays.values()
+                 if array.appendable and array.is_setpoint and
+                 len(array.shape) == 1]
+        if len(found) != 1:
+            raise ValueError('cannot tell which array holds the time, '
+                             'set time_array', [a.array_id for a in found])
+        return found[0]
+
+    @staticmethod
+    def _source(data_set, array_id):
+        # the measured array that an _min or _max array belongs to
+        for suffix in ('_min', '_max'):
+            source = array_id[:-len(suffix)]
+            if (array_id.endswith(suffix) and source in data_set.arrays and
+                    not data_set.arrays[source].is_setpoint):
+                return source
+        return None
+
+
+def _is_integer(array):
+    dtype = array.declared_dtype
+    return dtype is not None and dtype.kind in 'iu'
+
+
+def _as_float(data, array):
+    # integer data with NaN where nothing was measured
+    if _is_integer(array):
+        return np.where(data != array.fill_value, data, np.nan)
+    return data
+
+
+def _restore(data, array):
+    if _is_integer(array):
+        return np.where(np.isnan(data), array.fill_value,
+                        np.round(data)).astype(array.declared_dtype)
+    return data
+
+
+def _mean(data, points, starts):
+    # the mean of each group of rows, weighted by their points
+    weights = points.reshape((-1,) + (1,) * (data.ndim - 1))
+    measured = ~np.isnan(data)
+    total = np.add.reduceat(np.where(measured, data * weights, 0), starts,
+                            axis=0)
+    count = np.add.reduceat(np.where(measured, weights, 0), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class Compactor:
+
+    """
+    Run the ``RetentionPolicy`` of a ``DataSet`` in a background thread.
+
+    ``DataSet.append`` calls ``poll`` after every row. Every
+    ``policy.period`` seconds it starts a thread that works out the merged
+    rows (``RetentionPolicy.plan``), and once that is done, the next
+    ``poll`` applies them. So the measurement thread only waits for the
+    rewrite, which is quick, because the data is compact by then.
+
+    Args:
+        data_set (DataSet): the time series.
+
+        policy (RetentionPolicy): what to keep.
+    """
+
+    def __init__(self, data_set, policy):
+        self.data_set = data_set
+        self.policy = policy
+        self.last_run = time.time()
+        self._thread = None
+        self._plan = None
+        self._error = None
+
+    def poll(self, now=None):
+        """
+        Apply a finished compaction, or start the next one if it's due.
+
+        Args:
+            now (Optional[float]): the current time. Default
+                ``time.time()``.
+
+        Returns:
+            int: how many rows fewer the DataSet has.
+
+        Raises:
+            RuntimeError: if the compaction failed.
+        """
+        if now is None:
+            now = time.time()
+
+        if self._thread is not None:
+            if self._thread.is_alive():
+                return 0
+            self._thread = None
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise RuntimeError('compaction of DataSet <{}> '
+                                   'failed'.format(self.data_set.location),
+                                   error)
+            plan, self._plan = self._plan, None
+            return self.policy.apply(self.data_set, plan)
+
+        if now >= self.last_run + self.policy.period:
+            self.last_run = now
+            rows = self.policy._snapshot(self.data_set)
+            self._thread = Thread(target=self._run, args=(rows, now),
+                                  daemon=True, name='DataSetCompactor')
+            self._thread.start()
+        return 0
+
+    def close(self):
+        """Wait for a running compaction, and drop its result."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._plan = None
+        self._error = None
+
+    def _run(self, rows, now):
+        try:
+            self._plan = self.policy.plan(self.data_set, rows, now)
+        except Exception:
+            self._error = format_exc()
+            logging.error(self._error)
@@ -0,0 +1,156 @@
+"""Shared-memory storage for the arrays of a live DataSet."""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# memory-backed file system, so shared arrays never touch the disk.
+# Without it there is no shared memory DataServer.
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedArrays:
+
+    """
+    The shared-memory blocks holding the arrays of one live ``DataSet``.
+
+    Each ``DataArray`` is moved into its own memory-mapped ``.npy`` file,
+    which every process that unpickles the ``DataSet`` (the ``DataServer``,
+    the loop process, readers) maps again, so they all see the same memory.
+    A small ``cursors.npy`` block holds, for each array, the lowest and
+    highest flat index the measurement has written. The writer updates the
+    cursors after writing the data, so readers never need more than the
+    cursors to know what's new.
+
+    Overwriting points inside the range already published is not tracked:
+    measurement loops store each point once, in order.
+
+    Only the directory and the array ids are pickled.
+
+    Args:
+        path (str): directory holding the blocks.
+
+        array_ids (Sequence[str]): the arrays, in cursor order.
+    """
+
+    cursor_file = 'cursors.npy'
+
+    def __init__(self, path, array_ids):
+        self.path = path
+        self.array_ids = tuple(array_ids)
+        self._index = {array_id: i for i, array_id in enumerate(array_ids)}
+        self._cursors = None
+
+    @classmethod
+    def create(cls, arrays):
+        """
+        Move initialized arrays into new shared blocks.
+
+        Args:
+            arrays (Dict[DataArray]): ``{array_id: array}`` as in
+                ``DataSet.arrays``.
+
+        Returns:
+            SharedArrays: the new blocks.
+        """
+        if SHM_DIR is None:
+            raise RuntimeError('shared arrays need /dev/shm')
+        path = tempfile.mkdtemp(prefix='qcodes_shared_', dir=SHM_DIR)
+        shared = cls(path, arrays.keys())
+        for array_id, array in arrays.items():
+            array.share(shared.array_path(array_id))
+
+        cursors = np.lib.format.open_memmap(
+            os.path.join(path, cls.cursor_file), mode='w+', dtype=np.int64,
+            shape=(len(shared.array_ids), 2))
+        cursors[:] = -1
+        shared._cursors = cursors.view(np.ndarray)
+        return shared
+
+    def array_path(self, array_id):
+        return os.path.join(self.path, array_id + '.npy')
+
+    def attach(self, arrays):
+        """
+        Map the shared blocks into arrays of another copy of the DataSet.
+
+        Args:
+            arrays (Dict[DataArray]): the arrays to map into.
+        """
+        for array_id in self.array_ids:
+            arrays[array_id].share(self.array_path(array_id))
+        # opened now so it stays readable after the blocks are deleted,
+        # just like the arrays
+        self.cursors
+
+    @property
+    def cursors(self):
+        if self._cursors is None:
+            self._cursors = np.lib.format.open_memmap(
+                os.path.join(self.path, self.cursor_file),
+                mode='r+').view(np.ndarray)
+        return self._cursors
+
+    def publish(self, array_id, low, high):
+        """
+        Announce that flat indices ``low`` to ``high`` of one array have
+        been written. Only the measurement process should call this.
+        """
+        cursors = self.cursors
+        i = self._index[array_id]
+        if cursors[i, 1] < 0 or low < cursors[i, 0]:
+            cursors[i, 0] = low
+        if high > cursors[i, 1]:
+            cursors[i, 1] = high
+
+    def ranges(self):
+        """
+        The published ``(low, high)`` flat index range of each array.
+
+        Returns:
+            Dict[Tuple[int, int]]: ``{array_id: (low, high)}``, only for
+            arrays that have data.
+        """
+        if self._cursors is None and not os.path.exists(self.path):
+            return {}
+        cursors = np.array(self.cursors)
+        return {array_id: (int(cursors[i, 0]), int(cursors[i, 1]))
+                for i, array_id in enumerate(self.array_ids)
+                if cursors[i, 1] >= 0}
+
+    def detach(self, arrays):
+        """
+        Copy arrays back to private memory.
+
+        Args:
+            arrays (Dict[DataArray]): the arrays to unshare.
+        """
+        for array in arrays.values():
+            array.unshare()
+        self._cursors = None
+
+    def release(self, arrays):
+        """
+        Copy arrays back to private memory and delete the shared blocks.
+
+        Processes that still have the blocks mapped keep their mapping.
+        Only the ``DataServer`` that created the blocks should call this.
+
+        Args:
+            arrays (Dict[DataArray]): the arrays to unshare.
+        """
+        self.detach(arrays)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __getstate__(self):
+        return {'path': self.path, 'array_ids': self.array_ids}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['array_ids'])
+        try:
+            self.cursors
+        except FileNotFoundError:
+            # already released; the DataServer has the data now
+            pass
@@ -0,0 +1,106 @@
+"""Temporary memory-mapped storage for arrays over the memory budget."""
+
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+from qcodes import config
+
+
+class MemoryBudget:
+
+    """
+    Decides which new arrays fit in memory, and backs the others with
+    temporary memory-mapped files.
+
+    Arrays made by ``allocate`` count against ``limit`` for as long as they
+    exist. An array that would take the total over ``limit`` gets a file in
+    ``directory`` instead. It is still a plain ``numpy.ndarray``, but the
+    operating system pages its data in and out as needed, so it can be
+    larger than the available memory.
+
+    A file is deleted by ``release`` (``DataSet.finalize`` calls it through
+    ``DataArray.release_spill``), or otherwise when its array is garbage
+    collected. Where files can be deleted while mapped (POSIX), the data
+    stays readable until the array is dropped.
+
+    The budget used by ``DataArray.init_data`` is ``memory_budget`` in this
+    module, set up from ``core.memory_budget`` and ``core.spill_dir`` in
+    ``qcodesrc.json``.
+
+    Args:
+        limit (Optional[int]): bytes of array data to keep in memory.
+            Default None, no limit.
+
+        directory (Optional[str]): where to put the files. Default None,
+            the system temporary directory.
+    """
+
+    def __init__(self, limit=None, directory=None):
+        self.limit = limit
+        self.directory = directory
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, shape, dtype):
+        """
+        Make a new, uninitialized array.
+
+        Args:
+            shape (Tuple[int]): the array shape.
+
+            dtype (numpy.dtype): the array dtype.
+
+        Returns:
+            Tuple[numpy.ndarray, Optional[str]]: the array, and the path of
+                its file if it didn't fit in the budget.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        with self._lock:
+            fits = (self.limit is None or not nbytes or
+                    self.used + nbytes <= self.limit)
+            if fits:
+                self.used += nbytes
+
+        if fits:
+            data = np.ndarray(shape, dtype=dtype)
+            weakref.finalize(data, self._free, nbytes)
+            return data, None
+
+        fd, path = tempfile.mkstemp(prefix='qcodes_spill_', suffix='.dat',
+                                    dir=self.directory)
+        os.close(fd)
+        mapped = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        weakref.finalize(mapped, _remove, path)
+        # a plain ndarray view indexes faster than the memmap itself
+        return mapped.view(np.ndarray), path
+
+    def release(self, path):
+        """
+        Delete the file of a spilled array, if the OS allows it while the
+        array is mapped. Otherwise it is deleted with the array.
+
+        Args:
+            path (str): the path ``allocate`` returned.
+        """
+        _remove(path)
+
+    def _free(self, nbytes):
+        with self._lock:
+            self.used -= nbytes
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # already gone, or still mapped on a platform that won't allow it
+        pass
+
+
+memory_budget = MemoryBudget(config['core']['memory_budget'],
+                             config['core']['spill_dir'])
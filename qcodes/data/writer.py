@@ -0,0 +1,174 @@
+"""Background writer that moves formatter writes off the measurement thread."""
+
+from queue import Queue
+from threading import Thread
+from traceback import format_exc
+import logging
+
+import numpy as np
+
+from .data_array import DataArray
+from .spill import memory_budget
+
+
+class BackgroundWriter:
+
+    """
+    Perform the formatter writes of a ``DataSet`` in a background thread.
+
+    The writer keeps its own mirror copy of the ``DataSet``, which only the
+    writer thread touches. Each call to ``put_changes`` (made from the
+    measurement thread) copies just the modified ranges of each array into
+    a queue, and marks them as handed off in the live arrays. The writer
+    thread applies these deltas to the mirror and then lets the formatter
+    write the mirror, exactly as it would have written the live
+    ``DataSet``.
+
+    If the queue is full, ``put_changes`` blocks until the writer catches up,
+    so a slow disk throttles the measurement rather than letting unwritten
+    data pile up in memory.
+
+    Args:
+        data_set (DataSet): the live DataSet to write. Its arrays must
+            already be initialized.
+
+        max_queue (int, optional): how many pending deltas to allow before
+            ``put_changes`` blocks. Default 10.
+    """
+
+    def __init__(self, data_set, max_queue=10):
+        self.data_set = data_set
+        self._mirror = self._make_mirror(data_set)
+        self._queue = Queue(maxsize=max_queue)
+        self._error = None
+
+        self._thread = Thread(target=self._run, daemon=True,
+                              name='DataSetWriter')
+        self._thread.start()
+
+    @staticmethod
+    def _make_mirror(data_set):
+        # import here to avoid the circular import with data_set
+        from .data_set import DataSet
+
+        mirror = DataSet(location=data_set.location, io=data_set.io,
+                         formatter=data_set.formatter, write_period=None)
+        mirror.metadata = data_set.snapshot()
+
+        clones = {}
+        for array_id, array in data_set.arrays.items():
+            data, repeats = array.compact()
+            if repeats:
+                # keep broadcast setpoints compact in the mirror too
+                data = np.broadcast_to(data.copy(), array.ndarray.shape)
+            else:
+                # within the memory budget, like the live array
+                copy, _ = memory_budget.allocate(data.shape, data.dtype)
+                copy[...] = data
+                data = copy
+            clone = DataArray(name=array.name, full_name=array.full_name,
+                              label=array.label, unit=array.unit,
+                              array_id=array_id, is_setpoint=array.is_setpoint,
+                              action_indices=array.action_indices,
+                              preset_data=data,
+                              dtype=array.declared_dtype,
+                              fill_value=array._fill_value,
+                              appendable=array.appendable)
+            clone._snapshot_input = dict(array._snapshot_input)
+            # pending modifications stay with the live array, so the first
+            # put_changes hands them to the writer thread like any other
+            clone.modified_range = None
+            clone.last_saved_index = array.last_saved_index
+            clones[array] = clone
+
+        for array, clone in clones.items():
+            clone.set_arrays = tuple(clones[sa] for sa in array.set_arrays)
+            mirror.add_array(clone)
+
+        return mirror
+
+    def put_changes(self, write_metadata=False):
+        """
+        Queue the modifications since the last call for writing.
+
+        Args:
+            write_metadata (bool): also write the current metadata once this
+                delta has been written. Default False.
+
+        Raises:
+            RuntimeError: if an earlier background write failed.
+        """
+        self._check_error()
+
+        changes = {}
+        for array_id, array in self.data_set.arrays.items():
+            mr = array.modified_range
+            if mr is None:
+                continue
+            if array.compact()[1]:
+                # read-only broadcast data can't have changed since the
+                # mirror copied it
+                changes[array_id] = (mr[0], mr[1], None)
+            else:
+                flat = array.ndarray.reshape(-1)
+                changes[array_id] = (mr[0], mr[1],
+                                     flat[mr[0]:mr[1] + 1].copy())
+            array.mark_saved(mr[1])
+
+        metadata = self.data_set.snapshot() if write_metadata else None
+
+        if changes or metadata is not None:
+            self._queue.put((changes, metadata))
+
+    def close(self):
+        """
+        Wait for all pending writes, then stop the thread and close files.
+
+        Raises:
+            RuntimeError: if any background write failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+        if hasattr(self.data_set.formatter, 'close_file'):
+            self.data_set.formatter.close_file(self._mirror)
+
+        self._check_error()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError('background write of DataSet <{}> '
+                               'failed'.format(self.data_set.location),
+                               self._error)
+
+    def _run(self):
+        mirror = self._mirror
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # keep draining so put_changes never blocks forever
+                continue
+
+            changes, metadata = item
+            try:
+                for array_id, (start, stop, vals) in changes.items():
+                    array = mirror.arrays[array_id]
+                    if array.appendable:
+                        # follow the growth of the live array
+                        row_size = int(np.prod(array.shape[1:]))
+                        array.extend(stop // row_size + 1)
+                    if vals is not None:
+                        array._make_writeable()
+                        array.ndarray.reshape(-1)[start:stop + 1] = vals
+                    array._update_modified_range(start, stop)
+
+                if metadata is not None:
+                    mirror.metadata = metadata
+
+                mirror.formatter.write(mirror, mirror.io, mirror.location,
+                                       write_metadata=metadata is not None)
+            except Exception:
+                self._error = format_exc()
+                logging.error(self._error)
@@ -81,6 +81,8 @@ class Instrument(Metadatable, DelegateAttributes, NestedAttrAccess,
 
     _all_instruments = {}
 
+    _snapshot_cacheable = True
+
     def __init__(self, name, server_name=None, **kwargs):
         self._t0 = time.time()
         super().__init__(**kwargs)
@@ -370,6 +372,7 @@ class Instrument(Metadatable, DelegateAttributes, NestedAttrAccess,
             raise KeyError('Duplicate parameter name {}'.format(name))
         param = parameter_class(name=name, instrument=self, **kwargs)
         self.parameters[name] = param
+        self.invalidate_snapshot()
 
         # for use in RemoteInstruments to add parameters to the server
         # we return the info they need to construct their proxy
@@ -408,6 +411,7 @@ class Instrument(Metadatable, DelegateAttributes, NestedAttrAccess,
             raise KeyError('Duplicate function name {}'.format(name))
         func = Function(name=name, instrument=self, **kwargs)
         self.functions[name] = func
+        self.invalidate_snapshot()
 
         # for use in RemoteInstruments to add functions to the server
         # we return the info they need to construct their proxy
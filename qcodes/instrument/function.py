@@ -58,6 +58,8 @@ class Function(Metadatable):
         **kwargs: Arbitrary keyword arguments passed to parent class
 
     """
+    _snapshot_cacheable = True
+
     def __init__(self, name, instrument=None, call_cmd=None,
                  args=None, arg_parser=None, return_parser=None,
                  docstring=None, **kwargs):
@@ -96,6 +96,8 @@ class _BaseParameter(Metadatable, DeferredOperations):
         metadata (Optional[dict]): extra information to include with the
             JSON snapshot of the parameter
     """
+    _snapshot_cacheable = True
+
     def __init__(self, name, instrument, snapshot_get, metadata):
         super().__init__(metadata)
         self._snapshot_get = snapshot_get
@@ -437,6 +439,10 @@ class ArrayParameter(_BaseParameter):
             per setpoint array. Ignored if a setpoint is a DataArray, which
             already has a unit.
 
+        dtype (Optional[numpy.dtype]): the type of the returned values, if
+            they should be stored as something other than float64, such as
+            ``'int16'`` for raw digitizer samples. See ``DataArray``.
+
         docstring (Optional[str]): documentation string for the __doc__
             field of the object. The __doc__ field of the instance is used by
             some help systems, but not all
@@ -450,7 +456,8 @@ class ArrayParameter(_BaseParameter):
     def __init__(self, name, shape, instrument=None,
                  label=None, unit=None, units=None,
                  setpoints=None, setpoint_names=None, setpoint_labels=None,
-                 setpoint_units=None, docstring=None, snapshot_get=True, metadata=None):
+                 setpoint_units=None, docstring=None, snapshot_get=True, metadata=None,
+                 dtype=None):
         super().__init__(name, instrument, snapshot_get, metadata)
 
         if self.has_set:  # TODO (alexcjohnson): can we support, ala Combine?
@@ -458,7 +465,9 @@ class ArrayParameter(_BaseParameter):
                                  'at this time.')
 
         self._meta_attrs.extend(['setpoint_names', 'setpoint_labels', 'setpoint_units',
-                                 'label', 'unit'])
+                                 'label', 'unit', 'dtype'])
+
+        self.dtype = None if dtype is None else numpy.dtype(dtype).name
 
         self.label = name if label is None else label
 
@@ -602,6 +611,10 @@ class MultiParameter(_BaseParameter):
             ``V``) per setpoint array. Ignored if a setpoint is a
             DataArray, which already has a unit.
 
+        dtypes (Optional[Tuple[numpy.dtype]]): the type of each returned
+            item, if they should be stored as something other than float64.
+            See ``DataArray``.
+
         docstring (Optional[str]): documentation string for the __doc__
             field of the object. The __doc__ field of the instance is used by
             some help systems, but not all
@@ -616,7 +629,8 @@ class MultiParameter(_BaseParameter):
                  labels=None, units=None,
                  setpoints=None, setpoint_names=None, setpoint_labels=None,
                  setpoint_units=None,
-                 docstring=None, snapshot_get=True, metadata=None):
+                 docstring=None, snapshot_get=True, metadata=None,
+                 dtypes=None):
         super().__init__(name, instrument, snapshot_get, metadata)
 
         if self.has_set:  # TODO (alexcjohnson): can we support, ala Combine?
@@ -624,7 +638,14 @@ class MultiParameter(_BaseParameter):
                                  'at this time.')
 
         self._meta_attrs.extend(['setpoint_names', 'setpoint_labels', 'setpoint_units',
-                                 'names', 'labels', 'units'])
+                                 'names', 'labels', 'units', 'dtypes'])
+
+        if dtypes is not None:
+            if len(dtypes) != len(names):
+                raise ValueError('dtypes must have one entry per name')
+            dtypes = tuple(None if dtype is None else numpy.dtype(dtype).name
+                           for dtype in dtypes)
+        self.dtypes = dtypes
 
         if not is_sequence_of(names, str):
             raise ValueError('names must be a tuple of strings, not' +
@@ -1,8 +1,7 @@
 from qcodes import VisaInstrument
 from qcodes.utils import validators as vals
-from cmath import phase
 import numpy as np
-from qcodes import MultiParameter, Parameter
+from qcodes import MultiParameter, ArrayParameter, Parameter
 
 
 class FrequencySweep(MultiParameter):
@@ -31,26 +30,31 @@ class FrequencySweep(MultiParameter):
         self.shapes = ((npts,), (npts,))
 
     def get(self):
-        self._instrument.write('SENS1:AVER:STAT ON')
-        self._instrument.write('AVER:CLE')
-        self._instrument.cont_meas_off()
+        data = self._instrument.get_sweep_data()
+        return np.abs(data), np.angle(data)
 
-        # instrument averages over its last 'avg' number of sweeps
-        # need to ensure averaged result is returned
-        for avgcount in range(self._instrument.avg()):
-            self._instrument.write('INIT:IMM; *WAI')
-        data_str = self._instrument.ask('CALC:DATA? SDAT').split(',')
-        data_list = [float(v) for v in data_str]
-
-        # data_list of complex numbers [re1,im1,re2,im2...]
-        data_arr = np.array(data_list).reshape(int(len(data_list) / 2), 2)
-        mag_array, phase_array = [], []
-        for comp in data_arr:
-            complex_num = complex(comp[0], comp[1])
-            mag_array.append(abs(complex_num))
-            phase_array.append(phase(complex_num))
-        self._instrument.cont_meas_on()
-        return mag_array, phase_array
+
+class ComplexFrequencySweep(ArrayParameter):
+    """
+    Hardware controlled parameter class for Rohde Schwarz RSZNB20 trace,
+    returning the raw complex transmission data.
+
+    It is stored in a complex ``DataArray``, so magnitude and phase can be
+    computed later with numpy, eg ``np.abs(data.trace_iq)``.
+    """
+    def __init__(self, name, instrument, start, stop, npts):
+        super().__init__(name, shape=(npts,), instrument=instrument,
+                         label='Transmission', setpoint_names=('frequency',),
+                         setpoint_units=('Hz',), dtype='complex128')
+        self.set_sweep(start, stop, npts)
+
+    def set_sweep(self, start, stop, npts):
+        f = tuple(np.linspace(int(start), int(stop), num=npts))
+        self.setpoints = (f,)
+        self.shape = (npts,)
+
+    def get(self):
+        return self._instrument.get_sweep_data()
 
 
 class ZNB20(VisaInstrument):
@@ -112,6 +116,12 @@ class ZNB20(VisaInstrument):
                            npts=self.npts(),
                            parameter_class=FrequencySweep)
 
+        self.add_parameter(name='trace_iq',
+                           start=self.start(),
+                           stop=self.stop(),
+                           npts=self.npts(),
+                           parameter_class=ComplexFrequencySweep)
+
         self.add_function('reset', call_cmd='*RST')
         self.add_function('tooltip_on', call_cmd='SYST:ERR:DISP ON')
         self.add_function('tooltip_off', call_cmd='SYST:ERR:DISP OFF')
@@ -126,20 +136,43 @@ class ZNB20(VisaInstrument):
         self.initialise()
         self.connect_message()
 
+    def get_sweep_data(self):
+        """
+        Take an averaged sweep.
+
+        Returns:
+            np.ndarray: the complex transmission at each frequency.
+        """
+        self.write('SENS1:AVER:STAT ON')
+        self.write('AVER:CLE')
+        self.cont_meas_off()
+
+        # instrument averages over its last 'avg' number of sweeps
+        # need to ensure averaged result is returned
+        for avgcount in range(self.avg()):
+            self.write('INIT:IMM; *WAI')
+        data_str = self.ask('CALC:DATA? SDAT')
+        self.cont_meas_on()
+
+        # the instrument returns [re1,im1,re2,im2...]
+        return np.array(data_str.split(','), dtype=float).view(complex)
+
+    def _set_sweep(self, start, stop, npts):
+        # update setpoints for the sweep parameters
+        self.trace.set_sweep(start, stop, npts)
+        self.trace_iq.set_sweep(start, stop, npts)
+
     def _set_start(self, val):
         self.write('SENS:FREQ:START {:.4f}'.format(val))
-        # update setpoints for FrequencySweep param
-        self.trace.set_sweep(val, self.stop(), self.npts())
+        self._set_sweep(val, self.stop(), self.npts())
 
     def _set_stop(self, val):
         self.write('SENS:FREQ:STOP {:.4f}'.format(val))
-        # update setpoints for FrequencySweep param
-        self.trace.set_sweep(self.start(), val, self.npts())
+        self._set_sweep(self.start(), val, self.npts())
 
     def _set_npts(self, val):
         self.write('SENS:SWE:POIN {:.4f}'.format(val))
-        # update setpoints for FrequencySweep param
-        self.trace.set_sweep(self.start(), self.stop(), val)
+        self._set_sweep(self.start(), self.stop(), val)
 
     def initialise(self):
         self.write('*RST')
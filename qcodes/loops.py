@@ -568,6 +568,13 @@ class ActiveLoop(Metadatable):
         sp_names = getattr(action, 'setpoint_names', None)
         sp_labels = getattr(action, 'setpoint_labels', None)
         sp_units = getattr(action, 'setpoint_units', None)
+        # declared value types (eg int16 samples or complex IQ data)
+        # are kept in the DataArrays, everything else is stored as float
+        dtypes = getattr(action, 'dtypes', None)
+        if dtypes is None:
+            dtypes = (getattr(action, 'dtype', None),) * num_arrays
+        else:
+            dtypes = self._fill_blank(dtypes, (None,) * num_arrays)
 
         if shapes is None:
             shapes = (getattr(action, 'shape', ()),) * num_arrays
@@ -588,9 +595,10 @@ class ActiveLoop(Metadatable):
         # now loop through these all, to make the DataArrays
         # record which setpoint arrays we've made, so we don't duplicate
         all_setpoints = {}
-        for name, full_name, label, unit, shape, i, sp_vi, sp_ni, sp_li, sp_ui in zip(
+        for (name, full_name, label, unit, shape, i, sp_vi, sp_ni, sp_li,
+                sp_ui, dtype) in zip(
                 names, full_names, labels, units, shapes, action_indices,
-                sp_vals, sp_names, sp_labels, sp_units):
+                sp_vals, sp_names, sp_labels, sp_units, dtypes):
 
             if shape is None or shape == ():
                 shape, sp_vi, sp_ni, sp_li, sp_ui= (), (), (), (), ()
@@ -613,7 +621,8 @@ class ActiveLoop(Metadatable):
             # finally, make the output data array with these setpoints
             out.append(DataArray(name=name, full_name=full_name, label=label,
                                  shape=shape, action_indices=i, unit=unit,
-                                 set_arrays=setpoints, parameter=action))
+                                 set_arrays=setpoints, parameter=action,
+                                 dtype=dtype))
 
         return out
 
@@ -657,15 +666,9 @@ class ActiveLoop(Metadatable):
                          shape=shape, preset_data=vals, unit=unit, is_setpoint=True)
 
     def _default_setpoints(self, shape):
-        if len(shape) == 1:
-            return np.arange(0, shape[0], 1)
-
-        sp = np.ndarray(shape)
-        sp_inner = self._default_setpoints(shape[1:])
-        for i in range(len(sp)):
-            sp[i] = sp_inner
-
-        return sp
+        # the index along the last dimension, repeated over the others by
+        # a read-only view rather than copied
+        return np.broadcast_to(np.arange(0, shape[-1], 1), shape)
 
     def set_common_attrs(self, data_set, use_threads, signal_queue):
         """
@@ -1018,6 +1021,9 @@ class ActiveLoop(Metadatable):
 
                     last_task = t
 
+        # a row is complete: send any batched stores to the DataServer
+        self.data_set.flush_stores()
+
         if self.progress_interval is not None:
             # final progress note: set dt=-1 so it *always* prints
             tprint('loop %s DONE: %d/%d (%.1f [s])' % (
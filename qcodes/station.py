@@ -65,6 +65,16 @@ class Station(Metadatable, DelegateAttributes):
 
         self.default_measurement = []
 
+    @property
+    def _snapshot_cacheable(self):
+        # Our snapshot can only be cached if all of its parts track their
+        # changes. Remote components, for instance, don't.
+        parts = list(self.components.values()) + [
+            action for action in self.default_measurement
+            if hasattr(action, 'snapshot')]
+        return all(getattr(part, '_snapshot_cacheable', False) is True
+                   for part in parts)
+
     def snapshot_base(self, update=False):
         """
         State of the station as a JSON-compatible dict.
@@ -123,6 +133,7 @@ class Station(Metadatable, DelegateAttributes):
                            'component{}'.format(len(self.components)))
         name = make_unique(str(name), self.components)
         self.components[name] = component
+        self.invalidate_snapshot()
         return name
 
     def set_measurement(self, *actions):
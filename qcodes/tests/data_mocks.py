@@ -91,7 +91,7 @@ class MockArray:
         self.ready = True
 
 
-def DataSet1D(location=None, name=None):
+def DataSet1D(location=None, name=None, io=None):
     # DataSet with one 1D array with 5 points
 
     # TODO: since y lists x as a set_array, it should automatically
@@ -101,7 +101,7 @@ def DataSet1D(location=None, name=None):
                   is_setpoint=True)
     y = DataArray(name='y', label='Y', preset_data=(3., 4., 5., 6., 7.),
                   set_arrays=(x,))
-    return new_data(arrays=(x, y), location=location, name=name)
+    return new_data(arrays=(x, y), location=location, name=name, io=io)
 
 
 def DataSet2D(location=None, name=None):
@@ -0,0 +1,92 @@
+from unittest import TestCase
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+
+from qcodes.data.catalog import Catalog, find
+from qcodes.data.io import DiskIO
+from qcodes.utils.helpers import LogCapture
+
+from .data_mocks import DataSet1D, DataSet2D
+
+
+class TestCatalog(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.io = DiskIO(self.tmpdir)
+        self.catalog = Catalog(os.path.join(self.tmpdir, 'catalog.db'),
+                               snapshot_keys=['loop.ts_start', 'food'])
+        self.original_default = Catalog.default
+
+    def tearDown(self):
+        Catalog.default = self.original_default
+        shutil.rmtree(self.tmpdir)
+
+    def make_data(self, location, maker, ts_start):
+        data = maker(location)
+        data.io = self.io
+        data.add_metadata({'loop': {'ts_start': ts_start}})
+        return data
+
+    def test_save_metadata_indexes(self):
+        Catalog.default = self.catalog
+
+        data1 = self.make_data('2017-03-01/#001', DataSet1D,
+                               '2017-03-01 10:00:00')
+        data1.add_metadata({'food': 'pizza'})
+        data2 = self.make_data('2017-03-02/#001', DataSet2D,
+                               '2017-03-02 10:00:00')
+        for data in (data1, data2):
+            data.finalize()
+
+        self.assertEqual(find(), ['2017-03-01/#001', '2017-03-02/#001'])
+        self.assertEqual(find(location='2017-03-02*'), ['2017-03-02/#001'])
+        self.assertEqual(find(array_id='z'), ['2017-03-02/#001'])
+        self.assertEqual(find(array_id='y'), ['2017-03-01/#001'])
+        self.assertEqual(find(since='2017-03-02'), ['2017-03-02/#001'])
+        self.assertEqual(find(until='2017-03-02'), ['2017-03-01/#001'])
+        self.assertEqual(find(keys={'food': 'pizza'}), ['2017-03-01/#001'])
+        self.assertEqual(find(keys={'food': 'pizza'}, array_id='z'), [])
+
+        # re-indexing replaces the old entry
+        data1.metadata['food'] = 'pasta'
+        data1.save_metadata()
+        self.assertEqual(find(keys={'food': 'pizza'}), [])
+        self.assertEqual(find(keys={'food': 'pasta'}), ['2017-03-01/#001'])
+
+        self.catalog.remove('2017-03-01/#001')
+        self.assertEqual(find(), ['2017-03-02/#001'])
+
+    def test_catalog_errors_logged(self):
+        Catalog.default = self.catalog
+        data = self.make_data('2017-03-01/#001', DataSet1D,
+                              '2017-03-01 10:00:00')
+        with patch.object(self.catalog, 'add',
+                          side_effect=RuntimeError('locked')):
+            with LogCapture() as logs:
+                data.finalize()
+
+        self.assertIn('error indexing DataSet 2017-03-01/#001', logs.value)
+        self.assertIn('locked', logs.value)
+        self.assertTrue(self.io.list('2017-03-01/#001'))
+
+    def test_rebuild(self):
+        for i in range(3):
+            data = self.make_data('run/#{:03}'.format(i), DataSet1D,
+                                  '2017-03-0{} 10:00:00'.format(i + 1))
+            data.finalize()
+
+        for workers in (None, 2):
+            catalog = Catalog(
+                os.path.join(self.tmpdir, 'rebuilt{}.db'.format(workers)))
+            self.assertEqual(catalog.rebuild(self.io, workers=workers), 3)
+            self.assertEqual(catalog.find(array_id='y'),
+                             ['run/#000', 'run/#001', 'run/#002'])
+            self.assertEqual(catalog.find(since='2017-03-02'),
+                             ['run/#001', 'run/#002'])
+
+    def test_no_default(self):
+        Catalog.default = None
+        with self.assertRaises(RuntimeError):
+            find()
@@ -0,0 +1,250 @@
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from qcodes.data.chunked_format import ChunkedFormat
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import DataSet, new_data, load_data
+from qcodes.data.io import DiskIO
+
+from .data_mocks import DataSet2D
+
+
+class TestChunkedFormat(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.io = DiskIO(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def chunk_files(self, location, array_id):
+        return sorted(fn for fn in os.listdir(
+            os.path.join(self.tmpdir, location, array_id))
+            if fn.endswith('.npy'))
+
+    def test_chunk_shape(self):
+        formatter = ChunkedFormat(chunk_size=100)
+        self.assertEqual(formatter.chunk_shape((1000,)), (100,))
+        self.assertEqual(formatter.chunk_shape((10,)), (10,))
+        self.assertEqual(formatter.chunk_shape((50, 40)), (2, 40))
+        self.assertEqual(formatter.chunk_shape((5, 500)), (1, 100))
+
+        with self.assertRaises(ValueError):
+            ChunkedFormat(chunk_size=0)
+
+    def test_write_read(self):
+        formatter = ChunkedFormat(chunk_size=12)
+        data = DataSet2D(location='2d')
+        data.io = self.io
+        data.formatter = formatter
+        data.finalize()
+
+        # z is (6, 4), in chunks of (3, 4)
+        self.assertEqual(self.chunk_files('2d', 'z'), ['0.0.npy', '1.0.npy'])
+        with open(os.path.join(self.tmpdir, '2d', 'z', 'array.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['shape'], [6, 4])
+        self.assertEqual(manifest['chunks'], [3, 4])
+        self.assertEqual(manifest['set_arrays'], ['x_set', 'y_set'])
+
+        data2 = load_data('2d', formatter=formatter, io=self.io)
+        for array_id in ('x_set', 'y_set', 'z'):
+            np.testing.assert_array_equal(data2.arrays[array_id].ndarray,
+                                          data.arrays[array_id].ndarray)
+            self.assertIsNone(data2.arrays[array_id].modified_range)
+        self.assertEqual(data2.z.set_arrays, (data2.x_set, data2.y_set))
+        self.assertEqual(data2.z.label, 'Z')
+        self.assertEqual(data2.z.last_saved_index, 23)
+        self.assertEqual(data2.metadata['arrays']['z']['label'], 'Z')
+
+        # lazy reads only load the arrays that are used
+        data3 = load_data('2d', formatter=formatter, io=self.io, lazy=True)
+        self.assertFalse(data3.z.is_loaded)
+        self.assertEqual(data3.z.tolist(), data.z.tolist())
+        self.assertFalse(data3.y_set.is_loaded)
+
+    def test_dirty_chunks(self):
+        formatter = ChunkedFormat(chunk_size=10)
+        x = DataArray(name='x', preset_data=np.arange(4.), is_setpoint=True)
+        y = DataArray(name='y', preset_data=np.arange(25.), is_setpoint=True)
+        z = DataArray(name='z', shape=(4, 25), set_arrays=(x, y),
+                      dtype='int32', fill_value=-1)
+        data = new_data(arrays=(x, y, z), location='dirty', io=self.io,
+                        formatter=formatter)
+
+        z[1, 3] = 5
+        data.write()
+        # never measured chunks are not written
+        self.assertEqual(self.chunk_files('dirty', 'z'), ['1.0.npy'])
+
+        z[3, 10:13] = 7
+        saved = []
+        save = formatter._write_chunk
+        with patch.object(formatter, '_write_chunk',
+                          lambda *args: saved.append(args[3]) or save(*args)):
+            data.write()
+        self.assertEqual(saved, [(3, 1)])
+
+        data2 = load_data('dirty', formatter=formatter, io=self.io)
+        self.assertEqual(data2.z.ndarray.dtype, np.int32)
+        self.assertEqual(data2.z.fill_value, -1)
+        np.testing.assert_array_equal(data2.z.ndarray, z.ndarray)
+        self.assertEqual(data2.z.last_saved_index, 3 * 25 + 12)
+
+    def test_parallel_writers(self):
+        formatter = ChunkedFormat(chunk_size=50, workers=4)
+        shape = (8, 50)
+
+        # two writers, each with its own copy of the DataSet, each
+        # measuring their own rows
+        for rows in (slice(0, 4), slice(4, 8)):
+            x = DataArray(name='x', preset_data=np.arange(8.),
+                          is_setpoint=True)
+            y = DataArray(name='y', preset_data=np.arange(50.),
+                          is_setpoint=True)
+            z = DataArray(name='z', shape=shape, set_arrays=(x, y))
+            data = DataSet(arrays=(x, y, z), location='parallel',
+                           io=self.io, formatter=formatter)
+            z.init_data()
+            z[rows] = np.arange(400.).reshape(shape)[rows]
+            data.write()
+
+        data2 = load_data('parallel', formatter=formatter, io=self.io)
+        np.testing.assert_array_equal(data2.z.ndarray,
+                                      np.arange(400.).reshape(shape))
+
+    def test_read_region(self):
+        formatter = ChunkedFormat(chunk_size=7)
+        data = DataSet2D(location='region')
+        data.io = self.io
+        data.formatter = formatter
+        data.write()
+        reader = DataSet(location='region', io=self.io, formatter=formatter)
+        z = data.z.ndarray
+
+        for region in [(slice(1, 5),),
+                       (slice(None), 2),
+                       (slice(4, 0, -2), slice(None, None, 3)),
+                       (-1, slice(1, 3)),
+                       (slice(2, 2),)]:
+            np.testing.assert_array_equal(
+                formatter.read_region(reader, 'z', region), z[region])
+
+        # only the overlapping chunks are read
+        with patch('qcodes.data.chunked_format.np.load',
+                   wraps=np.load) as mock_load:
+            formatter.read_region(reader, 'z', (slice(2, 4),))
+        loaded = sorted(os.path.basename(call[0][0])
+                        for call in mock_load.call_args_list)
+        self.assertEqual(loaded, ['2.0.npy', '3.0.npy'])
+        self.assertEqual(reader.arrays, {})
+
+    def test_read_part(self):
+        formatter = ChunkedFormat(chunk_size=8)
+        data = DataSet2D(location='part')
+        data.io = self.io
+        data.formatter = formatter
+        data.write()
+
+        with patch('qcodes.data.chunked_format.np.load',
+                   wraps=np.load) as mock_load:
+            data2 = load_data('part', formatter=formatter, io=self.io,
+                              arrays=['z'], region={'x': slice(2, 4)})
+        # z and y_set are in chunks of 2 rows, x_set in one chunk
+        loaded = sorted(call[0][0][len(self.tmpdir) + 1:]
+                        for call in mock_load.call_args_list)
+        self.assertEqual(loaded, [os.path.join('part', 'x_set', '0.npy'),
+                                  os.path.join('part', 'y_set', '1.0.npy'),
+                                  os.path.join('part', 'z', '1.0.npy')])
+        np.testing.assert_array_equal(data2.z.ndarray, data.z.ndarray[2:4])
+        np.testing.assert_array_equal(data2.x_set.ndarray, [2, 3])
+        self.assertEqual(data2.z.set_arrays, (data2.x_set, data2.y_set))
+
+    def test_broadcast(self):
+        formatter = ChunkedFormat(chunk_size=4)
+        x = DataArray(name='x', preset_data=np.arange(5.), is_setpoint=True)
+        y = DataArray(name='y', preset_data=np.arange(6.), is_setpoint=True)
+        y.nest(5, set_array=x)
+        z = DataArray(name='z', shape=(5, 6), set_arrays=(x, y))
+        data = new_data(arrays=(x, y, z), location='bc', io=self.io,
+                        formatter=formatter)
+        data.write_period = None
+        data.background_write = True
+        for i in range(5):
+            data.store((i,), {'z': np.arange(6.) + 10 * i})
+            data.write()
+        data.finalize()
+
+        # the nested setpoints are stored once
+        manifest_path = os.path.join(self.tmpdir, 'bc', 'y_set', 'array.json')
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['shape'], [5, 6])
+        self.assertEqual(manifest['broadcast'], 1)
+        self.assertEqual(manifest['chunks'], [4])
+        self.assertEqual(self.chunk_files('bc', 'y_set'),
+                         ['0.npy', '1.npy'])
+
+        data2 = load_data('bc', formatter=formatter, io=self.io)
+        self.assertEqual(data2.y_set.compact()[1], 1)
+        np.testing.assert_array_equal(data2.y_set.ndarray, y.ndarray)
+        np.testing.assert_array_equal(data2.z.ndarray, z.ndarray)
+        self.assertEqual(data2.y_set.last_saved_index, 29)
+        np.testing.assert_array_equal(
+            formatter.read_region(data2, 'y_set', (slice(1, 3), 4)), [4, 4])
+        np.testing.assert_array_equal(
+            formatter.read_region(data2, 'y_set', (2, slice(None, 2))),
+            [0, 1])
+
+        # once written into, the whole array is saved again
+        data2.y_set[0, 0] = -1
+        data2.write()
+        self.assertNotIn('broadcast', formatter._read_manifest(manifest_path))
+        data3 = load_data('bc', formatter=formatter, io=self.io)
+        self.assertEqual(data3.y_set.ndarray[:, 0].tolist(), [-1, 0, 0, 0, 0])
+
+    def test_appendable(self):
+        formatter = ChunkedFormat(chunk_size=8)
+        t = DataArray(name='t', shape=(0,), is_setpoint=True,
+                      appendable=True)
+        f = DataArray(name='f', preset_data=np.arange(2.), is_setpoint=True,
+                      appendable=True)
+        f.nest(0, set_array=t)
+        s = DataArray(name='s', shape=(0, 2), set_arrays=(t, f),
+                      appendable=True)
+        data = new_data(arrays=(t, f, s), location='log', io=self.io,
+                        formatter=formatter)
+        for i in range(3):
+            data.append({'t_set': i, 's': [i, -i]})
+        data.write()
+        reader = load_data('log', formatter=formatter, io=self.io)
+        self.assertEqual(reader.s.shape, (3, 2))
+
+        for i in range(3, 9):
+            data.append({'t_set': i, 's': [i, -i]})
+        data.write()
+        # the chunk grid doesn't depend on the length so far
+        self.assertEqual(self.chunk_files('log', 's'),
+                         ['0.0.npy', '1.0.npy', '2.0.npy'])
+        manifest = formatter._read_manifest(
+            os.path.join(self.tmpdir, 'log', 's', 'array.json'))
+        self.assertEqual(manifest['shape'], [9, 2])
+        self.assertEqual(manifest['chunks'], [4, 2])
+
+        reader.read()
+        self.assertTrue(reader.s.appendable)
+        np.testing.assert_array_equal(reader.s.ndarray, s.ndarray)
+        np.testing.assert_array_equal(reader.t_set.ndarray, np.arange(9))
+        self.assertEqual(reader.f_set.ndarray.tolist(), [[0, 1]] * 9)
+
+    def test_no_data(self):
+        data = DataSet(location='nothing', io=self.io,
+                       formatter=ChunkedFormat())
+        with self.assertRaises(IOError):
+            data.read()
@@ -4,10 +4,15 @@ import numpy as np
 import os
 import pickle
 import logging
+import time
+import gc
+import shutil
+import tempfile
 
 from qcodes.data.data_array import DataArray
-from qcodes.data.manager import get_data_manager, NoData
-from qcodes.data.io import DiskIO
+from qcodes.data.manager import get_data_manager, DataManager, NoData
+from qcodes.data.io import DiskIO, MemoryIO
+from qcodes.data.spill import MemoryBudget
 from qcodes.data.data_set import load_data, new_data, DataMode, DataSet
 from qcodes.process.helpers import kill_processes
 from qcodes.utils.helpers import LogCapture
@@ -239,6 +244,41 @@ class TestDataArray(TestCase):
         with self.assertRaises(TypeError):
             data.nest(4)
 
+    def test_nest_broadcast(self):
+        data = DataArray(preset_data=[1, 2])
+        outer = DataArray(preset_data=[5, 6, 7, 8])
+        data.nest(3, set_array=outer)
+        data.nest(4, set_array=outer)
+
+        # the preset data is stored once, repeated by a read-only view
+        self.assertEqual(data.ndarray.strides[:2], (0, 0))
+        self.assertFalse(data.ndarray.flags.writeable)
+        compact, repeats = data.compact()
+        self.assertEqual(compact.tolist(), [1, 2])
+        self.assertEqual(repeats, 2)
+        self.assertEqual(data.modified_range, (0, 23))
+
+        # and pickled once too
+        data2 = pickle.loads(pickle.dumps(data))
+        self.assertEqual(data2.compact()[1], 2)
+        self.assertEqual(data2.ndarray.tolist(), data.ndarray.tolist())
+
+        # writing makes a full copy first
+        data.mark_saved(23)
+        data[1, 2, 0] = 9
+        self.assertTrue(data.ndarray.flags.writeable)
+        self.assertEqual(data.compact()[1], 0)
+        self.assertEqual(data.ndarray[:, :, 0].sum(), 9 + 11 * 1)
+        self.assertEqual(data.modified_range, (10, 10))
+
+        data2.set_many([(0, 0, 1)], [3])
+        self.assertEqual(data2.ndarray[0, 0].tolist(), [1, 3])
+        self.assertEqual(data2.ndarray[0, 1].tolist(), [1, 2])
+
+        # other errors still get through
+        with self.assertRaises(ValueError):
+            data2[0, 0] = [1, 2, 3]
+
     def test_data_set_property(self):
         data = DataArray(preset_data=[1, 2])
         self.assertIsNone(data.data_set)
@@ -281,6 +321,370 @@ class TestDataArray(TestCase):
         data.synced_index = 22
         self.assertEqual(data.fraction_complete(), 23/50)
 
+    def test_loader(self):
+        data = DataArray(shape=(3,))
+        calls = []
+
+        def loader():
+            calls.append(1)
+            data.init_data([1, 2, 3])
+
+        data.set_loader(loader)
+        self.assertFalse(data.is_loaded)
+        self.assertEqual(calls, [])
+
+        # first access to the data triggers the loader, exactly once
+        self.assertEqual(data.tolist(), [1, 2, 3])
+        self.assertEqual(len(data), 3)
+        self.assertTrue(data.is_loaded)
+        self.assertEqual(calls, [1])
+
+    def test_dtype(self):
+        data = DataArray(shape=(2, 3), dtype='int16')
+        data.init_data()
+        self.assertEqual(data.ndarray.dtype, np.int16)
+        self.assertEqual(data.fill_value, -32768)
+        self.assertFalse(data.measured_mask().any())
+
+        data[0, 1] = 7
+        np.testing.assert_array_equal(data.measured_mask()[0],
+                                      [False, True, False])
+        self.assertEqual(data.snapshot()['dtype'], 'int16')
+        self.assertEqual(data.snapshot()['fill_value'], -32768)
+        view = data.view(resolution=1)
+        self.assertEqual(view.count.sum(), 1)
+        self.assertEqual(view.max.max(), 7)
+
+        # sync keeps the type, via the snapshot
+        copy = DataArray(shape=(2, 3), snapshot=data.snapshot())
+        copy.apply_changes(**data.get_changes(copy.get_synced_index()))
+        self.assertEqual(copy.ndarray.dtype, np.int16)
+        np.testing.assert_array_equal(copy.ndarray, data.ndarray)
+
+        data.clear()
+        self.assertFalse(data.measured_mask().any())
+
+        unsigned = DataArray(shape=(2,), dtype='uint8', fill_value=0)
+        unsigned.init_data()
+        self.assertEqual(unsigned.ndarray.tolist(), [0, 0])
+
+        floats = DataArray(preset_data=[1, 2], dtype='float32')
+        self.assertEqual(floats.ndarray.dtype, np.float32)
+        self.assertTrue(np.isnan(floats.fill_value))
+
+        with self.assertRaises(ValueError):
+            DataArray(shape=(2,), dtype='U3')
+        with self.assertRaises(ValueError):
+            DataArray(shape=(2,), dtype=float, fill_value=0)
+
+    def test_complex(self):
+        data = DataArray(shape=(40,), dtype=complex)
+        data.init_data()
+        self.assertEqual(data.ndarray.dtype, np.complex128)
+        self.assertTrue(np.isnan(data.fill_value))
+        self.assertFalse(data.measured_mask().any())
+
+        data[0] = 3 + 4j
+        data[1:3] = [1j, -2]
+        self.assertEqual(data.measured_mask().sum(), 3)
+        self.assertEqual(data.snapshot()['dtype'], 'complex128')
+
+        # summaries are of the magnitude
+        view = data.view(resolution=2)
+        self.assertEqual(view.max[0], 5)
+        self.assertEqual(view.min[0], 1)
+        self.assertEqual(view.count.sum(), 3)
+        view = data.view(resolution=40)
+        self.assertEqual(view.max[:3].tolist(), [5, 1, 2])
+
+        copy = DataArray(shape=(40,), snapshot=data.snapshot())
+        copy.apply_changes(**data.get_changes(copy.get_synced_index()))
+        self.assertEqual(copy[:3].tolist(), [3 + 4j, 1j, -2])
+
+    def test_set_many(self):
+        data = DataArray(shape=(2, 3))
+        data.init_data()
+
+        data.set_many([(0, 1), (1, 2), (0, 0)], [1, 2, 3])
+        self.assertEqual(data.modified_range, (0, 5))
+        np.testing.assert_array_equal(data.ndarray[0, :2], [3, 1])
+        self.assertEqual(data[1, 2], 2)
+
+        # partial indices and slices go point by point, still in order
+        data.modified_range = None
+        data.set_many([(1,), (1, 0)], [[4, 5, 6], 7])
+        self.assertEqual(data.modified_range, (3, 5))
+        np.testing.assert_array_equal(data.ndarray[1], [7, 5, 6])
+
+    def test_extend(self):
+        data = DataArray(shape=(0, 2), appendable=True)
+        data.init_data()
+        capacities = set()
+        for i in range(20):
+            data.extend(i + 1)
+            data[i] = [i, -i]
+            capacities.add(len(data._buffer))
+        self.assertEqual(data.shape, (20, 2))
+        self.assertEqual(data.ndarray[:, 0].tolist(), list(range(20)))
+        # the buffer doubles, so few reallocations
+        self.assertEqual(sorted(capacities), [1, 2, 4, 8, 16, 32])
+        self.assertEqual(data.modified_range, (0, 39))
+
+        # new rows are unmeasured
+        data.extend(22)
+        self.assertTrue(np.isnan(data.ndarray[20:]).all())
+        self.assertEqual(data.snapshot()['appendable'], True)
+
+        # broadcast setpoints stay broadcast, and have their values
+        setpoints = DataArray(preset_data=[1., 2.], appendable=True)
+        setpoints.nest(0, set_array=data)
+        setpoints.modified_range = None
+        setpoints.extend(3)
+        self.assertEqual(setpoints.compact()[1], 1)
+        self.assertEqual(setpoints.ndarray.tolist(), [[1, 2]] * 3)
+        self.assertEqual(setpoints.modified_range, (0, 5))
+
+        with self.assertRaises(RuntimeError):
+            DataArray(shape=(3,)).extend(4)
+
+    def test_view(self):
+        data = DataArray(shape=(1000,))
+        data.init_data()
+        data[:500] = np.arange(500)
+
+        view = data.view(resolution=10)
+        self.assertEqual(view.factor, (32,))
+        self.assertEqual(view.min.shape, (32,))
+        self.assertEqual(view.min[:3].tolist(), [0, 32, 64])
+        self.assertEqual(view.max[:3].tolist(), [31, 63, 95])
+        self.assertEqual(view.mean[0], 15.5)
+        self.assertEqual(view.count[:17].tolist(), [32] * 15 + [20, 0])
+        self.assertTrue(np.isnan(view.mean[16]))
+
+        # later stores update the summaries incrementally
+        data[500] = -1
+        data[999] = 1000
+        view = data.view(resolution=10)
+        self.assertEqual((view.min[15], view.count[15]), (-1, 21))
+        self.assertEqual((view.max[-1], view.count[-1]), (1000, 1))
+        self.assertEqual(data.view(resolution=1).factor, (2048,))
+        self.assertEqual(data.view(resolution=1).mean.tolist(),
+                         [(124750 - 1 + 1000) / 502])
+
+        # just above the resolution: buckets smaller than level 0 has
+        data3 = DataArray(preset_data=np.arange(1500.))
+        view = data3.view(1000)
+        self.assertEqual(view.factor, (1,))
+        self.assertEqual(view.min.shape, (1500,))
+        view = data3.view(700)
+        self.assertEqual(view.factor, (2,))
+        self.assertEqual(view.max[:2].tolist(), [1, 3])
+        data3[0] = -1
+        self.assertEqual(data3.view(700).min[0], -1)
+
+        # small enough already: the data itself
+        view = data.view(resolution=1000)
+        self.assertIs(view.min, data.ndarray)
+        self.assertEqual(view.factor, (1,))
+
+        # only the dimensions that don't fit are reduced
+        data2 = DataArray(preset_data=np.arange(3000.).reshape(3, 1000))
+        view = data2.view(resolution=(100, 100))
+        self.assertEqual(view.factor, (1, 8))
+        self.assertEqual(view.min.shape, (3, 125))
+        self.assertEqual(view.max[2, 0], 2007)
+
+        data2.apply_changes(0, 0, [-5])
+        self.assertEqual(data2.view(resolution=(100, 100)).min[0, 0], -5)
+
+        data2.ndarray = np.zeros((3, 1000))
+        self.assertEqual(data2.view(resolution=(100, 100)).min[0, 0], 0)
+
+
+class TestMemoryBudget(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.budget = MemoryBudget(limit=1000, directory=self.tmpdir)
+        patcher = patch('qcodes.data.data_array.memory_budget', self.budget)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_spill(self):
+        small = DataArray(shape=(100,))
+        small.init_data()
+        self.assertIsNone(small._spill_path)
+        self.assertEqual(self.budget.used, 800)
+
+        # over the budget: same interface, but in a temporary file
+        big = DataArray(shape=(10, 20), dtype='int32', fill_value=-1)
+        big.init_data()
+        self.assertEqual(os.listdir(self.tmpdir),
+                         [os.path.basename(big._spill_path)])
+        self.assertEqual(big.ndarray.shape, (10, 20))
+        self.assertEqual(big.ndarray.dtype, np.int32)
+        self.assertTrue((big.ndarray == -1).all())
+        big[3, 4] = 7
+        self.assertEqual(big.ndarray.sum(), 7 - 199)
+        self.assertEqual(self.budget.used, 800)
+
+        # freed memory can be used again
+        del small
+        gc.collect()
+        self.assertEqual(self.budget.used, 0)
+
+        big2 = pickle.loads(pickle.dumps(big))
+        self.assertIsNone(big2._spill_path)
+        self.assertEqual(big2[3, 4], 7)
+
+        big.release_spill()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertEqual(big[3, 4], 7)
+
+    def test_finalize(self):
+        x = DataArray(name='x', preset_data=np.arange(5.), is_setpoint=True)
+        t = DataArray(name='t', preset_data=np.arange(40.), is_setpoint=True)
+        t.nest(5, set_array=x)
+        y = DataArray(name='y', shape=(5, 40), set_arrays=(x, t))
+        data = new_data(arrays=(x, t, y), location='spill', io=MemoryIO())
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+        data.store((2,), {'y': np.arange(40.)})
+        data.finalize()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+        data2 = load_data('spill', io=data.io)
+        np.testing.assert_array_equal(data2.y.ndarray, y.ndarray)
+
+
+class TestSharedMemoryDataServer(TestCase):
+    def setUp(self):
+        self.original_default = DataManager.default
+        self.dm = DataManager(shared_memory=True)
+
+    def tearDown(self):
+        self.dm.close()
+        DataManager.default = self.original_default
+
+    def test_no_shm(self):
+        with patch('qcodes.data.manager.SHM_DIR', None):
+            with self.assertRaises(RuntimeError):
+                DataManager(shared_memory=True)
+        self.assertIs(DataManager.default, self.dm)
+
+    def test_store_and_sync(self):
+        x = DataArray(name='x', preset_data=np.arange(4.), is_setpoint=True)
+        y = DataArray(name='y', shape=(4,), set_arrays=(x,))
+        data = DataSet(location='shared', mode=DataMode.PUSH_TO_SERVER,
+                       arrays=(x, y), data_manager=self.dm,
+                       formatter=MockFormatter())
+        shared = data._shared
+        self.assertTrue(os.path.isdir(shared.path))
+        self.assertEqual(shared.ranges(), {})
+
+        # a reader of the live data maps the same memory
+        reader = load_data(location='shared', data_manager=self.dm)
+        self.assertEqual(reader.mode, DataMode.PULL_FROM_SERVER)
+        np.testing.assert_array_equal(reader.x_set.ndarray, np.arange(4.))
+
+        data.store((0,), {'y': 5})
+        data.store((1,), {'y': 6})
+        self.assertEqual(shared.ranges(), {'y': (0, 1)})
+        self.assertEqual(data.y.modified_range, None)
+        self.assertEqual(reader.y[1], 6)
+
+        self.assertTrue(reader.sync())
+        self.assertEqual(reader.y.synced_index, 1)
+
+        # the server sees what was published, as any other reader does
+        changes = self.dm.ask('get_changes', {'y': -1})
+        self.assertEqual(changes['y']['vals'], [5, 6])
+
+        data.store((2,), {'y': 7})
+        data.finalize()
+        self.assertFalse(os.path.exists(shared.path))
+
+        self.assertFalse(reader.sync())
+        self.assertEqual(reader.mode, DataMode.LOCAL)
+        self.assertIsNone(reader.y._shared_path)
+        self.assertEqual(reader.y.synced_index, 2)
+        np.testing.assert_array_equal(reader.y.ndarray[:3], [5, 6, 7])
+
+        server_data = self.dm.ask('get_data')
+        self.assertIsNone(server_data.y._shared_path)
+        np.testing.assert_array_equal(server_data.y.ndarray[:3], [5, 6, 7])
+        self.assertTrue(np.isnan(server_data.y.ndarray[3]))
+
+
+class TestStoreBatch(TestCase):
+    def setUp(self):
+        self.original_default = DataManager.default
+        self.dm = DataManager()
+
+    def tearDown(self):
+        self.dm.close()
+        DataManager.default = self.original_default
+
+    def stored(self):
+        changes = self.dm.ask('get_changes', {'y': -1})
+        return changes['y']['vals'] if changes else []
+
+    def test_batches(self):
+        x = DataArray(name='x', preset_data=np.arange(6.), is_setpoint=True)
+        y = DataArray(name='y', shape=(6,), set_arrays=(x,))
+        data = DataSet(location=False, mode=DataMode.PUSH_TO_SERVER,
+                       arrays=(x, y), data_manager=self.dm,
+                       store_batch_size=3, store_batch_age=60)
+
+        data.store((0,), {'y': 10})
+        data.store((1,), {'y': 11})
+        self.assertEqual(self.stored(), [])
+        data.store((2,), {'y': 12})
+        self.assertEqual(self.stored(), [10, 11, 12])
+
+        data.store((3,), {'y': 13})
+        data.flush_stores()
+        self.assertEqual(self.stored(), [10, 11, 12, 13])
+
+        # a store more than store_batch_age after the batch started sends it
+        data.store_batch_age = 0
+        data.store((4,), {'y': 14})
+        self.assertEqual(self.stored(), [10, 11, 12, 13, 14])
+
+        data.store_batch_age = 60
+        data.store((5,), {'y': 15})
+        data.finalize()
+        self.assertEqual(self.stored(), [10, 11, 12, 13, 14, 15])
+
+    def test_batch_age(self):
+        x = DataArray(name='x', preset_data=np.arange(3.), is_setpoint=True)
+        y = DataArray(name='y', shape=(3, 2), set_arrays=(x,))
+        data = DataSet(location=False, mode=DataMode.PUSH_TO_SERVER,
+                       arrays=(x, y), data_manager=self.dm,
+                       store_batch_size=10, store_batch_age=0.05)
+
+        # stored arrays are copied, so the caller can reuse them
+        row = np.array([1., 2.])
+        data.store((0,), {'y': row})
+        row[:] = 3
+        data.store((1,), {'y': row})
+
+        # the batch goes out once it's old, without another store
+        time.sleep(0.3)
+        self.assertEqual(self.stored(), [1, 2, 3, 3])
+
+        # and the same thread sends all later batches
+        flusher = data._store_flusher
+        data.store((2,), {'y': row})
+        time.sleep(0.3)
+        self.assertEqual(self.stored(), [1, 2, 3, 3, 3, 3])
+        self.assertIs(data._store_flusher, flusher)
+
+        data.finalize()
+        flusher.join(1)
+        self.assertFalse(flusher.is_alive())
+
 
 class TestLoadData(TestCase):
 
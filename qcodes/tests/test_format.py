@@ -1,13 +1,22 @@
 from unittest import TestCase
+from unittest.mock import patch
+import json
 import os
+import tempfile
+import time
+
+import numpy as np
 
 from qcodes.data.format import Formatter
 from qcodes.data.gnuplot_format import GNUPlotFormat
 
 from qcodes.data.data_array import DataArray
-from qcodes.data.data_set import DataSet, new_data, load_data
+from qcodes.data.data_set import (DataSet, new_data, load_data, load_many,
+                                  stack_datasets)
+from qcodes.data.io import MemoryIO
 from qcodes.utils.helpers import LogCapture
-from .data_mocks import DataSet1D, file_1d, DataSetCombined, files_combined
+from .data_mocks import (DataSet1D, DataSet2D, file_1d, DataSetCombined,
+                         files_combined)
 
 
 class TestBaseFormatter(TestCase):
@@ -36,6 +45,9 @@ class TestBaseFormatter(TestCase):
         with self.assertRaises(NotImplementedError):
             formatter.read_metadata(data)
 
+        # reading only new data is optional
+        self.assertFalse(formatter.read_new(data))
+
     def test_no_files(self):
         formatter = Formatter()
         data = DataSet1D(self.locations[0])
@@ -420,3 +432,463 @@ class TestGNUPlotFormat(TestCase):
         for array_id in ('x_set', 'y1', 'y2', 'y_set', 'z1', 'z2'):
             self.checkArraysEqual(data2.arrays[array_id],
                                   data.arrays[array_id])
+
+    def test_lazy_read(self):
+        formatter = GNUPlotFormat()
+        location = self.locations[1]
+        data = DataSetCombined(location)
+        formatter.write(data, data.io, data.location)
+
+        data2 = load_data(location=location, data_manager=False,
+                          formatter=formatter, io=data.io, lazy=True)
+
+        # descriptors are there but no data has been read yet
+        for array_id in ('x_set', 'y1', 'y2', 'y_set', 'z1', 'z2'):
+            array = data2.arrays[array_id]
+            self.assertFalse(array.is_loaded)
+            self.assertEqual(array.shape, data.arrays[array_id].shape)
+        self.assertEqual(data2.z1.label, 'Z1')
+
+        # touching one array reads its whole file, and nothing else
+        self.assertEqual(data2.z1.tolist(), data.z1.tolist())
+        for array_id in ('y_set', 'z1', 'z2'):
+            self.assertTrue(data2.arrays[array_id].is_loaded)
+        for array_id in ('y1', 'y2'):
+            self.assertFalse(data2.arrays[array_id].is_loaded)
+
+        for array_id in ('x_set', 'y1', 'y2', 'y_set', 'z1', 'z2'):
+            self.checkArraysEqual(data2.arrays[array_id],
+                                  data.arrays[array_id])
+        self.assertEqual(data2.z2.last_saved_index, 5)
+
+    def test_read_part(self):
+        formatter = GNUPlotFormat()
+        location = self.locations[1]
+        data = DataSetCombined(location)
+        formatter.write(data, data.io, data.location)
+
+        # only the file with y1 in it is read
+        read_one_file = formatter.read_one_file
+        with patch.object(formatter, 'read_one_file',
+                          wraps=read_one_file) as mock_read:
+            data2 = load_data(location=location, data_manager=False,
+                              formatter=formatter, io=data.io,
+                              arrays=['y1'], region={'x_set': slice(1, None)})
+        self.assertEqual(mock_read.call_count, 1)
+        self.assertEqual(sorted(data2.arrays), ['x_set', 'y1'])
+        self.assertEqual(data2.x_set.tolist(), [17])
+        self.assertEqual(data2.y1.tolist(), [19])
+        self.assertEqual(data2.y1.set_arrays, (data2.x_set,))
+
+        data3 = load_data(location=location, data_manager=False,
+                          formatter=formatter, io=data.io,
+                          region={'y_set': slice(0, 3, 2)})
+        self.assertEqual(data3.z2.tolist(), [[31, 33], [34, 36]])
+        self.assertEqual(data3.y_set.tolist(), [[22, 24], [22, 24]])
+        self.assertEqual(data3.y2.tolist(), [20, 21])
+
+        for arrays, region in ((['q'], None), (['y1'], {'y_set': slice(1)}),
+                               (None, {'x_set': 1})):
+            with self.assertRaises(ValueError):
+                load_data(location=location, data_manager=False,
+                          formatter=formatter, io=data.io, arrays=arrays,
+                          region=region)
+
+    def test_read_new(self):
+        formatter = GNUPlotFormat()
+        location = self.locations[0]
+        x = DataArray(name='x', preset_data=[1., 2., 3.], is_setpoint=True)
+        y = DataArray(name='y', preset_data=[[4., 5.]] * 3, set_arrays=(x,),
+                      is_setpoint=True)
+        z = DataArray(name='z', shape=(3, 2), set_arrays=(x, y))
+        data = new_data(arrays=(x, y, z), location=location,
+                        formatter=formatter)
+        data.add_metadata({'loop': {'ts_start': 'now'}})
+        data.save_metadata()
+        z[0, 0] = 10
+        data.write()
+
+        reader = load_data(location, data_manager=False, formatter=formatter)
+        nan = float('nan')
+        np.testing.assert_array_equal(reader.z, [[10, nan], [nan, nan],
+                                                 [nan, nan]])
+
+        # only the new lines are parsed
+        z[0, 1] = 11
+        z[1, 0] = 12
+        data.write()
+        with patch.object(formatter, '_read_header') as read_header:
+            self.assertTrue(reader.sync())
+        read_header.assert_not_called()
+        np.testing.assert_array_equal(reader.z, [[10, 11], [12, nan],
+                                                 [nan, nan]])
+        self.assertEqual(reader.z.last_saved_index, 2)
+
+        # a line that is still being written is read once it's complete
+        path = os.path.join(location, 'x_set_y_set.dat')
+        with open(path, 'a') as f:
+            f.write('2\t5\t1')
+        reader.sync()
+        self.assertTrue(np.isnan(reader.z[1, 1]))
+        with open(path, 'a') as f:
+            f.write('3\n\n3\t4\t14\n')
+        reader.sync()
+        np.testing.assert_array_equal(reader.z, [[10, 11], [12, 13],
+                                                 [14, nan]])
+
+        # a loop that stops writing without ending, as if it was killed,
+        # is not live after sync_timeout
+        reader.sync_timeout = 0.2
+        self.assertTrue(reader.sync())
+        time.sleep(0.3)
+        self.assertFalse(reader.sync())
+        with open(path, 'a') as f:
+            f.write('3\t5\t15\n')
+        self.assertTrue(reader.sync())
+
+        # a file that became shorter was rewritten, and is read again from
+        # the start
+        with open(path) as f:
+            header = f.readlines()[:3]
+        with open(path, 'w') as f:
+            f.writelines(header + ['1\t4\t20\n'])
+        data.add_metadata({'loop': {'ts_end': 'later'}})
+        data.save_metadata()
+        self.assertFalse(reader.sync())
+        np.testing.assert_array_equal(reader.z, [[20, nan], [nan, nan],
+                                                 [nan, nan]])
+        self.assertEqual(reader.metadata['loop']['ts_end'], 'later')
+
+        # DataSets that were not read from storage are not synced
+        self.assertFalse(data.sync())
+
+    def test_appendable(self):
+        formatter = GNUPlotFormat()
+        location = self.locations[0]
+        t = DataArray(name='t', shape=(0,), is_setpoint=True,
+                      appendable=True)
+        T = DataArray(name='T', shape=(0,), set_arrays=(t,),
+                      appendable=True)
+        data = new_data(arrays=(t, T), location=location,
+                        formatter=formatter)
+        data.write_period = None
+        data.add_metadata({'loop': {'ts_start': 'now'}})
+        data.save_metadata()
+        for i in range(3):
+            self.assertEqual(data.append({'t_set': i, 'T': 10 * i}), i)
+        data.write()
+        reader = load_data(location, data_manager=False, formatter=formatter)
+        self.assertEqual(reader.T.tolist(), [0, 10, 20])
+
+        # more lines are appended, the header stays as it was
+        for i in range(3, 6):
+            data.append({'t_set': i, 'T': 10 * i})
+        data.write()
+        with open(location + '/t_set.dat') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(lines[:4],
+                         ['# t_set\tT', '# "t"\t"T"', '# 3+', '0\t0'])
+        self.assertEqual(len(lines), 3 + 6 + 1)
+
+        # and readers grow the arrays to hold them
+        self.assertTrue(reader.sync())
+        self.assertEqual(reader.T.tolist(), [0, 10, 20, 30, 40, 50])
+        reader2 = load_data(location, data_manager=False,
+                            formatter=formatter)
+        self.assertTrue(reader2.T.appendable)
+        self.assertEqual(reader2.t_set.tolist(), list(range(6)))
+
+        with self.assertRaises(RuntimeError):
+            DataSet1D(False).append({'y': 1})
+
+    def test_background_write(self):
+        location = self.locations[0]
+        data = DataSet1D(location)
+        data_copy = DataSet1D(False)
+        data.background_write = True
+
+        data.x_set[:] = float('nan')
+        data.y[:] = float('nan')
+        data.x_set.modified_range = None
+        data.y.modified_range = None
+
+        for i, (x, y) in enumerate(zip(data_copy.x_set, data_copy.y)):
+            data.store((i,), {'x_set': x, 'y': y})
+            data.write()
+            # write only hands the changes off to the writer thread
+            self.assertIsNone(data.y.modified_range)
+
+        data.finalize()
+        self.assertIsNone(data._writer)
+
+        with open(location + '/x_set.dat', 'r') as f:
+            self.assertEqual(f.read(), file_1d())
+        self.assertTrue(os.path.isfile(location + '/snapshot.json'))
+
+    def test_background_write_only_finalize(self):
+        location = self.locations[0]
+        data = DataSet1D(location)
+        data.background_write = True
+
+        # everything is stored before the writer exists
+        data.finalize()
+        self.assertIsNone(data._writer)
+
+        with open(location + '/x_set.dat', 'r') as f:
+            self.assertEqual(f.read(), file_1d())
+
+    def test_journal_recovery(self):
+        location = self.locations[0]
+        data = DataSet1D(location)
+        data_copy = DataSet1D(False)
+        data.write_period = None
+        data.journal = True
+        data.x_set[:] = float('nan')
+        data.y[:] = float('nan')
+
+        for i in range(3):
+            data.store((i,), {'x_set': data_copy.x_set[i],
+                              'y': data_copy.y[i]})
+        # simulate a crash in the middle of appending the next record
+        data._journal._append(b'S\x01\x03')
+        data._journal.close()
+
+        # nothing has been written, but the journal has it all
+        data2 = load_data(location=location, data_manager=False,
+                          formatter=GNUPlotFormat(), io=data.io)
+        nan = float('nan')
+        self.assertEqual(repr(data2.x_set.tolist()),
+                         repr([1., 2., 3., nan, nan]))
+        self.assertEqual(repr(data2.y.tolist()), repr([3., 4., 5., nan, nan]))
+        self.assertEqual(data2.y.set_arrays, (data2.x_set,))
+
+        # finalizing a journaled DataSet removes the journal
+        data.finalize()
+        self.assertFalse(os.path.isfile(location + '/journal.bin'))
+
+    def test_load_many(self):
+        formatter = GNUPlotFormat()
+        data1 = DataSet1D(self.locations[0])
+        data2 = DataSetCombined(self.locations[1])
+        for data in (data1, data2):
+            formatter.write(data, data.io, data.location)
+
+        for workers in (None, 2):
+            loaded = load_many(self.locations, workers=workers,
+                               formatter=formatter, io=data1.io)
+            self.assertEqual([d.location for d in loaded],
+                             list(self.locations))
+            for data, data_loaded in zip((data1, data2), loaded):
+                self.assertGreater(data_loaded.load_time, 0)
+                for array_id, array in data.arrays.items():
+                    self.checkArraysEqual(data_loaded.arrays[array_id], array)
+                    self.assertEqual(
+                        data_loaded.arrays[array_id].last_saved_index,
+                        array.last_saved_index)
+
+    def test_load_many_cleanup(self):
+        formatter = GNUPlotFormat()
+        data1 = DataSet1D(self.locations[0])
+        formatter.write(data1, data1.io, data1.location)
+
+        tmpdirs = []
+        real_mkdtemp = tempfile.mkdtemp
+
+        def mkdtemp(**kwargs):
+            tmpdirs.append(real_mkdtemp(**kwargs))
+            return tmpdirs[-1]
+
+        with patch('tempfile.mkdtemp', mkdtemp), \
+                patch('qcodes.data.data_set._data_set_from_npy',
+                      side_effect=RuntimeError('broken')):
+            with self.assertRaises(RuntimeError):
+                load_many(self.locations[:1], workers=2,
+                          formatter=formatter, io=data1.io)
+
+        # the temporary files are gone even though loading failed
+        self.assertEqual(len(tmpdirs), 1)
+        self.assertFalse(os.path.exists(tmpdirs[0]))
+
+    def test_stack_datasets(self):
+        formatter = GNUPlotFormat()
+        io = MemoryIO()
+        zs = []
+        for i in range(3):
+            data = DataSet2D('run{}'.format(i))
+            data.z[:] = data.z.ndarray + i
+            data.io = io
+            data.formatter = formatter
+            data.write()
+            zs.append(data.z.ndarray.astype(float))
+
+        # an interrupted run, without its last row
+        fn = 'run2/x_set_y_set.dat'
+        with io.open(fn, 'r') as f:
+            lines = f.readlines()
+        with io.open(fn, 'w') as f:
+            f.writelines(lines[:-4])
+        zs[2][5] = float('nan')
+        y_set = DataSet2D().y_set.ndarray
+
+        stack = stack_datasets(['run0', 'run1', 'run2'], 'rep',
+                               formatter=formatter, io=io)
+        self.assertEqual(stack.location, False)
+        self.assertEqual(stack.metadata['stack']['locations'],
+                         ['run0', 'run1', 'run2'])
+        self.assertEqual(stack.rep.tolist(), [0, 1, 2])
+        self.assertEqual(stack.z.shape, (3, 6, 4))
+        self.assertIsInstance(stack.z.ndarray, np.memmap)
+        np.testing.assert_array_equal(stack.z.ndarray, zs)
+        self.assertEqual(stack.z.set_arrays,
+                         (stack.rep, stack.x_set, stack.y_set))
+        self.assertEqual(stack.y_set.set_arrays,
+                         (stack.rep, stack.x_set, stack.y_set))
+        self.assertEqual(stack.z.label, 'Z')
+
+        # setpoints are stored once
+        self.assertEqual(stack.y_set.shape, (3, 6, 4))
+        self.assertEqual(stack.y_set.ndarray.strides[0], 0)
+        # with the points the interrupted run is missing
+        np.testing.assert_array_equal(stack.y_set.ndarray[2], y_set)
+        self.assertEqual(stack.x_set.ndarray[2].tolist(), list(range(6)))
+
+        data = DataSet2D('run3')
+        data.y_set[:] = data.y_set.ndarray + 1
+        data.io = io
+        data.formatter = formatter
+        data.write()
+        with self.assertRaises(ValueError):
+            stack_datasets(['run0', 'run3'], formatter=formatter, io=io)
+        data = DataSet1D('run4')
+        data.io = io
+        data.formatter = formatter
+        data.write()
+        with self.assertRaises(ValueError):
+            stack_datasets(['run0', 'run4'], formatter=formatter, io=io)
+        with self.assertRaises(ValueError):
+            stack_datasets([])
+
+    def test_incremental_metadata(self):
+        formatter = GNUPlotFormat()
+        location = self.locations[0]
+        data = DataSet1D(location)
+        data.metadata = {'food': 'pizza', 'drinks': ['beer', 'wine']}
+        path = location + '/snapshot.json'
+
+        with patch.object(formatter, 'read_metadata',
+                          wraps=formatter.read_metadata) as read_metadata:
+            formatter.write_metadata(data, data.io, location)
+            self.assertEqual(read_metadata.call_count, 1)
+            with open(path) as f:
+                text = f.read()
+            # compact encoding by default
+            self.assertNotIn('\n', text)
+            self.assertEqual(json.loads(text), data.metadata)
+
+            # unchanged: neither read back nor rewritten
+            with patch.object(data.io, 'open', wraps=data.io.open) as io_open:
+                formatter.write_metadata(data, data.io, location)
+                self.assertEqual(io_open.call_count, 0)
+            self.assertEqual(read_metadata.call_count, 1)
+
+            # changed: rewritten, but still not read back
+            data.metadata['food'] = 'pasta'
+            formatter.write_metadata(data, data.io, location)
+            self.assertEqual(read_metadata.call_count, 1)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['food'], 'pasta')
+
+            # modified by someone else: read back and merged
+            with open(path, 'w') as f:
+                json.dump({'food': 'soup', 'dessert': 'cake',
+                           'extra': 'something longer than before'}, f)
+            formatter.write_metadata(data, data.io, location)
+            self.assertEqual(read_metadata.call_count, 2)
+            self.assertEqual(data.metadata['food'], 'pasta')
+            self.assertEqual(data.metadata['dessert'], 'cake')
+
+        formatter = GNUPlotFormat(metadata_indent=4)
+        formatter.write_metadata(data, data.io, location)
+        with open(path) as f:
+            self.assertIn('\n    "dessert"', f.read())
+
+    def test_typed_arrays(self):
+        location = self.locations[0]
+        x = DataArray(name='x', array_id='x', is_setpoint=True,
+                      preset_data=[1, 2, 3], dtype='int8')
+        y = DataArray(name='y', array_id='y', set_arrays=(x,), shape=(3,),
+                      dtype='int64')
+        data = new_data(arrays=(x, y), location=location)
+        y[0] = 2**62 + 1
+        y[1] = -5
+        data.finalize()
+
+        with open(location + '/x_set.dat') as f:
+            lines = f.read().split('\n')
+        # large integers are written exactly
+        self.assertEqual(lines[3:], ['1\t4611686018427387905', '2\t-5', ''])
+
+        # the dtype comes back from the metadata
+        data2 = load_data(location)
+        self.assertEqual(data2.x_set.ndarray.dtype, 'int8')
+        self.assertEqual(data2.y.ndarray.dtype, 'int64')
+        self.assertEqual(data2.y[0], 2**62 + 1)
+        self.assertEqual(data2.y.measured_mask().tolist(),
+                         [True, True, False])
+
+    def test_typed_arrays_background_journal(self):
+        location = self.locations[0]
+        x = DataArray(name='x', array_id='x', is_setpoint=True,
+                      preset_data=[1, 2, 3], dtype='int8')
+        y = DataArray(name='y', array_id='y', set_arrays=(x,), shape=(3,),
+                      dtype='int64', fill_value=-1)
+        data = new_data(arrays=(x, y), location=location)
+        data.write_period = None
+        data.background_write = True
+        data.journal = True
+        data.store((0,), {'y': 2**62 + 1})
+        data.store((1,), {'y': -5})
+
+        # the journal keeps integers exact
+        data._journal.close()
+        data.save_metadata()
+        data2 = load_data(location)
+        self.assertEqual(data2.y.ndarray.dtype, 'int64')
+        self.assertEqual(data2.y.tolist(), [2**62 + 1, -5, -1])
+
+        # and so does the background writer
+        data.finalize()
+        with open(location + '/x_set.dat') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(lines[3:], ['1\t4611686018427387905', '2\t-5', ''])
+
+    def test_complex_arrays(self):
+        location = self.locations[0]
+        x = DataArray(name='x', array_id='x', is_setpoint=True,
+                      preset_data=[1., 2., 3.])
+        y = DataArray(name='y', array_id='y', set_arrays=(x,), shape=(3,),
+                      dtype=complex)
+        data = new_data(arrays=(x, y), location=location)
+        data.write_period = None
+        data.journal = True
+        data.store((0,), {'y': 1.5 - 2j})
+        data.store((1,), {'y': 3})
+
+        # a crash before anything is written: the journal has it all
+        data._journal.close()
+        data.save_metadata()
+        data2 = load_data(location)
+        self.assertEqual(data2.y.ndarray.dtype, complex)
+        self.assertEqual(data2.y[:2].tolist(), [1.5 - 2j, 3])
+        self.assertTrue(np.isnan(data2.y[2]))
+
+        data.finalize()
+        with open(location + '/x_set.dat') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(lines[3:], ['1\t1.5-2j', '2\t3+0j', ''])
+
+        data3 = load_data(location)
+        self.assertEqual(data3.y.ndarray.dtype, complex)
+        self.assertEqual(data3.y[:2].tolist(), [1.5 - 2j, 3])
+        self.assertEqual(data3.y.measured_mask().tolist(),
+                         [True, True, False])
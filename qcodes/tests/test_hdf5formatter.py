@@ -1,4 +1,5 @@
 from unittest import TestCase
+from unittest.mock import patch
 import os
 import numpy as np
 import h5py
@@ -85,6 +86,22 @@ class TestHDF5_Format(TestCase):
         self.formatter.close_file(data)
         self.formatter.close_file(data2)
 
+    def test_lazy_read(self):
+        data = DataSet2D(location=self.loc_provider, name='test2D_lazy')
+        self.formatter.write(data)
+
+        data2 = DataSet(location=data.location, formatter=self.formatter)
+        data2.read(lazy=True)
+        self.assertFalse(data2.z.is_loaded)
+        self.assertEqual(data2.z.shape, data.z.shape)
+        self.assertEqual(data2.z.set_arrays, (data2.x_set, data2.y_set))
+
+        self.checkArraysEqual(data2.z, data.z)
+        self.assertTrue(data2.z.is_loaded)
+
+        self.formatter.close_file(data)
+        self.formatter.close_file(data2)
+
     def test_incremental_write(self):
         data = DataSet1D(location=self.loc_provider, name='test_incremental')
         location = data.location
@@ -337,3 +354,138 @@ class TestHDF5_Format(TestCase):
         data = DataSet2D(location=self.loc_provider, name='MetaDataTest')
         data.metadata = {'a': ['hi', 'there']}
         self.formatter.write(data, write_metadata=True)
+
+    def test_incremental_metadata(self):
+        data = DataSet2D(location=self.loc_provider, name='MetaDataTest')
+        data.metadata = {'a': 1, 'b': {'c': np.arange(3), 'd': 'x'},
+                         'e': [1, 2, 3]}
+        self.formatter.write(data, write_metadata=True)
+        metadata_group = data._h5_base_group['metadata']
+        e_dataset = metadata_group['e']
+
+        data.metadata['b']['d'] = 'y'
+        data.metadata['b']['c'] = np.arange(4)
+        del data.metadata['a']
+        data.metadata['f'] = {'g': None}
+        self.formatter.write_metadata(data)
+
+        # unchanged entries are not rewritten
+        self.assertEqual(metadata_group['e'], e_dataset)
+
+        new_metadata = self.formatter.read_dict_from_hdf5(
+            {}, data._h5_base_group['metadata'])
+        self.formatter.close_file(data)
+        metadata_equal, err_msg = compare_dictionaries(
+            data.metadata, new_metadata, 'written', 'read')
+        self.assertTrue(metadata_equal, msg='\n' + err_msg)
+
+    def test_compact_metadata(self):
+        formatter = HDF5Format(compact_metadata=True,
+                               metadata_index=['b.d', 'e', 'missing'])
+        data = DataSet2D(location=self.loc_provider, name='MetaDataTest')
+        data.formatter = formatter
+        data.metadata = {'a': 1, 'b': {'c': np.arange(3), 'd': 'x'},
+                         'e': [1, 2, 3]}
+        formatter.write(data, write_metadata=True)
+        base_group = data._h5_base_group
+        self.assertNotIn('metadata', base_group)
+        self.assertIn('metadata_json', base_group)
+        self.assertEqual(formatter.read_metadata_index(data),
+                         {'b.d': 'x', 'e': [1, 2, 3]})
+
+        # unchanged metadata is not rewritten
+        blob = base_group['metadata_json']
+        formatter.write_metadata(data)
+        self.assertEqual(base_group['metadata_json'], blob)
+        data.metadata['b']['d'] = 'y'
+        formatter.write_metadata(data)
+        self.assertEqual(formatter.read_metadata_index(data)['b.d'], 'y')
+        formatter.close_file(data)
+
+        # either layout can be read by either formatter
+        for reader in (formatter, HDF5Format()):
+            data2 = DataSet(location=data.location, formatter=reader)
+            reader.read_metadata(data2)
+            reader.close_file(data2)
+            self.assertEqual(data2.metadata, {
+                'a': 1, 'b': {'c': [0, 1, 2], 'd': 'y'}, 'e': [1, 2, 3]})
+
+        data3 = DataSet1D(location=self.loc_provider, name='MetaDataTest')
+        data3.metadata = {'a': 1}
+        self.formatter.write(data3, write_metadata=True)
+        self.formatter.close_file(data3)
+        data4 = DataSet(location=data3.location, formatter=formatter)
+        formatter.read_metadata(data4)
+        formatter.close_file(data4)
+        self.assertEqual(data4.metadata, {'a': 1})
+
+    def test_complex_arrays(self):
+        x = DataArray(name='x', array_id='x', is_setpoint=True,
+                      preset_data=[1., 2., 3.])
+        y = DataArray(name='y', array_id='y', set_arrays=(x,), shape=(3,),
+                      dtype=complex)
+        data = new_data(arrays=(x, y), location=self.loc_provider,
+                        formatter=self.formatter, name='ComplexTest')
+        data.metadata['impedance'] = 50 - 1j
+        y[0] = 1.5 - 2j
+        y[1] = 3j
+        y[2] = -1
+        self.formatter.write(data, write_metadata=True)
+        self.formatter.close_file(data)
+
+        data2 = DataSet(location=data.location, formatter=self.formatter)
+        data2.read()
+        self.formatter.close_file(data2)
+        self.assertEqual(data2.y.ndarray.dtype, complex)
+        self.assertEqual(data2.y.tolist(), [1.5 - 2j, 3j, -1])
+        self.assertEqual(data2.metadata['impedance'], 50 - 1j)
+
+    def test_read_part(self):
+        data = DataSet2D(location=self.loc_provider, name='test2D_part')
+        self.formatter.write(data)
+        self.formatter.close_file(data)
+
+        data2 = load_data(data.location, formatter=self.formatter,
+                          arrays=['z'], region={'x': slice(4, 0, -2),
+                                                'y': slice(1, 3)})
+        self.assertEqual(sorted(data2.arrays), ['x_set', 'y_set', 'z'])
+        np.testing.assert_array_equal(data2.z, data.z.ndarray[4:0:-2, 1:3])
+        np.testing.assert_array_equal(data2.x_set, [4, 2])
+        np.testing.assert_array_equal(data2.y_set, [[1, 2], [1, 2]])
+
+        # only the rows that were asked for are read from the file
+        read_region = self.formatter.read_region
+        z = data2._h5_base_group['Data Arrays']['z']
+        with patch.object(type(z), '__getitem__',
+                          wraps=z.__getitem__) as mock_get:
+            self.assertEqual(read_region(data2, 'z', (slice(1, 3),)).shape,
+                             (2, 4))
+        self.assertEqual(mock_get.call_args[0][0], (slice(4, 12), 0))
+        self.formatter.close_file(data2)
+
+    def test_broadcast_setpoints(self):
+        x = DataArray(name='x', array_id='x', is_setpoint=True,
+                      preset_data=[1., 2., 3.])
+        y = DataArray(name='y', array_id='y', is_setpoint=True,
+                      preset_data=[4., 5.])
+        y.nest(3, set_array=x)
+        data = new_data(arrays=(x, y), location=self.loc_provider,
+                        formatter=self.formatter, name='BroadcastTest')
+        self.formatter.write(data)
+        self.formatter.write(data)
+        self.formatter.close_file(data)
+
+        # only the repeated data is stored
+        filepath = self.formatter._filepath_from_location(data.location,
+                                                          data.io)
+        dset = h5py.File(filepath, 'r')['Data Arrays']['y_set']
+        self.assertEqual(dset.shape, (2, 1))
+        self.assertEqual(dset.attrs['broadcast'], 1)
+        dset.file.close()
+
+        for lazy in (False, True):
+            data2 = DataSet(location=data.location, formatter=self.formatter)
+            data2.read(lazy=lazy)
+            self.assertEqual(data2.y_set.tolist(), [[4., 5.]] * 3)
+            self.assertEqual(data2.y_set.compact()[1], 1)
+            self.formatter.close_file(data2)
@@ -0,0 +1,211 @@
+from unittest import TestCase
+import os
+import pickle
+import shutil
+import tempfile
+
+from qcodes.data.gnuplot_format import GNUPlotFormat
+from qcodes.data.data_set import load_data
+from qcodes.data.io import DiskIO, MemoryIO
+
+from .data_mocks import DataSet1D, file_1d
+
+
+class TestDiskIO(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.io = DiskIO(self.tmpdir, max_open_files=2)
+
+    def tearDown(self):
+        self.io.close_files()
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, fn):
+        with open(os.path.join(self.tmpdir, fn)) as f:
+            return f.read()
+
+    def test_pooled_appends(self):
+        with self.io.open('a/1.txt', 'w') as f:
+            f.write('x')
+        first = f
+        with self.io.open('a/1.txt', 'a') as f:
+            f.write('y')
+        # the same open file, flushed at the end of each block
+        self.assertIs(f, first)
+        self.assertFalse(f.closed)
+        self.assertEqual(self.read('a/1.txt'), 'xy')
+
+        # opening for writing again starts a new file
+        with self.io.open('a/1.txt', 'w') as f:
+            f.write('z')
+        self.assertTrue(first.closed)
+        self.assertEqual(self.read('a/1.txt'), 'z')
+
+        # only the most recently used files stay open
+        with self.io.open('a/2.txt', 'w') as f2:
+            f2.write('2')
+        with self.io.open('b/3.txt', 'a') as f3:
+            f3.write('3')
+        self.assertTrue(f.closed)
+        self.assertFalse(f2.closed)
+
+        self.io.close_files('b')
+        self.assertTrue(f3.closed)
+        self.assertFalse(f2.closed)
+        self.io.remove('a/2.txt')
+        self.assertTrue(f2.closed)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'a',
+                                                     '2.txt')))
+
+    def test_no_flush(self):
+        io = DiskIO(self.tmpdir, flush=False)
+        with io.open('f.txt', 'w') as f:
+            f.write('buffered')
+        self.assertEqual(self.read('f.txt'), '')
+        # reading through the io manager sees everything
+        with io.open('f.txt', 'r') as f:
+            self.assertEqual(f.read(), 'buffered')
+        io.close_files()
+
+    def test_no_pool(self):
+        io = DiskIO(self.tmpdir, max_open_files=0)
+        with io.open('f.txt', 'w') as f:
+            f.write('x')
+        self.assertTrue(f.closed)
+
+    def test_error_closes(self):
+        with self.assertRaises(RuntimeError):
+            with self.io.open('f.txt', 'w') as f:
+                raise RuntimeError
+        self.assertTrue(f.closed)
+        self.assertEqual(self.io._open_files, {})
+
+    def test_pickle(self):
+        with self.io.open('f.txt', 'w') as f:
+            f.write('x')
+        io2 = pickle.loads(pickle.dumps(self.io))
+        self.assertEqual(io2.base_location, self.io.base_location)
+        self.assertEqual(io2._open_files, {})
+        with io2.open('f.txt', 'a') as f:
+            f.write('y')
+        io2.close_files()
+        self.assertEqual(self.read('f.txt'), 'xy')
+
+    def test_data_set(self):
+        data = DataSet1D(location='data', io=self.io)
+        data.formatter = GNUPlotFormat()
+        data.write()
+        self.assertTrue(self.io._open_files)
+
+        data.finalize()
+        self.assertEqual(self.io._open_files, {})
+        self.assertEqual(self.read('data/x_set.dat'), file_1d())
+
+
+class TestMemoryIO(TestCase):
+    def setUp(self):
+        self.io = MemoryIO()
+
+    def write(self, fn, contents):
+        with self.io.open(fn, 'w') as f:
+            f.write(contents)
+
+    def read(self, fn):
+        with self.io.open(fn, 'r') as f:
+            return f.read()
+
+    def test_open(self):
+        self.write('a/1.txt', 'x')
+        with self.io.open('a\\1.txt', 'a') as f:
+            f.write('y')
+        self.assertEqual(self.read('a/1.txt'), 'xy')
+        self.write('a/1.txt', 'z')
+        self.assertEqual(self.read('./a/1.txt'), 'z')
+        self.assertTrue(self.io.isfile('a/1.txt'))
+        self.assertFalse(self.io.isfile('a'))
+
+        with self.assertRaises(FileNotFoundError):
+            self.read('a/2.txt')
+        with self.assertRaises(IsADirectoryError):
+            self.read('a')
+        with self.assertRaises(ValueError):
+            with self.io.open('a/1.txt', 'rb'):
+                pass
+
+    def test_list_remove(self):
+        for fn in ('d/x.dat', 'd/y.dat', 'd/sub/z.dat', 'd2/x.dat',
+                   'f.txt', 'f.json'):
+            self.write(fn, fn)
+        j = self.io.join
+
+        self.assertEqual(self.io.list('d'), [j('d', 'x.dat'), j('d', 'y.dat')])
+        self.assertEqual(self.io.list('d', maxdepth=2),
+                         [j('d', 'sub', 'z.dat'), j('d', 'x.dat'),
+                          j('d', 'y.dat')])
+        self.assertEqual(self.io.list('d', include_dirs=True),
+                         [j('d', 'sub'), j('d', 'x.dat'), j('d', 'y.dat')])
+        self.assertEqual(self.io.list('d', maxdepth=0, include_dirs=True),
+                         ['d'])
+        self.assertEqual(self.io.list('f'), ['f.json', 'f.txt'])
+        self.assertEqual(self.io.list('d/?.dat'),
+                         [j('d', 'x.dat'), j('d', 'y.dat')])
+        self.assertEqual(self.io.list('nothing'), [])
+
+        self.assertTrue(self.io.reserve('e'))
+        self.assertFalse(self.io.reserve('e'))
+        self.assertFalse(self.io.reserve('d'))
+        self.assertEqual(self.io.list('e', maxdepth=0, include_dirs=True),
+                         ['e'])
+
+        self.io.remove('d')
+        self.io.remove_all('f')
+        self.io.remove('e')
+        self.assertEqual(self.io.list('d'), [])
+        self.assertEqual(self.io.list('f'), [])
+        self.assertEqual(self.io.list('d2'), [j('d2', 'x.dat')])
+        with self.assertRaises(FileNotFoundError):
+            self.io.remove('d')
+
+    def test_data_set(self):
+        data = DataSet1D(location='mem_data', io=self.io)
+        data.formatter = GNUPlotFormat()
+        data.finalize()
+        self.assertEqual(self.read('mem_data/x_set.dat'), file_1d())
+
+        data2 = load_data('mem_data', io=self.io, formatter=GNUPlotFormat())
+        self.assertEqual(data2.y.tolist(), data.y.tolist())
+
+        path = self.io.to_path('mem_data')
+        with open(os.path.join(path, 'x_set.dat')) as f:
+            self.assertEqual(f.read(), file_1d())
+        self.assertEqual(self.io.to_location(path), 'mem_data')
+
+    def test_staging(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            target = DiskIO(tmpdir)
+            self.io = MemoryIO(target)
+            self.assertEqual(self.io.base_location, target.base_location)
+
+            data = DataSet1D(location='mem_data', io=self.io)
+            data.formatter = GNUPlotFormat()
+            data.write()
+            self.assertEqual(os.listdir(tmpdir), [])
+            self.write('other.txt', 'not written')
+
+            data.finalize()
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['mem_data'])
+            with open(os.path.join(tmpdir, 'mem_data', 'x_set.dat')) as f:
+                self.assertEqual(f.read(), file_1d())
+            self.assertEqual(target._open_files, {})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_pickle(self):
+        self.write('f.txt', 'x')
+        io2 = pickle.loads(pickle.dumps(self.io))
+        with io2.open('f.txt', 'a') as f:
+            f.write('y')
+        self.assertEqual(self.read('f.txt'), 'x')
+        with io2.open('f.txt', 'r') as f:
+            self.assertEqual(f.read(), 'xy')
@@ -1,7 +1,12 @@
 from unittest import TestCase
+from unittest.mock import patch
 from datetime import datetime
+import os
+import shutil
+import tempfile
 
 from qcodes.data.location import FormatLocation, SafeFormatter
+from qcodes.data.io import DiskIO
 
 from .data_mocks import MatchIO
 
@@ -114,3 +119,66 @@ class TestFormatLocation(TestCase):
             FormatLocation()(io, {'counter': 100})
         with self.assertRaises(KeyError):
             FormatLocation(record={'counter': 100})(io)
+
+
+class TestCounterReservation(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.io = DiskIO(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_existing_data(self):
+        os.makedirs(os.path.join(self.tmpdir, 'run', '#007_old'))
+        lp = FormatLocation(fmt='run/#{counter}_{name}')
+        self.assertEqual(lp(self.io, {'name': 'new'}), 'run/#008_new')
+
+    def test_cache(self):
+        lp = FormatLocation(fmt='run/#{counter}_{name}')
+        self.assertEqual(lp(self.io, {'name': 'a'}), 'run/#001_a')
+
+        # after the first call, we don't search all the files anymore,
+        # only the ones with the counter we're claiming
+        with patch.object(self.io, 'list', wraps=self.io.list) as mock_list:
+            self.assertEqual(lp(self.io, {'name': 'b'}), 'run/#002_b')
+            self.assertEqual(lp(self.io, {'name': 'c'}), 'run/#003_c')
+        patterns = [call[0][0] for call in mock_list.call_args_list]
+        self.assertEqual(patterns, [os.path.join('run', '#002*'),
+                                    os.path.join('run', '#003*')])
+
+        # the locations are reserved, so nobody else can take them
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'run',
+                                                   '#003_c')))
+
+    def test_counter_taken_elsewhere(self):
+        lp = FormatLocation(fmt='run/#{counter}_{name}')
+        self.assertEqual(lp(self.io, {'name': 'a'}), 'run/#001_a')
+
+        # another process took the next counter under a different name
+        os.makedirs(os.path.join(self.tmpdir, 'run', '#002_other'))
+        self.assertEqual(lp(self.io, {'name': 'b'}), 'run/#003_b')
+        self.assertFalse(os.path.isdir(os.path.join(self.tmpdir, 'run',
+                                                    '#002_b')))
+
+    def test_concurrent(self):
+        # two providers (as if in two processes) never get the same counter,
+        # even though neither one has created any data yet
+        lp1 = FormatLocation(fmt='run/#{counter}')
+        lp2 = FormatLocation(fmt='run/#{counter}')
+
+        locations = [lp1(self.io), lp2(self.io), lp1(self.io), lp2(self.io)]
+        self.assertEqual(locations,
+                         ['run/#001', 'run/#002', 'run/#003', 'run/#004'])
+
+    def test_no_counter(self):
+        lp1 = FormatLocation(fmt='run/{name}')
+        lp2 = FormatLocation(fmt='run/{name}')
+
+        # the plain location is reserved too, so even before any data is
+        # written, nobody else gets it
+        self.assertEqual(lp1(self.io, {'name': 'a'}), 'run/a')
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'run', 'a')))
+        self.assertEqual(lp2(self.io, {'name': 'a'}), 'run/a_002')
+        self.assertEqual(lp1(self.io, {'name': 'a'}), 'run/a_003')
+        self.assertEqual(lp2(self.io, {'name': 'b'}), 'run/b')
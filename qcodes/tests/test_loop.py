@@ -532,6 +532,24 @@ class TestLoop(TestCase):
         self.assertEqual(data.arr2d.tolist(), [[[21, 22], [23, 24]]] * 2)
         self.assertEqual(data.index0_set.tolist(), [[0, 1]] * 2)
         self.assertEqual(data.index1_set.tolist(), [[[0, 1]] * 2] * 2)
+        # default setpoints are stored once, whatever their shape
+        self.assertEqual(data.index1_set.compact()[0].tolist(), [0, 1])
+        self.assertEqual(data.index1_set.compact()[1], 2)
+
+    def test_complex_params(self):
+        mg = MultiGetter(iq=(1 + 2j, -3j), n=7)
+        mg.dtypes = ('complex128',)
+        loop = Loop(self.p1[1:3:1], 0.001).each(mg)
+        with self.assertRaises(ValueError):
+            loop.run_temp()
+
+        mg.dtypes = ('complex128', None)
+        data = loop.run_temp()
+
+        self.assertEqual(data.iq.ndarray.dtype, complex)
+        self.assertEqual(data.iq.tolist(), [[1 + 2j, -3j]] * 2)
+        self.assertEqual(data.n.ndarray.dtype, float)
+        self.assertEqual(data.n.tolist(), [7, 7])
 
     def test_bad_actors(self):
         def f():
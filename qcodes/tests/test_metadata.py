@@ -1,5 +1,8 @@
 from unittest import TestCase
+import pickle
 
+from qcodes.instrument.parameter import ManualParameter
+from qcodes.station import Station
 from qcodes.utils.metadata import Metadatable
 
 
@@ -47,3 +50,115 @@ class TestMetadatable(TestCase):
         self.assertEqual(s.snapshot(), {'fruit': 'kiwi'})
         self.assertEqual(s.snapshot_base(), {})
         self.assertEqual(s.metadata, {8: 9})
+
+
+class Counted(Metadatable):
+    _snapshot_cacheable = True
+
+    def __init__(self, children=(), **kwargs):
+        super().__init__(**kwargs)
+        self.children = list(children)
+        self.value = 0
+        self.builds = 0
+
+    def snapshot_base(self, update=False):
+        # not an attribute assignment, that would invalidate the snapshot
+        self.__dict__['builds'] += 1
+        return {'value': self.value,
+                'children': [c.snapshot(update=update)
+                             for c in self.children]}
+
+
+class Uncacheable(Metadatable):
+    def __init__(self):
+        super().__init__()
+        self.value = 0
+
+    def snapshot_base(self, update=False):
+        return {'value': self.value}
+
+
+class TestSnapshotCache(TestCase):
+    def test_cache(self):
+        leaf = Counted()
+        mid = Counted([leaf])
+        top = Counted([mid])
+        other = Counted([leaf])
+
+        snap = top.snapshot()
+        self.assertEqual(snap, {'value': 0, 'children': [
+            {'value': 0, 'children': [{'value': 0, 'children': []}]}]})
+        other.snapshot()
+        self.assertEqual((top.builds, mid.builds, leaf.builds), (1, 1, 1))
+
+        # cached, and each call gets its own top-level dict
+        snap['junk'] = 1
+        self.assertNotIn('junk', top.snapshot())
+        self.assertEqual((top.builds, mid.builds, leaf.builds), (1, 1, 1))
+
+        # a change invalidates everything containing it, and nothing else
+        mid.value = 1
+        self.assertEqual(top.snapshot()['children'][0]['value'], 1)
+        self.assertEqual((top.builds, mid.builds, leaf.builds), (2, 2, 1))
+
+        leaf.value = 2
+        self.assertEqual(other.snapshot()['children'][0]['value'], 2)
+        top.snapshot()
+        self.assertEqual((top.builds, mid.builds, leaf.builds), (3, 3, 2))
+        self.assertEqual(other.builds, 2)
+
+        # metadata, in-place changes and update=True
+        leaf.load_metadata({'food': 'pizza'})
+        self.assertEqual(top.snapshot()['children'][0]['children'][0][
+            'metadata'], {'food': 'pizza'})
+        top.children.append(Counted())
+        self.assertEqual(len(top.snapshot()['children']), 1)
+        top.invalidate_snapshot()
+        self.assertEqual(len(top.snapshot()['children']), 2)
+        # update=True always rebuilds
+        builds = top.builds
+        top.snapshot(update=True)
+        top.snapshot()
+        self.assertEqual(top.builds, builds + 1)
+
+        # pickling drops the cache
+        top2 = pickle.loads(pickle.dumps(top))
+        self.assertIsNone(top2._snapshot_cache)
+        self.assertEqual(top2.snapshot(), top.snapshot())
+
+    def test_reused_parent_id(self):
+        leaf = Counted()
+        dead = Counted([leaf])
+        dead.snapshot()
+        dead_ref = leaf._snapshot_parents[id(dead)]
+        del dead
+        self.assertIsNone(dead_ref())
+
+        # as if the new parent had been allocated where the dead one was
+        parent = Counted([leaf])
+        leaf._snapshot_parents = {id(parent): dead_ref}
+        parent.snapshot()
+        leaf.value = 1
+        self.assertEqual(parent.snapshot()['children'][0]['value'], 1)
+
+    def test_uncacheable_component(self):
+        inner = Uncacheable()
+        outer = Counted([inner])
+        outer.snapshot()
+        inner.value = 1
+        self.assertEqual(outer.snapshot()['children'][0]['value'], 1)
+        self.assertEqual(outer.builds, 2)
+
+    def test_station(self):
+        p = ManualParameter('p', initial_value=1)
+        station = Station(p, default=False)
+        self.assertEqual(station.snapshot()['parameters']['p']['value'], 1)
+        self.assertIsNotNone(station._snapshot_cache)
+        p(2)
+        self.assertIsNone(station._snapshot_cache)
+        self.assertEqual(station.snapshot()['parameters']['p']['value'], 2)
+
+        station.add_component(Uncacheable(), name='u')
+        self.assertIn('u', station.snapshot()['components'])
+        self.assertIsNone(station._snapshot_cache)
+
@@ -0,0 +1,116 @@
+from unittest import TestCase
+from unittest.mock import patch
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+from qcodes.data.chunked_format import ChunkedFormat
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import new_data, load_data
+from qcodes.data.io import DiskIO
+from qcodes.data.reduce import reduce_array
+
+
+def make_arrays(data, dtype=None, fill_value=None):
+    shape = data.shape
+    x = DataArray(name='x', preset_data=np.arange(shape[0]), is_setpoint=True)
+    y = DataArray(name='y', preset_data=np.tile(np.arange(shape[1]),
+                                                (shape[0], 1)),
+                  set_arrays=(x,), is_setpoint=True)
+    z = DataArray(name='z', preset_data=data, set_arrays=(x, y),
+                  dtype=dtype, fill_value=fill_value)
+    return x, y, z
+
+
+class TestReduceArray(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.z = rng.normal(size=(7, 5)) + 3
+        # not measured yet
+        self.z[6, 2:] = np.nan
+        self.z[5, 4] = np.nan
+
+    def check(self, data, z, max_points):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            expected = {'mean': np.nanmean, 'sum': np.nansum,
+                        'min': np.nanmin, 'max': np.nanmax,
+                        'std': np.nanstd}
+            for how, numpy_reduce in expected.items():
+                for axes, axis in [('x_set', 0), ('y', 1), (1, 1),
+                                   (('x', 'y_set'), (0, 1))]:
+                    np.testing.assert_allclose(
+                        reduce_array(data, 'z', axes, how,
+                                     max_points=max_points),
+                        numpy_reduce(z, axis=axis), err_msg=how)
+
+    def test_in_memory(self):
+        data = new_data(arrays=make_arrays(self.z), location=False)
+        for max_points in (1, 10, 100):
+            self.check(data, self.z, max_points)
+
+        np.testing.assert_allclose(
+            reduce_array(data, 'z', 'x', 'std', ddof=1, max_points=5),
+            np.nanstd(self.z, axis=0, ddof=1))
+        np.testing.assert_allclose(
+            reduce_array(data, 'z', 'y', np.add), np.nansum(self.z, axis=1))
+        np.testing.assert_allclose(
+            reduce_array(data, 'z', 'x', np.fmax, max_points=5),
+            np.nanmax(self.z, axis=0))
+
+        # nothing measured
+        z = np.full((2, 3), np.nan)
+        data2 = new_data(arrays=make_arrays(z), location=False)
+        np.testing.assert_array_equal(reduce_array(data2, 'z', 'x'),
+                                      [np.nan] * 3)
+        np.testing.assert_array_equal(
+            reduce_array(data2, 'z', 'x', 'std', max_points=3), [np.nan] * 3)
+        np.testing.assert_array_equal(reduce_array(data2, 'z', 'x', 'sum'),
+                                      [0, 0, 0])
+
+    def test_integers(self):
+        z = np.arange(12).reshape(3, 4)
+        z[2, 1:] = -1
+        data = new_data(arrays=make_arrays(z, 'int64', -1), location=False)
+        np.testing.assert_allclose(
+            reduce_array(data, 'z', 'x', max_points=4),
+            [4, 3, 4, 5])
+        np.testing.assert_allclose(
+            reduce_array(data, 'z', 'x', 'max', max_points=4),
+            [8, 5, 6, 7])
+        np.testing.assert_allclose(reduce_array(data, 'z', 'y', np.add),
+                                   [6, 22, 8])
+
+    def test_errors(self):
+        data = new_data(arrays=make_arrays(self.z), location=False)
+        with self.assertRaises(ValueError):
+            reduce_array(data, 'z', 'x', 'median')
+        with self.assertRaises(ValueError):
+            reduce_array(data, 'z', 'x', np.sin)
+        with self.assertRaises(ValueError):
+            reduce_array(data, 'z', 'q')
+        with self.assertRaises(ValueError):
+            reduce_array(data, 'z', 2)
+
+    def test_chunked(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            io = DiskIO(tmpdir)
+            formatter = ChunkedFormat(chunk_size=10)
+            data = new_data(arrays=make_arrays(self.z), location='big',
+                            io=io, formatter=formatter)
+            data.finalize()
+
+            data2 = load_data('big', io=io, formatter=formatter, lazy=True)
+            read_region = formatter.read_region
+            with patch.object(formatter, 'read_region',
+                              wraps=read_region) as mock_read:
+                self.check(data2, self.z, 10)
+            # read in blocks of two rows, and never loaded whole
+            self.assertEqual(mock_read.call_args_list[0][0][2],
+                             (slice(0, 2),))
+            self.assertFalse(data2.z.is_loaded)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,177 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import new_data, load_data
+from qcodes.data.gnuplot_format import GNUPlotFormat
+from qcodes.data.hdf5_format import HDF5Format
+from qcodes.data.io import DiskIO
+from qcodes.data.retention import RetentionPolicy
+
+
+def make_log(**kwargs):
+    t = DataArray(name='t', shape=(0,), is_setpoint=True, appendable=True)
+    T = DataArray(name='T', shape=(0,), set_arrays=(t,), appendable=True)
+    return new_data(arrays=(t, T), **kwargs)
+
+
+class TestRetentionPolicy(TestCase):
+    def test_compact(self):
+        policy = RetentionPolicy(10, [(100, 5), (None, 50)], period=1e9)
+        data = make_log(location=False, retention=policy)
+        values = np.arange(230) % 7
+        for i in range(200):
+            data.append({'t_set': i, 'T': values[i]})
+
+        # 190 old rows: 100 at 50 s, 90 at 5 s, and 10 at full rate
+        self.assertEqual(policy.compact(data, now=200), 169)
+        self.assertEqual(data.t_set.shape, (31,))
+        self.assertEqual(data.points.ndarray[:4].tolist(), [50, 50, 1, 4])
+        self.assertEqual(data.points.ndarray[-10:].tolist(), [1] * 10)
+        self.assertEqual(data.t_set.ndarray[:4].tolist(),
+                         [24.5, 74.5, 100, 102.5])
+        self.assertEqual(data.T.ndarray[3], np.mean(values[101:105]))
+        self.assertEqual(data.T_min.ndarray[:2].tolist(), [0, 0])
+        self.assertEqual(data.T_max.ndarray[:2].tolist(), [6, 6])
+        self.assertEqual(data.T_max.label, 'T (max)')
+        np.testing.assert_array_equal(data.T_min.ndarray[-10:],
+                                      values[190:200])
+        # nothing more to do
+        self.assertEqual(policy.compact(data, now=200), 0)
+
+        # new rows get their extremes and points too
+        for i in range(200, 230):
+            data.append({'t_set': i, 'T': values[i]})
+        self.assertEqual(data.T_max.ndarray[-1], values[229])
+        self.assertEqual(policy.compact(data, now=230), 30)
+
+        # merging merged rows again gives the same as merging at once:
+        # 100 to 129 s are now over 100 s old
+        self.assertEqual(data.points.ndarray[2], 30)
+        self.assertEqual(data.t_set.ndarray[2], 114.5)
+        self.assertAlmostEqual(data.T.ndarray[2], np.mean(values[100:130]))
+        self.assertEqual(data.T_min.ndarray[2], 0)
+        self.assertEqual(data.T_max.ndarray[2], 6)
+        self.assertEqual(data.points.ndarray.sum(), 230)
+
+    def test_drop(self):
+        policy = RetentionPolicy(5, [(20, 10)])
+        data = make_log(location=False)
+        for i in range(40):
+            data.append({'t_set': i, 'T': i})
+
+        # up to 20 s old are dropped, the rest merged per 10 s
+        self.assertEqual(policy.compact(data, now=40), 34)
+        self.assertEqual(data.t_set.ndarray.tolist(),
+                         [25, 32.5, 36, 37, 38, 39])
+        self.assertEqual(data.T_min.ndarray[:2].tolist(), [21, 30])
+
+        # without tiers, old rows are just dropped
+        self.assertEqual(RetentionPolicy(3).compact(data, now=40), 4)
+        self.assertEqual(data.T.ndarray.tolist(), [38, 39])
+
+    def test_integers(self):
+        t = DataArray(name='t', shape=(0,), is_setpoint=True,
+                      appendable=True)
+        n = DataArray(name='n', shape=(0,), set_arrays=(t,), dtype='int32',
+                      fill_value=-1, appendable=True)
+        data = new_data(arrays=(t, n), location=False)
+        for i, value in enumerate([1, 2, 2, -1, 7]):
+            data.append({'t_set': i, 'n': value})
+
+        RetentionPolicy(1, [(None, 4)]).compact(data, now=5)
+        self.assertEqual(data.n.ndarray.dtype, np.int32)
+        # unmeasured points are skipped
+        self.assertEqual(data.n.ndarray.tolist(), [2, 7])
+        self.assertEqual(data.n_min.ndarray.tolist(), [1, 7])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            RetentionPolicy(10, [(5, 1)])
+        with self.assertRaises(ValueError):
+            RetentionPolicy(10, [(None, 1), (100, 10)])
+        with self.assertRaises(ValueError):
+            RetentionPolicy(10, [(100, 0)])
+
+        x = DataArray(name='x', preset_data=np.arange(3.), is_setpoint=True)
+        data = new_data(arrays=(x,), location=False)
+        with self.assertRaises(ValueError):
+            RetentionPolicy(10).compact(data)
+        with self.assertRaises(RuntimeError):
+            x.replace_data(np.arange(2.))
+
+
+class TestCompactor(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.io = DiskIO(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_background(self):
+        policy = RetentionPolicy(60, [(None, 3600)], period=0)
+        t = DataArray(name='t', shape=(0,), is_setpoint=True,
+                      appendable=True)
+        f = DataArray(name='f', preset_data=np.arange(3.), is_setpoint=True,
+                      appendable=True)
+        f.nest(0, set_array=t)
+        s = DataArray(name='s', shape=(0, 3), set_arrays=(t, f),
+                      appendable=True)
+        # enough digits for times in seconds since the epoch
+        formatter = GNUPlotFormat(number_format='.15g')
+        data = new_data(arrays=(t, f, s), location='log', io=self.io,
+                        formatter=formatter)
+
+        start = 3600 * np.floor(time.time() / 3600 - 2)
+        for i in range(10):
+            data.append({'t_set': start + i, 's': [i, i, -i]})
+        data.write()
+
+        # with period 0, the next append starts a compaction, and the one
+        # after it applies the result
+        data.retention = policy
+        data.append({'t_set': start + 10, 's': [10, 10, -10]})
+        data._compactor._thread.join()
+        self.assertEqual(data.s.shape, (11, 3))
+        now = round(time.time(), 3)
+        data.append({'t_set': now, 's': [1, 2, 3]})
+        self.assertEqual(data.t_set.ndarray.tolist(), [start + 5, now])
+        self.assertEqual(data.s.ndarray.tolist(), [[5, 5, -5], [1, 2, 3]])
+        self.assertEqual(data.s_min.ndarray.tolist(),
+                         [[0, 0, -10], [1, 2, 3]])
+        self.assertEqual(data.points.ndarray.tolist(), [11, 1])
+        self.assertEqual(data.f_set.compact()[1], 1)
+
+        data.finalize()
+        self.assertIsNone(data._compactor)
+
+        data2 = load_data('log', io=self.io, formatter=formatter)
+        self.assertEqual(data2.s.shape, (2, 3))
+        for array_id in ('t_set', 'f_set', 's', 's_min', 's_max', 'points'):
+            np.testing.assert_array_equal(data2.arrays[array_id].ndarray,
+                                          data.arrays[array_id].ndarray)
+
+    def test_hdf5_size(self):
+        policy = RetentionPolicy(50, [(200, 10)])
+        data = make_log(location='log', io=self.io, formatter=HDF5Format())
+        path = os.path.join(self.tmpdir, 'log', 'log.hdf5')
+
+        sizes = []
+        for i in range(3000):
+            data.append({'t_set': i, 'T': i % 7})
+            if i % 100 == 99:
+                data.write()
+                policy.compact(data, now=i + 1)
+                sizes.append(os.path.getsize(path))
+        data.finalize()
+
+        # the datasets are rewritten in place, so the file stops growing
+        # once the data does
+        self.assertEqual(data.t_set.shape, (65,))
+        self.assertEqual(max(sizes), sizes[1])
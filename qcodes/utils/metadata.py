@@ -1,11 +1,50 @@
+import threading
+import weakref
+
 from .helpers import deep_update
 
+# cacheable snapshots being built in each thread, innermost last,
+# as [component, still_cacheable] frames
+_building = threading.local()
+
+
+def _build_stack():
+    try:
+        return _building.stack
+    except AttributeError:
+        _building.stack = []
+        return _building.stack
+
 
 class Metadatable:
+    # Subclasses whose snapshot can only change when one of their attributes
+    # is assigned, ``load_metadata`` is called, or the snapshot of one of
+    # their cacheable components changes, set this True to have ``snapshot``
+    # return a cached dict until one of those things happens.
+    _snapshot_cacheable = False
+
+    # snapshot cache bookkeeping, see ``snapshot``
+    _snapshot_cache = None
+    _snapshot_version = 0
+    _snapshot_parents = None
+    _snapshot_state = frozenset(('_snapshot_cache', '_snapshot_version',
+                                 '_snapshot_parents'))
+
     def __init__(self, metadata=None):
         self.metadata = {}
         self.load_metadata(metadata or {})
 
+    def __setattr__(self, attr, value):
+        super().__setattr__(attr, value)
+        if attr not in self._snapshot_state:
+            self.invalidate_snapshot()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._snapshot_state:
+            state.pop(attr, None)
+        return state
+
     def load_metadata(self, metadata):
         """
         Load metadata
@@ -14,6 +53,35 @@ class Metadatable:
             metadata (dict): metadata to load
         """
         deep_update(self.metadata, metadata)
+        self.invalidate_snapshot()
+
+    def invalidate_snapshot(self):
+        """
+        Discard the cached snapshot of this object and of everything whose
+        snapshot contains it.
+
+        This happens automatically when an attribute is assigned, but must be
+        called explicitly after changing the state in some other way, such as
+        modifying a dict or list attribute in place.
+        """
+        stack = _build_stack()
+        if self._snapshot_cache is None and not stack:
+            return
+        pending = [self]
+        while pending:
+            obj = pending.pop()
+            if (obj._snapshot_cache is None and
+                    not any(frame[0] is obj for frame in stack)):
+                # nothing containing obj can have a cached snapshot either
+                continue
+            object.__setattr__(obj, '_snapshot_cache', None)
+            object.__setattr__(obj, '_snapshot_version',
+                               obj._snapshot_version + 1)
+            if obj._snapshot_parents:
+                for ref in obj._snapshot_parents.values():
+                    parent = ref()
+                    if parent is not None:
+                        pending.append(parent)
 
     def snapshot(self, update=False):
         """
@@ -21,18 +89,52 @@ class Metadatable:
         DO NOT override this method if you want metadata in the snapshot
         instead, override snapshot_base.
 
+        If the class is ``_snapshot_cacheable``, the result of a snapshot
+        without ``update`` is cached. Each call returns a new top-level dict,
+        but nested dicts are shared between calls, so deep copy the snapshot
+        before modifying anything inside it.
+
         Args:
             update (bool): Passed to snapshot_base
 
         Returns:
             dict: base snapshot
         """
+        stack = _build_stack()
+        if stack:
+            # we're part of a bigger snapshot being built
+            parent_frame = stack[-1]
+            if self._snapshot_cacheable:
+                # by id, as some components (eg Parameters) can't be hashed
+                parent = parent_frame[0]
+                if self._snapshot_parents is None:
+                    self._snapshot_parents = {}
+                ref = self._snapshot_parents.get(id(parent))
+                # a dead parent's id can be reused by a new object
+                if ref is None or ref() is not parent:
+                    self._snapshot_parents[id(parent)] = weakref.ref(parent)
+            else:
+                parent_frame[1] = False
+
+        if not update and self._snapshot_cache is not None:
+            return dict(self._snapshot_cache)
 
-        snap = self.snapshot_base(update=update)
+        version = self._snapshot_version
+        frame = [self, self._snapshot_cacheable and not update]
+        stack.append(frame)
+        try:
+            snap = self.snapshot_base(update=update)
+        finally:
+            stack.pop()
 
         if len(self.metadata):
             snap['metadata'] = self.metadata
 
+        # don't cache if anything changed while we were building
+        if frame[1] and self._snapshot_version == version:
+            self._snapshot_cache = snap
+            return dict(snap)
+
         return snap
 
     def snapshot_base(self, update=False):